@@ -151,6 +151,9 @@ def cli():
          get_fastq_by_id
          subset_fastq
          hifi_profiler
+         index_fasta
+         index_fastq
+         extract_chunk
 
        Please run `sequencetools <TOOL> --help` for individual usage
     '''
@@ -192,3 +195,12 @@ def cli():
     if tool == 'hifi_profiler':
         from .tools import hifi_profiler
         hifi_profiler.main()
+    if tool == 'index_fasta':
+        from .tools import index_fasta
+        index_fasta.main()
+    if tool == 'index_fastq':
+        from .tools import index_fastq
+        index_fastq.main()
+    if tool == 'extract_chunk':
+        from .tools import extract_chunk
+        extract_chunk.main()
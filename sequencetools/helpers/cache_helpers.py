@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import pickle
+import hashlib
+import tempfile
+
+CACHE_SIZE = 100  # default megabytes kept in a stats cache directory
+CACHE_SUFFIX = '.stats'
+FINGERPRINT_SIZE = 64 * 1024  # bytes hashed from each end of a file
+
+
+def get_fingerprint(read_me, size):
+    '''Returns a hex digest of the first and last FINGERPRINT_SIZE bytes
+
+       of read_me, cheap enough for files of any size
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    with open(read_me, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_SIZE))
+        if size > FINGERPRINT_SIZE:
+            f.seek(max(FINGERPRINT_SIZE, size - FINGERPRINT_SIZE))
+            digest.update(f.read(FINGERPRINT_SIZE))
+    return digest.hexdigest()
+
+
+class StatsCache(object):
+    '''Directory of tool results keyed by file identity and parameters.
+
+       The identity is the absolute path, size, mtime and a fingerprint of
+       both ends of the file.  Every entry is one pickle, hits refresh its
+       mtime and the least recently used entries are removed once the
+       directory grows past max_size megabytes
+    '''
+
+    def __init__(self, cache_dir, max_size=CACHE_SIZE):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size * 1024 * 1024
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+
+    def identity(self, tool, read_me, params):
+        '''Returns the JSON identity of tool results for read_me, params'''
+        read_me = os.path.abspath(read_me)
+        info = os.stat(read_me)
+        return json.dumps([tool, read_me, info.st_size, info.st_mtime_ns,
+                           get_fingerprint(read_me, info.st_size),
+                           params], sort_keys=True)
+
+    def _path(self, identity):
+        name = hashlib.sha256(identity.encode()).hexdigest() + CACHE_SUFFIX
+        return os.path.join(self.cache_dir, name)
+
+    def get(self, identity):
+        '''Returns the cached result for identity or None'''
+        path = self._path(identity)
+        try:
+            with open(path, 'rb') as f:
+                stored, result = pickle.load(f)
+            os.utime(path)  # most recently used
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        if stored != identity:
+            return None
+        return result
+
+    def put(self, identity, result):
+        '''Stores result for identity, then evicts down to max_size'''
+        fd, temp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((identity, result), f)
+        os.replace(temp, self._path(identity))  # readers never see a part
+        self.evict()
+
+    def evict(self):
+        '''Removes least recently used entries past max_size'''
+        entries = []
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith(CACHE_SUFFIX):
+                    try:
+                        info = entry.stat()
+                    except OSError:
+                        continue  # removed by another process
+                    entries.append((info.st_mtime, info.st_size, entry.path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def get_cached_stats(cache, tool, read_me, params, get_stats):
+    '''Returns the result of get_stats() for read_me through StatsCache
+
+       cache.  Without a cache or a file (stdin) get_stats is just called
+    '''
+    if cache is None or not read_me:
+        return get_stats()
+    identity = cache.identity(tool, read_me, params)
+    result = cache.get(identity)
+    if result is None:
+        result = get_stats()
+        cache.put(identity, result)
+    return result
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
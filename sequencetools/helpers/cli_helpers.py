@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import click
+import logging
+
+LOG_FORMAT = '%(asctime)s|%(name)s|[%(levelname)s]: %(message)s'
+
+
+def get_tool_logger(tool, log_file, log_level):
+    '''Returns the logger of tool, writing to stderr and log_file at the
+
+       log_level name, INFO if it is not a level
+    '''
+    log_level = getattr(logging, log_level.upper(), logging.INFO)
+    logging.basicConfig(format=LOG_FORMAT, datefmt='%m-%d %H:%M',
+                        level=log_level)
+    log_handler = logging.FileHandler(log_file, mode='w')
+    log_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger = logging.getLogger(tool)
+    logger.addHandler(log_handler)
+    return logger
+
+
+def get_index_command(file_type, indexer, unit, doc):
+    '''Returns the index_<file_type> click command.
+
+       indexer(path, threads) writes the index of a plain or BGZF file and
+       returns the number of records, named unit in the log
+    '''
+    tool = 'index_' + file_type
+
+    @click.command(help=doc)
+    @click.option('--' + file_type, 'read_me', required=True,
+                  help='''{} file to index, plain or BGZF compressed'''.format(
+                                                          file_type.upper()))
+    @click.option('--threads', default=1,
+                  help='''Threads for gzip/BGZF decompression (default:1)''')
+    @click.option('--log_file', default='./{}.log'.format(tool),
+                  help='''File to write log to.  (default:./{}.log)'''.format(
+                                                                       tool))
+    @click.option('--log_level', default='INFO',
+                  help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL
+(default:INFO)''')
+    def main(read_me, threads, log_file, log_level):
+        logger = get_tool_logger(tool, log_file, log_level)
+        read_me = os.path.abspath(read_me)
+        try:
+            total = indexer(read_me, threads)
+        except ValueError as e:
+            logger.error(e)
+            sys.exit(1)
+        logger.info('Indexed {} {} in {}'.format(total, unit, read_me))
+    return main
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
@@ -0,0 +1,509 @@
+#!/usr/bin/env python
+
+import io
+import sys
+import zlib
+import queue
+import struct
+import threading
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+GZIP_MAGIC = b'\x1f\x8b\x08'
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'  # gzip with FEXTRA set
+BGZF_HEADER_SIZE = 12  # gzip header up to and including XLEN
+BGZF_BATCH = 64  # blocks inflated per worker task, about 4MB of output
+READ_AHEAD_SIZE = 1024 * 1024  # compressed bytes per read-ahead chunk
+READ_AHEAD_DEPTH = 16  # decompressed chunks buffered by read-ahead thread
+READ_AHEAD_TIMEOUT = 0.1  # seconds between queue drains while closing
+BGZF_BLOCK_DATA = 0xff00  # uncompressed bytes per block, as in htslib
+BGZF_COMPRESS_LEVEL = 6  # default zlib level for written blocks
+BGZF_EOF = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC'
+            b'\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+def get_bgzf_block_size(header, extra):
+    '''Returns the total size of a BGZF block from its gzip header
+
+       and extra field or None if there is no BC subfield
+    '''
+    pos = 0
+    while pos + 4 <= len(extra):
+        slen = struct.unpack('<H', extra[pos + 2:pos + 4])[0]
+        if extra[pos:pos + 2] == b'BC' and slen == 2:
+            return struct.unpack('<H', extra[pos + 4:pos + 6])[0] + 1
+        pos += 4 + slen
+    return None
+
+
+def is_bgzf(check_me):
+    '''Checks the first block header of file check_me for BGZF'''
+    with open(check_me, 'rb') as f:
+        header = f.read(BGZF_HEADER_SIZE)
+        if not header.startswith(BGZF_MAGIC) or len(header) < 12:
+            return False
+        xlen = struct.unpack('<H', header[10:12])[0]
+        return get_bgzf_block_size(header, f.read(xlen)) is not None
+
+
+def read_bgzf_block(handle):
+    '''Reads the next complete BGZF block from binary handle
+
+       Returns b'' at the end of the file
+    '''
+    header = handle.read(BGZF_HEADER_SIZE)
+    if not header:
+        return b''
+    if len(header) < BGZF_HEADER_SIZE or not header.startswith(BGZF_MAGIC):
+        raise ValueError('Invalid BGZF block header')
+    xlen = struct.unpack('<H', header[10:12])[0]
+    extra = handle.read(xlen)
+    block_size = get_bgzf_block_size(header, extra)
+    if block_size is None:
+        raise ValueError('BGZF block missing BC subfield')
+    rest = handle.read(block_size - BGZF_HEADER_SIZE - xlen)
+    if len(rest) != block_size - BGZF_HEADER_SIZE - xlen:
+        raise ValueError('Truncated BGZF block')
+    return b''.join((header, extra, rest))
+
+
+def inflate_bgzf_block(block):
+    '''Decompresses a single BGZF block and checks its CRC and size'''
+    xlen = struct.unpack('<H', block[10:12])[0]
+    data = zlib.decompress(block[BGZF_HEADER_SIZE + xlen:-8], -15)
+    crc, size = struct.unpack('<II', block[-8:])
+    if size != len(data) or crc != zlib.crc32(data):
+        raise ValueError('BGZF block failed CRC/size check')
+    return data
+
+
+def inflate_bgzf_blocks(blocks):
+    '''Decompresses a list of BGZF blocks in order, run in worker threads.
+
+       zlib releases the GIL so batches inflate in parallel
+    '''
+    return b''.join([inflate_bgzf_block(block) for block in blocks])
+
+
+class BgzfReader(io.RawIOBase):
+    '''Raw binary reader inflating BGZF blocks in a thread pool.
+
+       Batches of blocks are submitted in file order and their results are
+       consumed in the same order, keeping threads*2 batches in flight
+    '''
+
+    def __init__(self, read_me, threads=2):
+        self._handle = open(read_me, 'rb')
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._pending = deque()  # futures in file order
+        self._max_pending = threads * 2
+        self._data = b''
+        self._pos = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _submit(self):
+        '''Keep the pool busy with batches read from the file'''
+        while not self._eof and len(self._pending) < self._max_pending:
+            blocks = []
+            while len(blocks) < BGZF_BATCH:
+                block = read_bgzf_block(self._handle)
+                if not block:
+                    self._eof = True
+                    break
+                blocks.append(block)
+            if blocks:
+                self._pending.append(self._pool.submit(inflate_bgzf_blocks,
+                                                       blocks))
+
+    def readinto(self, b):
+        while self._pos >= len(self._data):
+            self._submit()
+            if not self._pending:
+                return 0  # EOF
+            self._data = self._pending.popleft().result()
+            self._pos = 0
+        size = min(len(b), len(self._data) - self._pos)
+        b[:size] = memoryview(self._data)[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._pool.shutdown(wait=True)
+            self._handle.close()
+        super().close()
+
+
+class ThreadedReader(io.RawIOBase):
+    '''Raw binary reader filled by a background thread.
+
+       The thread puts the chunks of _chunks, which subclasses define,
+       into a queue at most depth chunks ahead of the reader, then None.
+       An exception is put in place of the rest and raised by readinto.
+       Closing stops the thread and closes the source handle
+    '''
+
+    def __init__(self, source, depth):
+        self._source = source
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._data = b''
+        self._pos = 0
+        self._eof = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _chunks(self):
+        '''Generator of the bytes chunks to read, run in the thread'''
+        raise NotImplementedError
+
+    def _run(self):
+        '''Thread target, puts chunks then None at the end'''
+        try:
+            chunks = self._chunks()
+            while not self._stop.is_set():
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                self._queue.put(chunk)
+            self._queue.put(None)
+        except Exception as e:
+            self._queue.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._data):
+            if self._eof:
+                return 0
+            data = self._queue.get()
+            if data is None:
+                self._eof = True
+                return 0
+            if isinstance(data, Exception):
+                self._eof = True
+                raise data
+            self._data = data
+            self._pos = 0
+        size = min(len(b), len(self._data) - self._pos)
+        b[:size] = memoryview(self._data)[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            while self._thread.is_alive():  # unblock a waiting put
+                try:
+                    self._queue.get(timeout=READ_AHEAD_TIMEOUT)
+                except queue.Empty:
+                    pass
+            self._source.close()
+        super().close()
+
+
+class GzipReadAhead(ThreadedReader):
+    '''Raw binary reader for plain (multi-member) gzip.
+
+       A background thread inflates the file into a bounded queue so
+       decompression overlaps with parsing in the main thread
+    '''
+
+    def __init__(self, read_me):
+        super().__init__(open(read_me, 'rb'), READ_AHEAD_DEPTH)
+
+    def _chunks(self):
+        '''Generator of decompressed chunks of every gzip member'''
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while True:
+            chunk = self._source.read(READ_AHEAD_SIZE)
+            if not chunk:
+                break
+            if decompressor.eof:  # last chunk ended on a member end
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            output = [decompressor.decompress(chunk)]
+            while decompressor.eof and decompressor.unused_data:
+                unused = decompressor.unused_data
+                if not unused.strip(b'\x00'):  # ignore zero padding
+                    break
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                output.append(decompressor.decompress(unused))
+            data = b''.join(output)
+            if data:
+                yield data
+        if not decompressor.eof:
+            raise EOFError('Compressed file ended before the '
+                           'end-of-stream marker was reached')
+
+
+class GzipReadAhead(io.RawIOBase):
+    '''Raw binary reader for plain (multi-member) gzip.
+
+       A background thread inflates the file into a bounded queue so
+       decompression overlaps with parsing in the main thread
+    '''
+
+    def __init__(self, read_me):
+        self._handle = open(read_me, 'rb')
+        self._queue = queue.Queue(maxsize=READ_AHEAD_DEPTH)
+        self._stop = threading.Event()
+        self._data = b''
+        self._pos = 0
+        self._eof = False
+        self._thread = threading.Thread(target=self._inflate, daemon=True)
+        self._thread.start()
+
+    def _inflate(self):
+        '''Thread target, puts decompressed chunks then None at the end'''
+        try:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            while not self._stop.is_set():
+                chunk = self._handle.read(READ_AHEAD_SIZE)
+                if not chunk:
+                    break
+                if decompressor.eof:  # last chunk ended on a member end
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                output = [decompressor.decompress(chunk)]
+                while decompressor.eof and decompressor.unused_data:
+                    unused = decompressor.unused_data
+                    if not unused.strip(b'\x00'):  # ignore zero padding
+                        break
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    output.append(decompressor.decompress(unused))
+                data = b''.join(output)
+                if data:
+                    self._queue.put(data)
+            if not decompressor.eof and not self._stop.is_set():
+                raise EOFError('Compressed file ended before the '
+                               'end-of-stream marker was reached')
+            self._queue.put(None)
+        except Exception as e:
+            self._queue.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._data):
+            if self._eof:
+                return 0
+            data = self._queue.get()
+            if data is None:
+                self._eof = True
+                return 0
+            if isinstance(data, Exception):
+                self._eof = True
+                raise data
+            self._data = data
+            self._pos = 0
+        size = min(len(b), len(self._data) - self._pos)
+        b[:size] = memoryview(self._data)[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            while self._thread.is_alive():  # unblock a waiting put
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self._handle.close()
+        super().close()
+
+
+def deflate_bgzf_block(data, level=BGZF_COMPRESS_LEVEL):
+    '''Compresses at most BGZF_BLOCK_DATA bytes of data into one BGZF block'''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = struct.pack('<4sIBBH2sHH', BGZF_MAGIC, 0, 0, 0xff, 6, b'BC', 2,
+                         BGZF_HEADER_SIZE + 6 + len(cdata) + 8 - 1)
+    return b''.join((header, cdata,
+                     struct.pack('<II', zlib.crc32(data), len(data))))
+
+
+def deflate_bgzf_blocks(blocks, level=BGZF_COMPRESS_LEVEL):
+    '''Compresses a list of block sized data chunks, run in worker threads'''
+    return b''.join([deflate_bgzf_block(data, level) for data in blocks])
+
+
+class BgzfWriter(io.RawIOBase):
+    '''Raw binary writer producing BGZF, indexable by samtools/tabix.
+
+       Data is cut into BGZF_BLOCK_DATA byte blocks that are compressed in
+       batches by a thread pool and written in submission order.  write_me
+       is a path or an open binary handle, which is closed with the writer
+    '''
+
+    def __init__(self, write_me, threads=1, level=BGZF_COMPRESS_LEVEL):
+        if isinstance(write_me, str):
+            write_me = open(write_me, 'wb')
+        self._handle = write_me
+        self._level = level
+        self._pool = None
+        if threads > 1:
+            self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._pending = deque()  # futures in submission order
+        self._max_pending = threads * 2
+        self._buffer = bytearray()
+        self._blocks = []  # full blocks waiting for a batch
+
+    def writable(self):
+        return True
+
+    def _submit(self, force=False):
+        '''Hand a batch of blocks to the pool, or compress it inline'''
+        if not self._blocks or (len(self._blocks) < BGZF_BATCH and
+                                not force):
+            return
+        blocks = self._blocks
+        self._blocks = []
+        if self._pool is None:
+            self._handle.write(deflate_bgzf_blocks(blocks, self._level))
+            return
+        self._pending.append(self._pool.submit(deflate_bgzf_blocks, blocks,
+                                               self._level))
+        while len(self._pending) > self._max_pending:
+            self._handle.write(self._pending.popleft().result())
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError('write to closed file')
+        size = len(b)
+        self._buffer += b
+        if len(self._buffer) >= BGZF_BLOCK_DATA:
+            view = memoryview(self._buffer)
+            pos = 0
+            while len(self._buffer) - pos >= BGZF_BLOCK_DATA:
+                self._blocks.append(bytes(view[pos:pos + BGZF_BLOCK_DATA]))
+                pos += BGZF_BLOCK_DATA
+                self._submit()
+            view.release()
+            del self._buffer[:pos]
+        return size
+
+    def flush(self):
+        '''Writes finished batches, the partial block stays buffered'''
+        if not self.closed and not self._handle.closed:
+            while self._pending:
+                self._handle.write(self._pending.popleft().result())
+            self._handle.flush()
+
+    def close(self):
+        if not self.closed:
+            try:
+                if self._buffer:
+                    self._blocks.append(bytes(self._buffer))
+                    self._buffer = bytearray()
+                self._submit(force=True)
+                self.flush()
+                self._handle.write(BGZF_EOF)
+                self._handle.flush()
+            finally:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=True)
+                self._handle.close()
+        super().close()
+
+
+def get_bgzf_block_offsets(read_me):
+    '''Generator of (compressed, uncompressed) start offsets for every
+
+       non-empty BGZF block of read_me, read from the headers and ISIZE
+       fields without inflating anything
+    '''
+    coffset = 0
+    uoffset = 0
+    with open(read_me, 'rb') as f:
+        while True:
+            block = read_bgzf_block(f)
+            if not block:
+                return
+            size = struct.unpack('<I', block[-4:])[0]
+            if size:  # skip empty blocks such as the EOF marker
+                yield coffset, uoffset
+            coffset += len(block)
+            uoffset += size
+
+
+def write_gzi(write_me, offsets):
+    '''Writes the (compressed, uncompressed) block offsets as a .gzi file
+
+       in the bgzip layout, the first block at 0, 0 is implied
+    '''
+    pairs = [pair for pair in offsets if pair != (0, 0)]
+    with open(write_me, 'wb') as gopen:
+        gopen.write(struct.pack('<Q', len(pairs)))
+        for coffset, uoffset in pairs:
+            gopen.write(struct.pack('<QQ', coffset, uoffset))
+
+
+def read_gzi(read_me):
+    '''Returns (compressed offsets, uncompressed offsets) lists from .gzi'''
+    with open(read_me, 'rb') as gopen:
+        data = gopen.read()
+    count = struct.unpack('<Q', data[:8])[0]
+    coffsets = [0]
+    uoffsets = [0]
+    for i in range(count):
+        coffset, uoffset = struct.unpack('<QQ', data[8 + i * 16:24 + i * 16])
+        coffsets.append(coffset)
+        uoffsets.append(uoffset)
+    return coffsets, uoffsets
+
+
+def read_bgzf_range(handle, gzi, start, size, cache=None):
+    '''Returns size uncompressed bytes from start of the BGZF in binary
+
+       handle, seeking to the block holding start using gzi offsets.  The
+       dict cache, if given, keeps the last block inflated so many small
+       reads in one block inflate it once
+    '''
+    coffsets, uoffsets = gzi
+    i = bisect_right(uoffsets, start) - 1
+    skip = start - uoffsets[i]
+    ustart = uoffsets[i]  # uncompressed start of the next block
+    data = []
+    have = 0
+    if cache and cache['start'] == ustart:
+        data.append(cache['data'])
+        have = len(cache['data'])
+        ustart += have
+        i += 1
+    if have < skip + size and i < len(coffsets):
+        handle.seek(coffsets[i])
+        while have < skip + size:
+            block = read_bgzf_block(handle)
+            if not block:
+                break
+            data.append(inflate_bgzf_block(block))
+            have += len(data[-1])
+            if cache is not None and data[-1]:
+                cache['start'] = ustart
+                cache['data'] = data[-1]
+            ustart += len(data[-1])
+    return b''.join(data)[skip:skip + size]
+
+
+def open_gzip(open_me, threads):
+    '''Returns a raw binary reader for gzip file open_me.
+
+       BGZF is inflated block-parallel with threads workers, plain gzip by
+       a read-ahead thread
+    '''
+    if is_bgzf(open_me):
+        return BgzfReader(open_me, threads)
+    return GzipReadAhead(open_me)
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
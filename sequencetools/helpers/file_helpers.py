@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 
+import io
 import os
 import sys
 import gzip
 import errno
 import re
 import select
+from .compression_helpers import open_gzip, BgzfWriter, BGZF_COMPRESS_LEVEL
+from .target_helpers import TargetSet
+from .output_helpers import BackgroundWriter
 
 
 def check_stdin(handle):
@@ -41,18 +45,32 @@ def check_file_type(check_me):
     return suffix
 
 
-def return_output_handle(write_me, gzipped):
-    '''Returns an open file handle to write.  
-    
-       If gzipped=True returns gzip handle
+def return_output_handle(write_me, gzipped, threads=1,
+                         level=BGZF_COMPRESS_LEVEL):
+    '''Returns an open binary file handle to write, stdout if not write_me
+
+       Writes are buffered and done by a background thread.  If
+       gzipped=True output is BGZF compressed with threads
     '''
+    if not write_me:  # closing this handle leaves stdout open
+        handle = open(sys.stdout.fileno(), 'wb', closefd=False)
+    else:
+        handle = open(write_me, 'wb')
     if gzipped:
-        return gzip.open(write_me, 'wb')  # return comrpessed handle
-    return open(write_me, 'w')
+        handle = BgzfWriter(handle, threads, level)  # comrpessed handle
+    return BackgroundWriter(handle)
+
+
+def is_gzip_name(check_me):
+    '''Checks for a .gz or .bgz suffix on output file name check_me'''
+    return bool(check_me) and check_me.lower().endswith(('.gz', '.bgz'))
+
 
+def return_filehandle(open_me, threads=1):
+    '''get me a filehandle, common compression or text
 
-def return_filehandle(open_me):
-    '''get me a filehandle, common compression or text'''
+       if threads > 1 gzip input is decompressed in background threads
+    '''
     magic_dict = {
                   b'\x1f\x8b\x08': 'gz'  # only one supported right now
 #                  '\x42\x5a\x68': 'bz2',
@@ -65,6 +83,9 @@ def return_filehandle(open_me):
         if s.startswith(m):
             t = magic_dict[m]  # get type
             if t == 'gz':
+                if threads > 1:  # threaded BGZF or read-ahead gzip
+                    return io.TextIOWrapper(io.BufferedReader(
+                                                open_gzip(open_me, threads)))
                 return gzip.open(open_me, 'rt')  # return handle
 #            elif t == 'bz2':
 #                return bz2.open(open_me)
@@ -73,17 +94,33 @@ def return_filehandle(open_me):
     return open(open_me)  # return normal handle if not compressed
 
 
-def load_targets_file(targets_file):
-    '''Load targets_file into targets dict and return dict'''
+def get_target_ids(targets_file):
+    '''Generator of bytes ids from targets_file, one per line'''
     fh = return_filehandle(targets_file)
-    targets = {}  # targets dict to return
     with fh as topen:
         for line in topen:
             line = line.rstrip()
             if not line or line.startswith('#'):  # skip blank and comments
                 continue
-            targets[line] = 1  # store targets could maybe use a set here
-    return targets
+            yield line.encode()  # bytes to match the ids of parsed records
+
+
+def get_file_names(list_file):
+    '''Generator of absolute file names from list_file, one per line'''
+    with open(list_file) as lopen:
+        for line in lopen:
+            line = line.strip()
+            if not line or line.startswith('#'):  # skip blank and comments
+                continue
+            yield os.path.abspath(line)
+
+
+def load_targets_file(targets_file, bloom=False, exact=False):
+    '''Load targets_file into a compact TargetSet of id hashes and return it
+
+       bloom adds a Bloom filter in front, exact keeps the ids to verify
+    '''
+    return TargetSet(get_target_ids(targets_file), bloom, exact)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import numpy as np
+from collections import OrderedDict
+from .compression_helpers import (is_bgzf, get_bgzf_block_offsets, write_gzi,
+                                  read_gzi, read_bgzf_range, read_bgzf_block,
+                                  inflate_bgzf_block, GZIP_MAGIC)
+from .file_helpers import return_filehandle
+from .sequence_helpers import (binary_handle, parse_fasta_record, FastxRecord,
+                               WHITESPACE)
+from .target_helpers import hash_id
+
+FQI_SUFFIX = '.fqi'  # FASTQ offset index, numpy npz archive
+FQI_READ_SIZE = 64 * 1024  # bytes read per step at an uncompressed offset
+
+
+class FaiEntry(object):
+    '''One line of a samtools .fai index.
+
+       offset is the (uncompressed) byte offset of the first base,
+       linebases the bases per line and linewidth the bytes per line
+    '''
+    __slots__ = ('name', 'length', 'offset', 'linebases', 'linewidth')
+
+    def __init__(self, name, length, offset, linebases, linewidth):
+        self.name = name
+        self.length = length
+        self.offset = offset
+        self.linebases = linebases
+        self.linewidth = linewidth
+
+    def sequence_end(self):
+        '''Returns the offset just past the last base of the sequence'''
+        if not self.linebases:
+            return self.offset
+        lines, rest = divmod(self.length, self.linebases)
+        return self.offset + lines * self.linewidth + rest
+
+    def format(self):
+        return '{}\t{}\t{}\t{}\t{}\n'.format(self.name.decode(), self.length,
+                                              self.offset, self.linebases,
+                                              self.linewidth)
+
+
+def is_gzipped(check_me):
+    '''Checks the magic number of file check_me for gzip'''
+    with open(check_me, 'rb') as f:
+        return f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def build_fai(fasta, threads=1):
+    '''Scans fasta and returns a list of FaiEntry in file order.
+
+       Raises ValueError for lines of differing length within a sequence.
+       As samtools faidx does, empty sequences are left out and duplicate
+       names skipped
+    '''
+    entries = []
+    names = set()
+    entry = None
+    offset = 0
+    short_line = False  # a line shorter than linebases was seen
+    with return_filehandle(fasta, threads) as fopen:
+        for line in binary_handle(fopen):
+            if line.startswith(b'>'):
+                if entry is not None and entry.length:
+                    add_fai_entry(entries, names, entry)
+                title = line[1:].rstrip()
+                name = title.split(None, 1)[0] if title else b''
+                entry = FaiEntry(name, 0, offset + len(line), 0, 0)
+                short_line = False
+            elif entry is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if bases:
+                    if short_line or (entry.linebases and
+                                      bases > entry.linebases):
+                        raise ValueError('Different line length in sequence '
+                                         '"{}"'.format(entry.name.decode()))
+                    if not entry.linebases:
+                        entry.linebases = bases
+                        entry.linewidth = len(line)
+                    elif bases < entry.linebases:
+                        short_line = True
+                    entry.length += bases
+                else:
+                    short_line = True  # blank lines end the sequence
+            offset += len(line)
+    if entry is not None and entry.length:
+        add_fai_entry(entries, names, entry)
+    return entries
+
+
+def add_fai_entry(entries, names, entry):
+    '''Appends entry to entries unless its name is already in set names'''
+    if entry.name not in names:
+        names.add(entry.name)
+        entries.append(entry)
+
+
+def write_fai(write_me, entries):
+    '''Writes the FaiEntry list entries to write_me'''
+    with open(write_me, 'w') as fopen:
+        for entry in entries:
+            fopen.write(entry.format())
+
+
+def read_fai(read_me):
+    '''Returns an OrderedDict of FaiEntry keyed by bytes name from .fai'''
+    entries = OrderedDict()
+    with open(read_me, 'rb') as fopen:
+        for line in fopen:
+            fields = line.rstrip(b'\r\n').split(b'\t')
+            if len(fields) < 5:
+                continue
+            name = fields[0]
+            if name not in entries:  # first wins, as with samtools
+                entries[name] = FaiEntry(name, *[int(f) for f in fields[1:5]])
+    return entries
+
+
+def index_fasta(fasta, threads=1):
+    '''Writes fasta.fai, and fasta.gzi for BGZF input.
+
+       Returns the number of sequences indexed
+    '''
+    if is_gzipped(fasta) and not is_bgzf(fasta):
+        raise ValueError('Cannot index plain gzip, compress {} with '
+                         'bgzip'.format(fasta))
+    entries = build_fai(fasta, threads)
+    write_fai(fasta + '.fai', entries)
+    if is_gzipped(fasta):
+        write_gzi(fasta + '.gzi', get_bgzf_block_offsets(fasta))
+    return len(entries)
+
+
+def has_fasta_index(fasta):
+    '''Checks for a .fai (and .gzi for BGZF) at least as new as fasta'''
+    index_files = [fasta + '.fai']
+    if is_gzipped(fasta):
+        if not is_bgzf(fasta):
+            return False
+        index_files.append(fasta + '.gzi')
+    mtime = os.path.getmtime(fasta)
+    for index_file in index_files:
+        if (not os.path.exists(index_file) or
+                os.path.getmtime(index_file) < mtime):
+            return False
+    return True
+
+
+def get_header_starts(raw):
+    '''Returns the offsets of the header lines in the FASTA bytes raw'''
+    starts = [0] if raw.startswith(b'>') else []
+    at = raw.find(b'\n>')
+    while at >= 0:
+        starts.append(at + 1)
+        at = raw.find(b'\n>', at + 1)
+    return starts
+
+
+def read_fasta_range(fopen, gzi, start, end, cache=None):
+    '''Returns the uncompressed bytes from start to end, or EOF if end is
+
+       None, of the binary handle fopen, BGZF if there are gzi offsets
+    '''
+    if gzi is None:
+        fopen.seek(start)
+        return fopen.read(-1 if end is None else end - start)
+    size = sys.maxsize if end is None else end - start
+    return read_bgzf_range(fopen, gzi, start, size, cache)
+
+
+def get_wanted_fasta_record(raw, bounds, targets):
+    '''Yields FastxRecords for the TargetSet targets among the records
+
+       of the bytes raw running from each offset in bounds to the next
+    '''
+    records = [parse_fasta_record(raw[start:end])
+               for start, end in zip(bounds, bounds[1:])]
+    if records:
+        found = targets.contains_many([record.id for record in records])
+        for record, wanted in zip(records, found):
+            if wanted:
+                yield record
+
+
+def get_indexed_fasta_record(fasta, targets):
+    '''Yields FastxRecords for the TargetSet targets from indexed fasta.
+
+       Records come in file order, each is read by seeking to the end of
+       the sequence before it so the header line is parsed too.  The .fai
+       leaves out empty sequences and repeated names, which can only sit
+       between one indexed sequence and the next header.  Such a gap is
+       read when it is longer than a bare header line, and the records
+       in it are checked against targets too, so output is the same as
+       streaming fasta
+    '''
+    entries = sorted(read_fai(fasta + '.fai').values(),
+                     key=lambda e: e.offset)
+    found = targets.contains_many([entry.name for entry in entries])
+    gzi = None
+    cache = {}  # last BGZF block, headers are read a few bytes at a time
+    if is_gzipped(fasta):
+        gzi = read_gzi(fasta + '.gzi')
+    with open(fasta, 'rb') as fopen:
+        start = 0  # end of the previous sequence
+        eol = 0  # line break bytes after the previous sequence
+        for entry, wanted in zip(entries, found):
+            end = entry.sequence_end()
+            header = eol + len(entry.name) + 1 + (entry.linewidth -
+                                                  entry.linebases)
+            if wanted or entry.offset - start > header:
+                raw = read_fasta_range(fopen, gzi, start,
+                                       end if wanted else entry.offset, cache)
+                bounds = get_header_starts(raw)
+                yield from get_wanted_fasta_record(raw, bounds, targets)
+                if wanted and bounds:
+                    yield parse_fasta_record(raw[bounds[-1]:])
+            start = end
+            eol = entry.linewidth - entry.linebases
+        raw = read_fasta_range(fopen, gzi, start, None, cache)  # the rest
+        bounds = get_header_starts(raw) + [len(raw)]
+        yield from get_wanted_fasta_record(raw, bounds, targets)
+
+
+def get_fastq_offsets(fastq, threads=1):
+    '''Generator of (id, uncompressed byte offset) for each record of fastq
+
+       Expects four line records like get_fastq_record
+    '''
+    offset = 0
+    with return_filehandle(fastq, threads) as fopen:
+        handle = binary_handle(fopen)
+        while True:
+            line = handle.readline()
+            if not line:
+                return
+            if not line.strip():  # blank lines between records
+                offset += len(line)
+                continue
+            if not line.startswith(b'@'):
+                raise ValueError('Malformed or multi-line FASTQ record '
+                                 'at "{}"'.format(line.rstrip().decode(
+                                                            errors='replace')))
+            title = line[1:].rstrip()
+            yield title.split(None, 1)[0] if title else b'', offset
+            offset += len(line)
+            for _ in range(3):
+                offset += len(handle.readline())
+
+
+def get_fasta_offsets(fasta, threads=1):
+    '''Generator of (id, start, end, bases) for each record of fasta, start
+
+       and end the uncompressed byte offsets of the header and the next
+       record.  Unlike build_fai any line layout is accepted
+    '''
+    offset = 0
+    seq_id = None
+    with return_filehandle(fasta, threads) as fopen:
+        for line in binary_handle(fopen):
+            if line.startswith(b'>'):
+                if seq_id is not None:
+                    yield seq_id, start, offset, bases
+                title = line[1:].rstrip()
+                seq_id = title.split(None, 1)[0] if title else b''
+                start = offset
+                bases = 0
+            elif seq_id is not None:
+                bases += len(line.translate(None, WHITESPACE))
+            offset += len(line)
+    if seq_id is not None:
+        yield seq_id, start, offset, bases
+
+
+def to_virtual_offsets(fastq, offsets):
+    '''Converts uncompressed offsets of BGZF fastq to virtual offsets,
+
+       the block start shifted left 16 bits plus the offset in the block
+    '''
+    blocks = np.array(list(get_bgzf_block_offsets(fastq)), dtype=np.uint64)
+    if not len(blocks):
+        return offsets
+    block = np.searchsorted(blocks[:, 1], offsets, side='right') - 1
+    return ((blocks[block, 0] << np.uint64(16)) |
+            (offsets - blocks[block, 1]))
+
+
+class FastqIndex(object):
+    '''Byte offsets of every record of a FASTQ keyed by id hash.
+
+       hashes is a sorted uint64 array of hash_id values and offsets the
+       matching record offsets, BGZF virtual offsets if bgzf is set
+    '''
+
+    def __init__(self, hashes, offsets, bgzf=False):
+        self.hashes = hashes
+        self.offsets = offsets
+        self.bgzf = bgzf
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, fastq, threads=1):
+        '''Scans fastq and returns its FastqIndex'''
+        bgzf = is_gzipped(fastq)
+        if bgzf and not is_bgzf(fastq):
+            raise ValueError('Cannot index plain gzip, compress {} with '
+                             'bgzip'.format(fastq))
+        hashes = []
+        offsets = []
+        for seq_id, offset in get_fastq_offsets(fastq, threads):
+            hashes.append(hash_id(seq_id))
+            offsets.append(offset)
+        hashes = np.array(hashes, dtype=np.uint64)
+        offsets = np.array(offsets, dtype=np.uint64)
+        if bgzf:
+            offsets = to_virtual_offsets(fastq, offsets)
+        order = np.argsort(hashes, kind='stable')  # keeps file order of dups
+        return cls(hashes[order], offsets[order], bgzf)
+
+    @classmethod
+    def load(cls, read_me):
+        '''Returns the FastqIndex saved in read_me'''
+        with np.load(read_me) as data:
+            return cls(data['hashes'], data['offsets'], bool(data['bgzf']))
+
+    def save(self, write_me):
+        '''Writes the index to write_me as an npz archive'''
+        with open(write_me, 'wb') as wopen:
+            np.savez(wopen, hashes=self.hashes, offsets=self.offsets,
+                     bgzf=np.array(self.bgzf))
+
+    def lookup(self, hashes):
+        '''Returns the sorted offsets of records whose id hash is in hashes'''
+        hashes = np.unique(np.asarray(hashes, dtype=np.uint64))
+        left = np.searchsorted(self.hashes, hashes, side='left')
+        right = np.searchsorted(self.hashes, hashes, side='right')
+        found = right > left
+        if not found.any():
+            return np.array([], dtype=np.uint64)
+        offsets = [self.offsets[l:r] for l, r in zip(left[found],
+                                                       right[found])]
+        return np.sort(np.concatenate(offsets))
+
+    def file_order(self):
+        '''Returns all record offsets in file order'''
+        return np.sort(self.offsets)
+
+
+class FastqOffsetReader(object):
+    '''Reads single FASTQ records at offsets from an indexed fastq.
+
+       BGZF offsets are virtual, the last inflated block is kept so
+       records read in file order rarely inflate a block twice
+    '''
+
+    def __init__(self, fastq, bgzf=False):
+        self._handle = open(fastq, 'rb')
+        self._bgzf = bgzf
+        self._block_start = None  # compressed offset of cached block
+        self._block_data = b''
+        self._block_next = 0  # compressed offset of the following block
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._handle.close()
+
+    def _read_block(self, coffset):
+        '''Returns the inflated BGZF block at coffset, cached'''
+        if coffset != self._block_start:
+            self._handle.seek(coffset)
+            block = read_bgzf_block(self._handle)
+            self._block_start = coffset
+            self._block_data = inflate_bgzf_block(block) if block else b''
+            self._block_next = coffset + len(block)
+        return self._block_data
+
+    def _chunks(self, offset):
+        '''Generator of uncompressed data starting at offset'''
+        offset = int(offset)
+        if not self._bgzf:
+            self._handle.seek(offset)
+            chunk = self._handle.read(FQI_READ_SIZE)
+            while chunk:
+                yield chunk
+                chunk = self._handle.read(FQI_READ_SIZE)
+            return
+        coffset = offset >> 16
+        skip = offset & 0xffff
+        while True:
+            data = self._read_block(coffset)
+            if self._block_next == coffset:  # end of file
+                return
+            if len(data) > skip:
+                yield data[skip:]
+            skip = 0
+            coffset = self._block_next
+
+    def read(self, offset):
+        '''Returns the FastxRecord starting at offset'''
+        data = b''
+        for chunk in self._chunks(offset):
+            data += chunk
+            if data.count(b'\n') >= 4:
+                break
+        lines = data.split(b'\n', 4)
+        if len(lines) < 4 or not lines[0].startswith(b'@'):
+            raise ValueError('No FASTQ record at offset {}, rebuild the '
+                             'index'.format(offset))
+        title = lines[0][1:].rstrip()
+        seq_id = title.split(None, 1)[0] if title else b''
+        return FastxRecord(seq_id, title, lines[1].rstrip(b'\r'),
+                           lines[3].rstrip(b'\r'))
+
+
+def index_fastq(fastq, threads=1):
+    '''Writes the offset index fastq.fqi, returns the number of records'''
+    index = FastqIndex.build(fastq, threads)
+    index.save(fastq + FQI_SUFFIX)
+    return len(index)
+
+
+def has_fastq_index(fastq):
+    '''Checks for a .fqi index at least as new as fastq'''
+    index_file = fastq + FQI_SUFFIX
+    return (os.path.exists(index_file) and
+            os.path.getmtime(index_file) >= os.path.getmtime(fastq))
+
+
+def get_indexed_fastq_record(fastq, targets):
+    '''Yields FastxRecords in file order for the TargetSet targets using
+
+       the .fqi index.  Records are looked up by id hash, so targets must
+       be exact for records that only share a hash to be dropped
+    '''
+    index = FastqIndex.load(fastq + FQI_SUFFIX)
+    offsets = index.lookup(targets.hashes)
+    with FastqOffsetReader(fastq, index.bgzf) as reader:
+        for offset in offsets:
+            record = reader.read(offset)
+            if record.id in targets:
+                yield record
+
+
+def get_indexed_fastq_subset(fastq, subset):
+    '''Yields every subset-th FastxRecord of fastq using the .fqi index'''
+    index = FastqIndex.load(fastq + FQI_SUFFIX)
+    with FastqOffsetReader(fastq, index.bgzf) as reader:
+        for offset in index.file_order()[subset - 1::subset]:
+            yield reader.read(offset)
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
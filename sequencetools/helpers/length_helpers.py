@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+import sys
+import math
+import heapq
+import numpy as np
+from array import array
+
+LENGTH_BUFFER = 1024 * 1024  # lengths buffered before folding into counts
+
+
+class LengthCounter(object):
+    '''Bounded memory multiset of lengths.
+
+       Lengths are appended to a typed array that is folded into sorted
+       unique values and their counts whenever it fills, so memory grows
+       with the number of distinct lengths rather than with the records.
+       Counters from parts of a file add up with merge
+    '''
+
+    def __init__(self):
+        self.values = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._buffer = array('q')
+
+    def add(self, length):
+        '''Adds the single length'''
+        self._buffer.append(length)
+        if len(self._buffer) >= LENGTH_BUFFER:
+            self.compact()
+
+    def extend(self, lengths):
+        '''Adds every length in the numpy array lengths'''
+        self._buffer.frombytes(np.asarray(lengths, dtype=np.int64).tobytes())
+        if len(self._buffer) >= LENGTH_BUFFER:
+            self.compact()
+
+    def _fold(self, values, counts):
+        '''Adds the sorted unique values with counts to the counter'''
+        values = np.concatenate((self.values, values))
+        counts = np.concatenate((self.counts, counts))
+        self.values, inverse = np.unique(values, return_inverse=True)
+        self.counts = np.zeros(len(self.values), dtype=np.int64)
+        np.add.at(self.counts, inverse, counts)
+
+    def compact(self):
+        '''Folds the buffered lengths into values and counts'''
+        if not len(self._buffer):
+            return
+        values, counts = np.unique(np.frombuffer(self._buffer, dtype=np.int64),
+                                   return_counts=True)
+        self._buffer = array('q')
+        self._fold(values, counts)
+
+    def merge(self, other):
+        '''Adds all lengths of the LengthCounter other'''
+        other.compact()
+        self.compact()
+        self._fold(other.values, other.counts)
+
+    def __len__(self):
+        self.compact()
+        return int(self.counts.sum())
+
+    def total(self):
+        '''Returns the sum of all lengths'''
+        self.compact()
+        return int((self.values * self.counts).sum())
+
+    def min(self):
+        self.compact()
+        return int(self.values[0]) if len(self.values) else 0
+
+    def max(self):
+        self.compact()
+        return int(self.values[-1]) if len(self.values) else 0
+
+    def mean(self):
+        '''Returns the rounded mean length, 0 if empty'''
+        number = len(self)
+        if number:
+            return round(self.total() / number)
+        return 0
+
+    def nx(self, percents):
+        '''Returns {x: (Nx, Lx)} for every x in the list percents.
+
+           Nx is the length at which the running sum of the lengths, from
+           longest to shortest, reaches x percent of the total and Lx the
+           number of lengths summed by then.  One cumulative sum is shared
+           by all x
+        '''
+        self.compact()
+        result = {}
+        if not len(self.values):
+            return {x: (0, 0) for x in percents}
+        values = self.values[::-1]
+        counts = self.counts[::-1]
+        sums = np.cumsum(values * counts)
+        numbers = np.cumsum(counts)
+        total = int(sums[-1])
+        for x in percents:
+            need = math.ceil(float(total) * (x / 100.0))
+            i = min(int(np.searchsorted(sums, need)), len(values) - 1)
+            before = int(sums[i - 1]) if i else 0
+            number = int(numbers[i - 1]) if i else 0
+            number += max(1, math.ceil((need - before) / int(values[i])))
+            result[x] = (int(values[i]), number)
+        return result
+
+    def total_above(self, minimum):
+        '''Returns the sum of the lengths of at least minimum'''
+        self.compact()
+        keep = self.values >= minimum
+        return int((self.values[keep] * self.counts[keep]).sum())
+
+    def bins(self, bin_size):
+        '''Returns (bins, counts) arrays of the non-empty length bins,
+
+           bin i holding lengths i * bin_size up to (i + 1) * bin_size
+        '''
+        self.compact()
+        bins, inverse = np.unique(self.values // bin_size, return_inverse=True)
+        counts = np.zeros(len(bins), dtype=np.int64)
+        np.add.at(counts, inverse, self.counts)
+        return bins, counts
+
+    def aun(self):
+        '''Returns the rounded area under the Nx curve, sum(l * l) / total'''
+        total = self.total()
+        if not total:
+            return 0
+        squares = (self.values.astype(np.float64) ** 2 * self.counts).sum()
+        return round(squares / total)
+
+
+class Histogram2D(object):
+    '''Bounded memory counts of (row, column) pairs of integers.
+
+       Pairs are buffered like LengthCounter lengths and counted with one
+       bincount per fill.  The count array grows to fit the pairs seen, up
+       to max_rows x max_columns, larger rows or columns count in the last
+    '''
+
+    def __init__(self, max_rows, max_columns):
+        self.max_rows = max_rows
+        self.max_columns = max_columns
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+        self._buffer = array('q')  # row, column, row, column ...
+
+    def add(self, row, column):
+        '''Adds one (row, column) pair'''
+        self._buffer.append(row)
+        self._buffer.append(column)
+        if len(self._buffer) >= LENGTH_BUFFER:
+            self.compact()
+
+    def extend(self, rows, columns):
+        '''Adds the pairs of the equal length integer arrays rows, columns'''
+        self.compact()
+        if len(rows):
+            self._fold(np.asarray(rows, dtype=np.int64),
+                       np.asarray(columns, dtype=np.int64))
+
+    def compact(self):
+        '''Folds the buffered pairs into counts'''
+        if not len(self._buffer):
+            return
+        pairs = np.frombuffer(self._buffer, dtype=np.int64).reshape(-1, 2)
+        self._buffer = array('q')
+        self._fold(pairs[:, 0], pairs[:, 1])
+
+    def _fold(self, rows, columns):
+        '''Counts the pairs of arrays rows, columns'''
+        rows = np.minimum(rows, self.max_rows - 1)
+        columns = np.minimum(columns, self.max_columns - 1)
+        shape = (max(self.counts.shape[0], int(rows.max()) + 1),
+                 max(self.counts.shape[1], int(columns.max()) + 1))
+        if shape != self.counts.shape:
+            counts = np.zeros(shape, dtype=np.int64)
+            counts[:self.counts.shape[0], :self.counts.shape[1]] = self.counts
+            self.counts = counts
+        self.counts += np.bincount(rows * shape[1] + columns,
+                                   minlength=shape[0] * shape[1]
+                                   ).reshape(shape)
+
+    def get_counts(self):
+        '''Returns the (rows, columns) array of counts'''
+        self.compact()
+        return self.counts
+
+
+def get_balanced_bins(lengths, bins):
+    '''Returns the bin, 0 to bins - 1, of every length in the list lengths
+
+       packed longest first into the bin with the smallest total so far
+       (LPT), ties going to the lower bin.  The largest total is within
+       the longest length of the best possible
+    '''
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    totals = [(0, i) for i in range(bins)]  # heap of (total, bin)
+    assigned = [0] * len(lengths)
+    for i in order:
+        total, b = heapq.heappop(totals)
+        assigned[i] = b
+        heapq.heappush(totals, (total + lengths[i], b))
+    return assigned
+
+
+def get_ordered_bins(lengths, bins):
+    '''Returns the bin of every length in the list lengths, cut in input
+
+       order into bins runs of near equal total
+    '''
+    total = max(sum(lengths), 1)
+    assigned = []
+    before = 0  # total of the lengths before this one
+    for length in lengths:
+        assigned.append(min(before * bins // total, bins - 1))
+        before += length
+    return assigned
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
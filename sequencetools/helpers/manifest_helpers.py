@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+import os
+import sys
+from .file_helpers import return_filehandle
+from .index_helpers import has_fasta_index, read_fai, get_fasta_offsets
+from .range_helpers import RangeSource, RANGE_READ_SIZE
+from .sequence_helpers import binary_handle, get_raw_fastq_blocks
+
+MANIFEST_COLUMNS = '#chunk\tstart\tend\trecords\n'
+
+
+def get_fastq_ranges(fastq, chunks, threads=1):
+    '''Returns [(chunk, start, end, records)] cutting fastq every chunks
+
+       records, start and end uncompressed byte offsets.  Records are
+       found like chunk_fastq --raw, without parsing
+    '''
+    ranges = []
+    offset = 0  # uncompressed offset of the current block
+    start = 0
+    count = 0
+    for block, ends in get_raw_fastq_blocks(return_filehandle(fastq,
+                                                              threads)):
+        done = 0  # records of block counted
+        while done < len(ends):
+            take = min(chunks - count, len(ends) - done)
+            done += take
+            count += take
+            if count == chunks:
+                end = offset + int(ends[done - 1])
+                ranges.append((len(ranges) + 1, start, end, count))
+                start = end
+                count = 0
+        offset += int(ends[-1])
+    if count:
+        ranges.append((len(ranges) + 1, start, offset, count))
+    return ranges
+
+
+def get_fasta_records(fasta, threads=1):
+    '''Returns [(id, length, start, end)] of each record of fasta in file
+
+       order, start and end uncompressed byte offsets.  With a current
+       .fai only the record starts are looked up, otherwise or if the .fai
+       skipped records (empty or duplicate) fasta is scanned
+    '''
+    if has_fasta_index(fasta):
+        entries = sorted(read_fai(fasta + '.fai').values(),
+                         key=lambda e: e.offset)
+        source = RangeSource(fasta)
+        try:
+            ends = [source.find_record(entry.sequence_end(), 'fasta')
+                    for entry in entries]
+            starts = [0] + ends[:-1]
+            whole = ((not ends or ends[-1] == source.size) and
+                     all(is_fasta_header(source, start, entry.name)
+                         for entry, start in zip(entries[1:], starts[1:])))
+        finally:
+            source.close()
+        if whole:
+            return [(entry.name, entry.length, start, end)
+                    for entry, start, end in zip(entries, starts, ends)]
+    return [(seq_id, bases, start, end) for seq_id, start, end, bases in
+            get_fasta_offsets(fasta, threads)]
+
+
+def is_fasta_header(source, start, seq_id):
+    '''Checks that the RangeSource source has the header of seq_id at start'''
+    data = source.read(start, len(seq_id) + 2)
+    return (data[:len(seq_id) + 1] == b'>' + seq_id and
+            data[len(seq_id) + 1:].strip() == b'')
+
+
+def get_chunk_ranges(records, numbers):
+    '''Returns [(chunk, start, end, records)] from the [(start, end)]
+
+       byte ranges of records in file order and the chunk number of each,
+       runs of neighbouring records of one chunk merged into one range
+    '''
+    ranges = []
+    for (start, end), number in zip(records, numbers):
+        if ranges and ranges[-1][0] == number and ranges[-1][2] == start:
+            last = ranges[-1]
+            ranges[-1] = (number, last[1], end, last[3] + 1)
+        else:
+            ranges.append((number, start, end, 1))
+    return ranges
+
+
+def write_manifest(write_me, read_me, ranges):
+    '''Writes the [(chunk, start, end, records)] ranges of read_me to
+
+       write_me, tab separated after #input and #bytes header lines
+    '''
+    with open(write_me, 'w') as wopen:
+        wopen.write('#input\t{}\n'.format(os.path.abspath(read_me)))
+        wopen.write('#bytes\t{}\n'.format(os.path.getsize(read_me)))
+        wopen.write(MANIFEST_COLUMNS)
+        for chunk, start, end, records in ranges:
+            wopen.write('{}\t{}\t{}\t{}\n'.format(chunk, start, end, records))
+
+
+def read_manifest(read_me):
+    '''Returns (input, bytes, {chunk: [(start, end, records)]}) of the
+
+       manifest read_me, the ranges of each chunk in file order
+    '''
+    header = {}
+    chunks = {}
+    with open(read_me) as ropen:
+        for line in ropen:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            if line.startswith('#'):
+                key, _, value = line[1:].partition('\t')
+                header[key] = value
+                continue
+            chunk, start, end, records = (int(f) for f in line.split('\t'))
+            chunks.setdefault(chunk, []).append((start, end, records))
+    if 'input' not in header:
+        raise ValueError('No #input line in manifest {}'.format(read_me))
+    for ranges in chunks.values():
+        ranges.sort()
+    return header['input'], int(header.get('bytes', -1)), chunks
+
+
+def get_range_data(read_me, ranges, threads=1):
+    '''Generator of the uncompressed bytes of the sorted [(start, end)]
+
+       ranges of read_me.  Plain and BGZF files are read at the offsets
+       with a RangeSource, plain gzip is decompressed from the start
+    '''
+    try:
+        source = RangeSource(read_me)
+    except ValueError:  # plain gzip
+        yield from get_streamed_range_data(read_me, ranges, threads)
+        return
+    try:
+        for start, end in ranges:
+            end = min(end, source.size)
+            while start < end:
+                data = source.read(start, min(end - start, RANGE_READ_SIZE))
+                if not data:
+                    break
+                start += len(data)
+                yield data
+    finally:
+        source.close()
+
+
+def get_streamed_range_data(read_me, ranges, threads=1):
+    '''Like get_range_data reading read_me in order, skipping the bytes
+
+       between ranges
+    '''
+    offset = 0  # uncompressed offset of data
+    data = b''
+    with return_filehandle(read_me, threads) as fopen:
+        handle = binary_handle(fopen)
+        for start, end in ranges:
+            while True:
+                first = max(start - offset, 0)
+                last = min(end - offset, len(data))
+                if last > first:
+                    yield data[first:last]
+                if offset + len(data) >= end:  # keep data for the next range
+                    break
+                offset += len(data)
+                data = handle.read(RANGE_READ_SIZE)
+                if not data:
+                    return
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
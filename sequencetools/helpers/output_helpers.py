@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+import io
+import sys
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from .compression_helpers import BgzfWriter, BGZF_COMPRESS_LEVEL
+
+OUTPUT_BUFFER_SIZE = 4 * 1024 * 1024  # bytes collected before a hand off
+OUTPUT_QUEUE_DEPTH = 4  # full buffers waiting for the writer thread
+MAX_OPEN_HANDLES = 64  # output files a HandlePool keeps open at once
+POOLED_BUFFER_SIZE = 1024 * 1024  # write buffer of each HandlePool file
+
+
+class BackgroundWriter(io.RawIOBase):
+    '''Binary writer that fills large reusable buffers on the caller's
+
+       thread and writes them to handle from a background thread, so
+       tools never block on a syscall (or compression) per record.
+       handle is closed with the writer
+    '''
+
+    def __init__(self, handle, buffer_size=OUTPUT_BUFFER_SIZE,
+                 depth=OUTPUT_QUEUE_DEPTH):
+        self._handle = handle
+        self._size = buffer_size
+        self._buffer = bytearray(buffer_size)
+        self._pos = 0
+        self._queue = queue.Queue(maxsize=depth)
+        self._free = queue.Queue()  # written buffers ready for reuse
+        self._error = None
+        self._reported = False  # _error was raised in the caller
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def _write(self):
+        '''Thread target, writes (buffer, size) items until None'''
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                data, size = item
+                if self._error is None:
+                    self._handle.write(memoryview(data)[:size])
+                if len(data) == self._size and isinstance(data, bytearray):
+                    self._free.put(data)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check(self):
+        '''Raises an error from the writer thread in the caller.
+
+           Later writes raise it again, the output already has a gap
+        '''
+        if self._error is not None:
+            self._reported = True
+            raise self._error
+
+    def _hand_off(self):
+        '''Queues the current buffer and takes a free one'''
+        if not self._pos:
+            return
+        self._queue.put((self._buffer, self._pos))
+        try:
+            self._buffer = self._free.get_nowait()
+        except queue.Empty:
+            self._buffer = bytearray(self._size)
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError('write to closed file')
+        self._check()
+        size = len(b)
+        if self._pos + size > self._size:
+            self._hand_off()
+            if size >= self._size:  # too big to buffer, queue a copy
+                self._queue.put((bytes(b), size))
+                return size
+        self._buffer[self._pos:self._pos + size] = b
+        self._pos += size
+        return size
+
+    def flush(self):
+        '''Waits until everything written so far reached handle'''
+        if not self.closed and self._thread.is_alive():
+            self._hand_off()
+            self._queue.join()
+            self._check()
+            self._handle.flush()
+
+    def close(self):
+        if not self.closed:
+            try:
+                if not self._reported:
+                    self.flush()
+            finally:
+                self._queue.put(None)
+                self._thread.join()
+                try:
+                    self._handle.close()
+                finally:
+                    super().close()
+
+
+class HandlePool(object):
+    '''Open binary output handles for many files, at most max_open at once.
+
+       opener(path, mode) returns a handle.  The least recently used handle
+       is closed when another is needed and its file is reopened with mode
+       'ab' later, so every file is written in one pass whatever the count
+    '''
+
+    def __init__(self, opener, max_open=MAX_OPEN_HANDLES):
+        self._opener = opener
+        self._max_open = max(max_open, 1)
+        self._handles = OrderedDict()  # path: handle, least recent first
+        self.paths = []  # every path written, in first use order
+        self._written = set()  # self.paths for membership checks
+
+    def get(self, path):
+        '''Returns the open handle for path'''
+        handle = self._handles.get(path)
+        if handle is not None:
+            self._handles.move_to_end(path)
+            return handle
+        if len(self._handles) >= self._max_open:
+            self._handles.popitem(last=False)[1].close()
+        mode = 'ab'
+        if path not in self._written:  # new in this run, replace old files
+            self._written.add(path)
+            self.paths.append(path)
+            mode = 'wb'
+        handle = self._handles[path] = self._opener(path, mode)
+        return handle
+
+    def close(self):
+        while self._handles:
+            self._handles.popitem(last=False)[1].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_pooled_file(write_me, mode, gzip_me=False,
+                     level=BGZF_COMPRESS_LEVEL):
+    '''HandlePool opener for buffered output files, BGZF if gzip_me'''
+    handle = open(write_me, mode, buffering=POOLED_BUFFER_SIZE)
+    if gzip_me:
+        return BgzfWriter(handle, 1, level)
+    return handle
+
+
+def write_file(write_me, data, gzip_me, level=BGZF_COMPRESS_LEVEL):
+    '''Writes the bytes data to a new file write_me, BGZF if gzip_me'''
+    if gzip_me:
+        handle = BgzfWriter(write_me, 1, level)
+    else:
+        handle = open(write_me, 'wb')
+    with handle:
+        handle.write(data)
+
+
+class PooledChunk(io.RawIOBase):
+    '''Binary handle that collects one output file in memory and hands
+
+       it to its ChunkWriterPool when closed
+    '''
+
+    def __init__(self, pool, write_me):
+        self._pool = pool
+        self._write_me = write_me
+        self._data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError('write to closed file')
+        self._data += b
+        return len(b)
+
+    def close(self):
+        if not self.closed:
+            data = self._data
+            self._data = None
+            self._pool.submit(self._write_me, data)
+        super().close()
+
+
+class ChunkWriterPool(object):
+    '''Thread pool that compresses and writes whole output files.
+
+       open returns a PooledChunk, so the reader keeps naming and filling
+       files in order while finished ones are written concurrently.  At
+       most max_pending closed files wait in memory, submit blocks on the
+       oldest beyond that, and worker errors are raised in the caller
+    '''
+
+    def __init__(self, threads, gzip_me, level=BGZF_COMPRESS_LEVEL,
+                 max_pending=None):
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._gzip_me = gzip_me
+        self._level = level
+        self._max_pending = max(max_pending or threads * 2, 1)
+        self._pending = deque()  # futures in submission order
+
+    def open(self, write_me):
+        '''Returns a PooledChunk for the new file write_me'''
+        return PooledChunk(self, write_me)
+
+    def submit(self, write_me, data):
+        '''Queues data to be written to write_me by a worker'''
+        while len(self._pending) >= self._max_pending:
+            self._pending.popleft().result()
+        self._pending.append(self._executor.submit(write_file, write_me,
+                                                   data, self._gzip_me,
+                                                   self._level))
+
+    def close(self):
+        '''Waits for every file, raising the first worker error'''
+        try:
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
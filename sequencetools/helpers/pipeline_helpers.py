@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import io
+import sys
+import queue
+import threading
+from .compression_helpers import GzipReadAhead, BgzfReader, ThreadedReader
+from .sequence_helpers import (get_fastx_record, binary_handle, is_mappable,
+                               READ_SIZE)
+
+PIPELINE_BATCH = 1024  # records per batch handed to the tool
+PIPELINE_DEPTH = 8  # parsed batches buffered ahead of the tool, 0 inline
+PUT_TIMEOUT = 0.1  # seconds between checks for a stopped consumer
+READER_DEPTH = 4  # READ_SIZE byte blocks read ahead of the parser
+
+
+class BlockReader(ThreadedReader):
+    '''Raw binary reader over seq_handle filled by a reader thread.
+
+       The thread reads, and so decompresses, size byte blocks into a
+       queue at most depth blocks ahead of the parser.  Closing stops the
+       thread and closes seq_handle
+    '''
+
+    def __init__(self, seq_handle, size=READ_SIZE, depth=READER_DEPTH):
+        self._size = size
+        super().__init__(seq_handle, depth)
+
+    def _chunks(self):
+        '''Generator of size byte blocks of seq_handle'''
+        handle = binary_handle(self._source)
+        while True:
+            data = handle.read(self._size)
+            if not data:
+                break
+            yield data
+
+
+def read_ahead(seq_handle, depth=READER_DEPTH):
+    '''Returns a text handle over seq_handle read by a BlockReader thread,
+
+       so reading and decompression run apart from parsing.  Regular files
+       the parsers memory map and threaded gzip readers, which already
+       read ahead, are returned as they are
+    '''
+    handle = binary_handle(seq_handle)
+    if is_mappable(handle) or isinstance(getattr(handle, 'raw', None),
+                                         (GzipReadAhead, BgzfReader)):
+        return seq_handle
+    return io.TextIOWrapper(io.BufferedReader(BlockReader(seq_handle,
+                                                          depth=depth)))
+
+
+class RecordProducer(threading.Thread):
+    '''Thread that iterates records and puts lists of batch_size records
+
+       into queue batches, then None.  An exception is put in place of the
+       rest of the batches.  Setting stop makes it give up at the next put
+    '''
+
+    def __init__(self, records, batches, batch_size):
+        threading.Thread.__init__(self, daemon=True)
+        self.records = records
+        self.batches = batches
+        self.batch_size = batch_size
+        self.stop = threading.Event()
+
+    def _put(self, item):
+        '''Blocking put that returns False once stop is set'''
+        while not self.stop.is_set():
+            try:
+                self.batches.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self):
+        try:
+            batch = []
+            for record in self.records:
+                batch.append(record)
+                if len(batch) == self.batch_size:
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if batch and not self._put(batch):
+                return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+        finally:
+            close = getattr(self.records, 'close', None)
+            if close is not None:
+                close()  # release input handles from this thread
+
+
+def get_record_batches(records, batch_size=PIPELINE_BATCH,
+                       depth=PIPELINE_DEPTH):
+    '''Generator of record lists from the record iterator records.
+
+       Parsing runs in a RecordProducer thread at most depth batches ahead
+       of the caller, which blocks the producer when the tool falls
+       behind.  depth 0 batches inline
+    '''
+    if depth <= 0:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+    producer = RecordProducer(records, queue.Queue(maxsize=depth),
+                              batch_size)
+    producer.start()
+    try:
+        while True:
+            batch = producer.batches.get()
+            if batch is None:
+                producer.join()
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+    finally:
+        producer.stop.set()  # lets the producer exit if we stopped early
+
+
+def get_pipeline_record(seq_handle, file_type, seqio=False,
+                        batch_size=PIPELINE_BATCH, depth=PIPELINE_DEPTH):
+    '''Drop in for get_fastx_record, records are parsed in a producer
+
+       thread batch_size at a time with depth batches of read-ahead.
+       Unless depth is 0 the input is read in a third, BlockReader thread
+    '''
+    if depth > 0:
+        seq_handle = read_ahead(seq_handle)
+    records = get_fastx_record(seq_handle, file_type, seqio)
+    for batch in get_record_batches(records, batch_size, depth):
+        yield from batch
+
+
+def get_pipeline_batches(seq_handle, file_type, seqio=False,
+                         batch_size=PIPELINE_BATCH, depth=PIPELINE_DEPTH):
+    '''Like get_pipeline_record but yields the record batches'''
+    if depth > 0:
+        seq_handle = read_ahead(seq_handle)
+    records = get_fastx_record(seq_handle, file_type, seqio)
+    return get_record_batches(records, batch_size, depth)
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+import io
+import os
+import sys
+from .compression_helpers import (is_bgzf, get_bgzf_block_offsets, read_gzi,
+                                  read_bgzf_range, BGZF_BLOCK_DATA)
+from .index_helpers import is_gzipped
+
+RANGE_READ_SIZE = 1024 * 1024  # bytes read per step inside a range
+FIND_SIZE = 64 * 1024  # bytes read per step while looking for a record start
+
+
+class RangeSource(object):
+    '''Random access to the uncompressed bytes of a plain or BGZF file.
+
+       BGZF block offsets come from a current read_me.gzi, or are read
+       from the block headers.  Plain gzip can not be read at an offset
+       and raises ValueError
+    '''
+
+    def __init__(self, read_me):
+        self.read_me = read_me
+        self.gzi = None
+        self._handle = open(read_me, 'rb')
+        if is_gzipped(read_me):
+            if not is_bgzf(read_me):
+                self._handle.close()
+                raise ValueError('Cannot split plain gzip {}, compress with '
+                                 'bgzip'.format(read_me))
+            gzi_file = read_me + '.gzi'
+            if (os.path.exists(gzi_file) and os.path.getmtime(gzi_file) >=
+                    os.path.getmtime(read_me)):
+                self.gzi = read_gzi(gzi_file)
+            else:
+                offsets = list(get_bgzf_block_offsets(read_me)) or [(0, 0)]
+                self.gzi = ([c for c, u in offsets], [u for c, u in offsets])
+            last = self.gzi[1][-1]  # only the last block is inflated
+            self.size = last + len(self.read(last, BGZF_BLOCK_DATA * 2))
+        else:
+            self.size = os.fstat(self._handle.fileno()).st_size
+
+    def read(self, start, size):
+        '''Returns up to size uncompressed bytes from start'''
+        if self.gzi is not None:
+            return read_bgzf_range(self._handle, self.gzi, start, size)
+        return os.pread(self._handle.fileno(), size, start)
+
+    def find(self, sub, start):
+        '''Returns the first uncompressed offset of sub at or after start
+
+           or size if it is not found
+        '''
+        while start < self.size:
+            data = self.read(start, FIND_SIZE + len(sub))
+            i = data.find(sub)
+            if i >= 0:
+                return start + i
+            start += FIND_SIZE
+        return self.size
+
+    def _is_fastq_record(self, start):
+        '''Checks for a four line FASTQ record at start'''
+        size = FIND_SIZE
+        while True:
+            data = self.read(start, size)
+            lines = data.split(b'\n', 4)
+            if len(lines) == 5 or len(data) < size:  # all lines or EOF
+                break
+            size *= 4
+        if len(lines) < 4 or not lines[2].startswith(b'+'):
+            return False
+        return len(lines[1].rstrip(b'\r')) == len(lines[3].rstrip(b'\r'))
+
+    def find_record(self, start, file_type='fasta'):
+        '''Returns the offset of the first file_type record starting at or
+
+           after start, or size.  A FASTQ record is an @ line followed two
+           lines later by a + line, with sequence and quality of one length
+        '''
+        if start <= 0:
+            return 0
+        if file_type != 'fastq':
+            return min(self.find(b'\n>', start - 1) + 1, self.size)
+        pos = start - 1
+        while True:
+            pos = self.find(b'\n@', pos)
+            if pos >= self.size:
+                return self.size
+            if self._is_fastq_record(pos + 1):
+                return pos + 1
+            pos += 1
+
+    def close(self):
+        self._handle.close()
+
+
+class RangeReader(io.RawIOBase):
+    '''Raw binary reader over the bytes start to end of a RangeSource'''
+
+    def __init__(self, source, start, end):
+        self._source = source
+        self._pos = start
+        self._end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        size = min(len(b), self._end - self._pos, RANGE_READ_SIZE)
+        if size <= 0:
+            return 0
+        data = self._source.read(self._pos, size)
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._source.close()
+        super().close()
+
+
+def get_record_ranges(read_me, parts, file_type='fasta'):
+    '''Splits the uncompressed bytes of read_me into at most parts
+
+       (start, end) ranges, each moved forward to the start of a file_type
+       record so no record is split
+    '''
+    source = RangeSource(read_me)
+    try:
+        size = source.size
+        starts = [0]
+        for i in range(1, parts):
+            starts.append(source.find_record(size * i // parts, file_type))
+        starts.append(size)
+    finally:
+        source.close()
+    starts = sorted(set(starts))
+    return [(s, e) for s, e in zip(starts[:-1], starts[1:]) if e > s]
+
+
+def open_range(read_me, start, end):
+    '''Returns a text handle over bytes start to end of read_me, like
+
+       return_filehandle, for the record parsers
+    '''
+    reader = RangeReader(RangeSource(read_me), start, end)
+    return io.TextIOWrapper(io.BufferedReader(reader))
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import sys
+import numpy as np
+from .range_helpers import RangeSource, open_range
+from .sequence_helpers import get_fastx_record
+
+SAMPLE_COUNT = 64  # random windows read by an approximate run
+SAMPLE_SIZE = 1024 * 1024  # uncompressed bytes per window
+BOOTSTRAP_REPS = 200  # resamples of the windows for confidence intervals
+CONFIDENCE = 95  # percent confidence of the reported intervals
+
+
+class ByteSample(object):
+    '''Random sample of the records of a plain or BGZF file.
+
+       count windows of size uncompressed bytes start at random offsets,
+       wrapping around the end of the file, and the records starting in
+       each window are read whole.  Every record starts in a window with
+       probability count * size / total bytes, which scale undoes
+    '''
+
+    def __init__(self, read_me, file_type, count=SAMPLE_COUNT,
+                 size=SAMPLE_SIZE, seed=None):
+        self.read_me = read_me
+        self.file_type = file_type
+        self.rng = np.random.default_rng(seed)
+        source = RangeSource(read_me)  # ValueError for plain gzip
+        try:
+            self.total = source.size
+            if count * size >= self.total:
+                raise ValueError('{} is not larger than the sample'.format(
+                                                                 read_me))
+            self.windows = []
+            for start in self.rng.integers(0, max(self.total, 1), count):
+                self.windows.append(self._window(source, int(start), size))
+        finally:
+            source.close()
+        self.scale = self.total / float(count * size)
+
+    def _window(self, source, start, size):
+        '''Returns the record aligned (start, end) ranges of one window'''
+        pieces = [(start, min(start + size, self.total))]
+        if start + size > self.total:  # wrap to the start of the file
+            pieces.append((0, start + size - self.total))
+        ranges = []
+        for a, b in pieces:
+            a = source.find_record(a, self.file_type)
+            if b < self.total:
+                b = source.find_record(b, self.file_type)
+            if b > a:
+                ranges.append((a, b))
+        return ranges
+
+    def get_window_records(self, seqio=False):
+        '''Generator of one record generator per window'''
+        for ranges in self.windows:
+            yield self._records(ranges, seqio)
+
+    def _records(self, ranges, seqio):
+        for start, end in ranges:
+            yield from get_fastx_record(open_range(self.read_me, start, end),
+                                        self.file_type, seqio)
+
+    def resample(self, reps=BOOTSTRAP_REPS):
+        '''Returns a (reps, windows) array of window indices drawn with
+
+           replacement, for bootstrap intervals
+        '''
+        count = len(self.windows)
+        return self.rng.integers(0, count, (reps, count))
+
+
+def get_interval(values):
+    '''Returns the (low, high) CONFIDENCE percentile interval of the
+
+       bootstrap values, rounded like the estimates
+    '''
+    tail = (100 - CONFIDENCE) / 2.0
+    low, high = np.percentile(values, [tail, 100 - tail], axis=0)
+    return (np.round(low).astype(int).tolist(),
+            np.round(high).astype(int).tolist())
+
+
+def estimate_sum(sample, per_window, resamples):
+    '''Returns (estimate, (low, high)) of a file total from per_window
+
+       totals, an array with one value (or row of values) per window
+    '''
+    per_window = np.asarray(per_window, dtype=np.float64)
+    estimate = np.round(per_window.sum(axis=0) * sample.scale)
+    replicates = per_window[resamples].sum(axis=1) * sample.scale
+    return estimate.astype(int).tolist(), get_interval(replicates)
+
+
+def estimate_statistic(per_window, resamples, statistic):
+    '''Returns (estimate, (low, high)) of statistic(list of window
+
+       values), a statistic such as N50 of the records of all windows
+    '''
+    estimate = statistic(per_window)
+    replicates = [statistic([per_window[i] for i in rep])
+                  for rep in resamples]
+    return estimate, get_interval(replicates)
+
+
+def add_estimate(metrics, key, estimate):
+    '''Sets metrics key to the value and key_ci to the interval of the
+
+       (value, (low, high)) estimate
+    '''
+    metrics[key], metrics[key + '_ci'] = estimate
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
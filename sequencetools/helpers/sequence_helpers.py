@@ -1,9 +1,113 @@
 #!/usr/bin/env python
 
+import io
 import os
 import sys
+import mmap
+import stat
 import select
-from Bio import SeqIO
+import numpy as np
+from math import log10
+from .target_helpers import TARGET_BATCH
+
+READ_SIZE = 4 * 1024 * 1024  # bytes read from the input per block
+FASTA_WRAP = 60  # same line length SeqIO uses when writing FASTA
+WHITESPACE = b' \t\r\n'  # deleted from FASTA sequence lines
+IS_WHITESPACE = np.zeros(256, dtype=bool)  # WHITESPACE lookup by byte
+IS_WHITESPACE[list(WHITESPACE)] = True
+COUNT_SIZE = 1024 * 1024  # bytes of a view checked per step by count_bases
+
+
+class FastxRecord(object):
+    '''Lightweight FASTA/FASTQ record.
+
+       id, description, seq and qual are raw bytes straight from the input,
+       description is the full header line (id included) as with SeqIO and
+       qual is the Sanger (phred+33) string or None for FASTA.
+    '''
+    __slots__ = ('id', 'description', 'seq', 'qual')
+
+    def __init__(self, id, description, seq, qual=None):
+        self.id = id
+        self.description = description
+        self.seq = seq
+        self.qual = qual
+
+    def __len__(self):
+        return len(self.seq)
+
+    def __repr__(self):
+        return 'FastxRecord(id={!r}, length={})'.format(self.id, len(self.seq))
+
+    def format(self, file_type, wrap=FASTA_WRAP):
+        '''Returns the record as bytes in file_type, fasta or fastq.
+
+           FASTA sequence is wrapped at wrap characters, 0 for one line
+        '''
+        if file_type == 'fastq':
+            if self.qual is None:
+                raise ValueError('No qualities for record {}'.format(
+                                                     self.id.decode()))
+            return b''.join((b'@', self.description, b'\n', self.seq,
+                             b'\n+\n', self.qual, b'\n'))
+        seq = self.seq
+        if wrap and len(seq) > wrap:
+            seq = b'\n'.join([seq[i:i + wrap]
+                              for i in range(0, len(seq), wrap)])
+        return b''.join((b'>', self.description, b'\n', seq, b'\n'))
+
+
+class MappedFastxRecord(FastxRecord):
+    '''FastxRecord over a memory mapped file.
+
+       seq_view and qual_view are memoryviews into the map, FASTA seq_view
+       still holds line breaks.  seq and qual are only copied to bytes
+       when accessed, so tools that look at ids alone never copy sequence.
+       is_fasta is fixed at construction, setting qual (fastx_converter)
+       does not change how seq_view is read
+    '''
+    __slots__ = ('seq_view', 'qual_view', 'is_fasta')
+
+    def __init__(self, id, description, seq_view, qual_view=None):
+        self.id = id
+        self.description = description
+        self.seq_view = seq_view
+        self.qual_view = qual_view
+        self.is_fasta = qual_view is None
+
+    @property
+    def seq(self):
+        if self.is_fasta:  # drop line breaks
+            return bytes(self.seq_view).translate(None, WHITESPACE)
+        return bytes(self.seq_view)
+
+    @property
+    def qual(self):
+        if self.qual_view is None:
+            return None
+        return bytes(self.qual_view)
+
+    @qual.setter
+    def qual(self, qual):
+        self.qual_view = qual
+
+    def __len__(self):
+        if self.is_fasta:
+            return count_bases(self.seq_view)
+        return len(self.seq_view)
+
+
+def count_bases(view):
+    '''Returns the bytes of memoryview view that are not WHITESPACE,
+
+       checked COUNT_SIZE bytes at a time so the view is never copied
+    '''
+    codes = np.frombuffer(view, dtype=np.uint8)
+    spaces = 0
+    for i in range(0, len(codes), COUNT_SIZE):
+        block = codes[i:i + COUNT_SIZE]
+        spaces += int(np.count_nonzero(IS_WHITESPACE[block]))
+    return len(codes) - spaces
 
 
 def check_sequence_id(seq_id, targets, reverse):
@@ -21,26 +125,383 @@ def check_sequence_id(seq_id, targets, reverse):
     return False
 
 
-def check_sequence_length(seq, length, reverse):
-    '''Accepts a string record and checks to see if it returns true or false
-       
-       based on length and reverse
+def filter_by_id(records, targets, reverse, batch=TARGET_BATCH):
+    '''Generator of the records whose id passes check_sequence_id.
+
+       Ids are checked a batch at a time with targets.contains_many
+    '''
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == batch:
+            yield from filter_batch_by_id(chunk, targets, reverse)
+            chunk = []
+    if chunk:
+        yield from filter_batch_by_id(chunk, targets, reverse)
+
+
+def filter_batch_by_id(chunk, targets, reverse):
+    '''Returns the records in list chunk that pass check_sequence_id'''
+    found = targets.contains_many([record.id for record in chunk])
+    if reverse:
+        found = ~found
+    return [chunk[i] for i in found.nonzero()[0]]
+
+
+def check_sequence_length(seq_length, length, reverse):
+    '''Accepts the length of a record and checks to see if it returns true
+
+       or false based on length and reverse.  Takes len(record) so mapped
+       records count bases without copying their sequence
     '''
     if reverse:  # make less than
-        if len(seq) <= length:
+        if seq_length <= length:
             return True
         else:
             return False
-    if len(seq) >= length:  # normal >= check
+    if seq_length >= length:  # normal >= check
         return True
     return False
 
 
+def solexa_to_sanger(quality):
+    '''Converts a solexa quality score to a Sanger encoded character
+
+       using the same rounding as SeqIO
+    '''
+    phred = int(round(10 * log10(10 ** (quality / 10.0) + 1)))
+    return bytes([min(126, phred + 33)])
+
+
+def binary_handle(seq_handle):
+    '''Returns the binary stream under seq_handle.
+
+       Text handles from open, gzip.open and sys.stdin expose it as buffer
+    '''
+    return getattr(seq_handle, 'buffer', seq_handle)
+
+
+def read_blocks(handle, size=READ_SIZE):
+    '''Generator of size byte blocks from the binary handle'''
+    while True:
+        block = handle.read(size)
+        if not block:
+            return
+        yield block
+
+
+def is_mappable(handle):
+    '''Checks that binary handle is a regular, non empty uncompressed file'''
+    if not isinstance(handle, io.BufferedReader):
+        return False
+    if not isinstance(handle.raw, io.FileIO):
+        return False
+    try:
+        info = os.fstat(handle.fileno())
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return False
+    return stat.S_ISREG(info.st_mode) and info.st_size > 0
+
+
+def map_handle(handle):
+    '''Returns a read only mmap of binary handle or None.
+
+       Only regular uncompressed files are mapped, compressed streams and
+       pipes are left to the block parsers
+    '''
+    if not is_mappable(handle):
+        return None
+    try:
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return None
+
+
+def close_map(mapped):
+    '''Closes mapped unless records still hold memoryviews into it'''
+    try:
+        mapped.close()
+    except BufferError:
+        pass  # released when the last record is collected
+
+
+def get_mapped_fasta_record(mapped, start=0):
+    '''Yields MappedFastxRecords from the FASTA in mmap mapped from start
+
+       Entries are found with find on the map, sequence is never copied
+    '''
+    view = memoryview(mapped)
+    size = len(mapped)
+    try:
+        pos = start
+        if not mapped[start:start + 1] == b'>':  # skip text before header
+            pos = mapped.find(b'\n>', start)
+            pos = pos + 1 if pos >= 0 else size
+        while pos < size:
+            nxt = mapped.find(b'\n>', pos)
+            end = nxt + 1 if nxt >= 0 else size
+            eol = mapped.find(b'\n', pos, end)
+            if eol < 0:  # header only
+                eol = end
+            title = mapped[pos + 1:eol].rstrip()
+            seq_id = title.split(None, 1)[0] if title else b''
+            yield MappedFastxRecord(seq_id, title, view[min(eol + 1, end):end])
+            pos = end
+    finally:
+        view.release()
+        close_map(mapped)
+
+
+def scan_fastq(data, pos=0, final=True):
+    '''Yields (start, e1, s2, e3, s4, end) offsets of each four line FASTQ
+
+       record in the bytes or mmap data from pos.  The header runs from
+       start to e1, sequence from e1 + 1 to s2 and quality from e3 + 1 to
+       s4 without line breaks, and the next record starts at end.  Blank
+       lines, \n or \r\n, are skipped.  Unless final, scanning stops at a
+       record with no newline after its quality, so more data can follow
+    '''
+    size = len(data)
+    find = data.find
+    while True:
+        while pos < size and data[pos] in (10, 13):  # blank lines
+            pos += 1
+        if pos >= size:
+            return
+        e1 = find(b'\n', pos)
+        e2 = find(b'\n', e1 + 1) if e1 >= 0 else -1
+        e3 = find(b'\n', e2 + 1) if e2 >= 0 else -1
+        e4 = find(b'\n', e3 + 1) if e3 >= 0 else -1
+        if e4 < 0:
+            if not final:
+                return
+            if e3 < 0:
+                raise ValueError('Truncated FASTQ record at "{}"'.format(
+                       data[pos:pos + 80].decode(errors='replace')))
+            e4 = size  # final record missing newline
+        s2 = e2 - 1 if data[e2 - 1] == 13 else e2  # \r\n line breaks
+        s4 = e4 - 1 if data[e4 - 1] == 13 else e4
+        if data[pos] != 64 or data[e2 + 1] != 43 or s2 - e1 != s4 - e3:
+            raise ValueError('Malformed or multi-line FASTQ record '
+                             'at "{}", try the SeqIO parser'.format(
+                             data[pos:e1].decode(errors='replace')))
+        yield pos, e1, s2, e3, s4, e4 + 1
+        pos = e4 + 1
+
+
+def scan_fastq_handle(handle):
+    '''Yields (buf, offsets) for each READ_SIZE block read from the binary
+
+       handle, offsets a list of scan_fastq offsets of the whole records
+       in the bytes buf.  Partial records are carried to the next block
+    '''
+    buf = b''
+    eof = False
+    while not eof:
+        block = handle.read(READ_SIZE)
+        eof = not block
+        buf = buf + block if buf else block
+        offsets = list(scan_fastq(buf, 0, eof))
+        if offsets:
+            yield buf, offsets
+            buf = buf[offsets[-1][5]:]
+
+
+def get_mapped_fastq_record(mapped, start=0):
+    '''Yields MappedFastxRecords from the four line FASTQ in mmap mapped
+
+       from start, seq and qual are memoryviews of the map
+    '''
+    view = memoryview(mapped)
+    try:
+        for pos, e1, s2, e3, s4, end in scan_fastq(mapped, start):
+            title = mapped[pos + 1:e1].rstrip()
+            seq_id = title.split(None, 1)[0] if title else b''
+            yield MappedFastxRecord(seq_id, title, view[e1 + 1:s2],
+                                    view[e3 + 1:s4])
+    finally:
+        view.release()
+        close_map(mapped)
+
+
+def parse_fasta_record(raw):
+    '''Builds a FastxRecord from the bytes of a single FASTA entry'''
+    eol = raw.find(b'\n')
+    if eol < 0:  # header only
+        title = raw[1:].rstrip()
+        seq = b''
+    else:
+        title = raw[1:eol].rstrip()
+        seq = raw[eol + 1:].translate(None, WHITESPACE)
+    seq_id = title.split(None, 1)[0] if title else b''
+    return FastxRecord(seq_id, title, seq)
+
+
+def get_fasta_record(seq_handle):
+    '''Parses a fasta filehandle seq_handle and yields FastxRecords
+
+       Regular files are memory mapped, anything else is read in large
+       binary blocks and entries are split on newline + ">"
+    '''
+    with seq_handle as sopen:
+        handle = binary_handle(sopen)
+        mapped = map_handle(handle)
+        if mapped is not None:
+            yield from get_mapped_fasta_record(mapped, handle.tell())
+            return
+        pieces = []  # parts of the current entry across blocks
+        for block in read_blocks(handle):
+            pos = 0
+            if (block.startswith(b'>') and pieces and
+                    pieces[-1].endswith(b'\n')):  # boundary between blocks
+                raw = b''.join(pieces)
+                pieces = []
+                if raw.startswith(b'>'):  # skip text before first header
+                    yield parse_fasta_record(raw)
+            while True:
+                nxt = block.find(b'\n>', pos)
+                if nxt < 0:
+                    pieces.append(block[pos:] if pos else block)
+                    break
+                pieces.append(block[pos:nxt + 1])
+                raw = b''.join(pieces)
+                pieces = []
+                if raw.startswith(b'>'):
+                    yield parse_fasta_record(raw)
+                pos = nxt + 1
+        raw = b''.join(pieces)
+        if raw.startswith(b'>'):
+            yield parse_fasta_record(raw)
+
+
+def get_fastq_record(seq_handle):
+    '''Parses a fastq filehandle seq_handle and yields FastxRecords
+
+       Expects four line records, use the SeqIO parser for wrapped FASTQ.
+       Regular files are memory mapped
+    '''
+    with seq_handle as sopen:
+        handle = binary_handle(sopen)
+        mapped = map_handle(handle)
+        if mapped is not None:
+            yield from get_mapped_fastq_record(mapped, handle.tell())
+            return
+        for buf, offsets in scan_fastq_handle(handle):
+            for pos, e1, s2, e3, s4, end in offsets:
+                title = buf[pos + 1:e1].rstrip()
+                seq_id = title.split(None, 1)[0] if title else b''
+                yield FastxRecord(seq_id, title, buf[e1 + 1:s2],
+                                  buf[e3 + 1:s4])
+
+
+def get_mapped_fastq_length(mapped, start=0):
+    '''Yields (title, length) of each four line FASTQ record in mmap
+
+       mapped from start, only the title is copied
+    '''
+    try:
+        for pos, e1, s2, e3, s4, end in scan_fastq(mapped, start):
+            yield mapped[pos + 1:e1].rstrip(), s2 - e1 - 1
+    finally:
+        close_map(mapped)
+
+
+def get_fastq_length(seq_handle):
+    '''Parses a fastq filehandle seq_handle and yields (title, length)
+
+       of each four line record.  Sequence and quality lines are measured
+       in the input without building records, for tools that need the
+       header and length alone.  Regular files are memory mapped
+    '''
+    with seq_handle as sopen:
+        handle = binary_handle(sopen)
+        mapped = map_handle(handle)
+        if mapped is not None:
+            yield from get_mapped_fastq_length(mapped, handle.tell())
+            return
+        for buf, offsets in scan_fastq_handle(handle):
+            for pos, e1, s2, e3, s4, end in offsets:
+                yield buf[pos + 1:e1].rstrip(), s2 - e1 - 1
+
+
+def get_raw_fastq_blocks(seq_handle, size=READ_SIZE):
+    '''Parses a fastq filehandle seq_handle and yields (block, ends).
+
+       block is bytes holding whole four line records exactly as read and
+       ends the numpy array of the offset just past each record.  Line
+       breaks are found with numpy over the whole block, so records are
+       never built or re-formatted.  Blank lines and multi-line records
+       raise ValueError
+    '''
+    with seq_handle as sopen:
+        handle = binary_handle(sopen)
+        rest = b''
+        eof = False
+        while not eof:
+            data = handle.read(size)
+            if not data:
+                eof = True
+                if not rest.strip():
+                    break
+                if not rest.endswith(b'\n'):
+                    rest += b'\n'  # final record missing newline
+            block = rest + data if rest else data
+            view = np.frombuffer(block, dtype=np.uint8)
+            lines = np.flatnonzero(view == 10) + 1  # offset after each line
+            records = len(lines) // 4
+            if eof and len(lines) % 4:
+                tail = int(lines[records * 4 - 1]) if records else 0
+                raise ValueError('Truncated FASTQ record at "{}"'.format(
+                           block[tail:tail + 80].decode(errors='replace')))
+            if not records:
+                rest = block
+                continue
+            lines = lines[:records * 4].reshape(records, 4)
+            starts = np.concatenate(([0], lines[:-1, 3]))
+            bad = ((view[starts] != 64) |  # @ header
+                   (view[lines[:, 1]] != 43) |  # + line
+                   (lines[:, 1] - lines[:, 0] != lines[:, 3] - lines[:, 2]))
+            if bad.any():
+                i = bad.nonzero()[0][0]
+                raise ValueError('Malformed, blank line or multi-line FASTQ '
+                                 'record at "{}", try without raw '
+                                 'copying'.format(block[starts[i]:starts[i] +
+                                      80].decode(errors='replace')))
+            ends = lines[:, 3]
+            yield block, ends
+            rest = block[int(ends[-1]):]
+
+
+def get_fastx_record(seq_handle, file_type, seqio=False):
+    '''Takes file type and the sequence filehandle
+
+       Generator for FastxRecords, if seqio parse with Bio.SeqIO instead
+    '''
+    if seqio:
+        return seqio_to_fastx_record(
+                             get_seqio_fastx_record(seq_handle, file_type))
+    if file_type == 'fastq':
+        return get_fastq_record(seq_handle)
+    return get_fasta_record(seq_handle)
+
+
+def seqio_to_fastx_record(records):
+    '''Converts SeqIO records to FastxRecords so tools see one record type'''
+    for record in records:
+        qual = None
+        phred = record.letter_annotations.get('phred_quality')
+        if phred is not None:
+            qual = bytes([q + 33 for q in phred])
+        yield FastxRecord(record.id.encode(), record.description.encode(),
+                          bytes(record.seq), qual)
+
+
 def get_seqio_fasta_record(seq_handle):
     '''Parses a fasta filehandle seq_handle and yields the formatted records
-    
+
        Generator for SeqIO record objects
     '''
+    from Bio import SeqIO
     with seq_handle as sopen:
         for record in SeqIO.parse(sopen, 'fasta'):  # iterate with SeqIO
             yield record  # yield each record as it is iterated
@@ -48,9 +509,10 @@ def get_seqio_fasta_record(seq_handle):
 
 def get_seqio_fastq_record(seq_handle):
     '''Parses a fasta filehandle seq_handle and yields the formatted records
-    
+
        Generator for SeqIO record objects
     '''
+    from Bio import SeqIO
     with seq_handle as sopen:
         for record in SeqIO.parse(sopen, 'fastq'):  # iterate with SeqIO
             yield record  # yield each record as it is iterated
@@ -58,9 +520,10 @@ def get_seqio_fastq_record(seq_handle):
 
 def get_seqio_fastx_record(seq_handle, file_type):
     '''Takes file type and the sequence filehandle
-    
+
        Generator for general SeqIO records lets Bio handle exceptions
     '''
+    from Bio import SeqIO
     with seq_handle as sopen:
         for record in SeqIO.parse(sopen, file_type):
             yield record  # yeild SerIO record object.  Its a set.
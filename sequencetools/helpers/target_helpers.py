@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import sys
+import math
+import hashlib
+import numpy as np
+
+BLOOM_ERROR_RATE = 0.01  # false positive rate the Bloom filter is sized for
+TARGET_BATCH = 4096  # records per vectorized membership check
+
+
+def hash_id(seq_id):
+    '''Returns a 64 bit integer hash of the bytes seq_id'''
+    return int.from_bytes(hashlib.blake2b(seq_id, digest_size=8).digest(),
+                          'little')
+
+
+def hash_ids(seq_ids):
+    '''Returns a uint64 array of hash_id for every id in seq_ids'''
+    return np.fromiter((hash_id(seq_id) for seq_id in seq_ids),
+                       dtype=np.uint64)
+
+
+class BloomFilter(object):
+    '''Bloom filter over 64 bit id hashes.
+
+       The k bit positions come from double hashing the two 32 bit halves
+       of each hash, so no extra hashing of the ids is needed
+    '''
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = max(self.size, 64)
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, hashes):
+        '''Returns a (k, n) array of bit positions for the uint64 hashes'''
+        low = hashes & np.uint64(0xffffffff)
+        high = hashes >> np.uint64(32)
+        steps = np.arange(self.hashes, dtype=np.uint64)[:, None]
+        return (low + steps * high) % np.uint64(self.size)
+
+    def add(self, hashes):
+        '''Sets the bits for the uint64 array hashes'''
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         (1 << (positions & np.uint64(7))).astype(np.uint8))
+
+    def contains(self, hashes):
+        '''Returns a bool array, False where a hash is surely absent'''
+        positions = self._positions(hashes)
+        found = self.bits[positions >> np.uint64(3)] >> (
+                                         positions & np.uint64(7)) & 1
+        return found.all(axis=0)
+
+
+class TargetSet(object):
+    '''Compact set of sequence ids stored as sorted unique 64 bit hashes.
+
+       Costs 8 bytes per id instead of a dict entry.  With bloom a Bloom
+       filter rejects most misses before the sorted array is searched.
+       With exact the ids are kept in one bytes blob (in hash order) and
+       every hash hit is checked against them, removing the tiny chance
+       of a hash collision
+    '''
+
+    def __init__(self, seq_ids, bloom=False, exact=False):
+        seq_ids = list(seq_ids) if exact else seq_ids
+        hashes = hash_ids(seq_ids)
+        order = np.argsort(hashes, kind='stable')
+        hashes = hashes[order]
+        keep = np.ones(len(hashes), dtype=bool)
+        keep[1:] = hashes[1:] != hashes[:-1]  # drop repeated ids
+        self.ids = None
+        self.id_offsets = None
+        if exact:
+            ordered = [seq_ids[i] for i in order]
+            repeat = ~keep
+            run = set()  # ids seen in the current run of equal hashes
+            for i in np.flatnonzero(repeat):  # keep true hash collisions
+                if not repeat[i - 1]:
+                    run = {ordered[i - 1]}
+                if ordered[i] not in run:
+                    run.add(ordered[i])
+                    keep[i] = True
+            ordered = [ordered[i] for i in np.flatnonzero(keep)]
+            self.ids = b''.join(ordered)
+            self.id_offsets = np.zeros(len(ordered) + 1, dtype=np.uint64)
+            np.cumsum([len(i) for i in ordered], out=self.id_offsets[1:])
+        self.hashes = hashes[keep]
+        self.bloom = None
+        if bloom:
+            self.bloom = BloomFilter(len(self.hashes))
+            self.bloom.add(self.hashes)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _verify(self, seq_id, left):
+        '''Checks seq_id against the stored ids sharing the hash at left'''
+        h = self.hashes[left]
+        while left < len(self.hashes) and self.hashes[left] == h:
+            start, end = self.id_offsets[left:left + 2]
+            if self.ids[int(start):int(end)] == seq_id:
+                return True
+            left += 1
+        return False
+
+    def __contains__(self, seq_id):
+        h = hash_id(seq_id)
+        if self.bloom is not None and not self.bloom.contains(
+                                         np.array([h], dtype=np.uint64))[0]:
+            return False
+        left = int(np.searchsorted(self.hashes, np.uint64(h)))
+        if left >= len(self.hashes) or self.hashes[left] != h:
+            return False
+        if self.ids is not None:
+            return self._verify(seq_id, left)
+        return True
+
+    def contains_many(self, seq_ids):
+        '''Returns a bool array of membership for the list seq_ids'''
+        hashes = hash_ids(seq_ids)
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=bool)
+        found = np.ones(len(hashes), dtype=bool)
+        if self.bloom is not None:
+            found = self.bloom.contains(hashes)
+        left = np.searchsorted(self.hashes, hashes)
+        hit = left < len(self.hashes)
+        hit[hit] = self.hashes[left[hit]] == hashes[hit]
+        found &= hit
+        if self.ids is not None:
+            for i in np.flatnonzero(found):
+                found[i] = self._verify(seq_ids[i], left[i])
+        return found
+
+
+if __name__ == '__main__':
+    print('Please import!')
+    sys.exit(0)
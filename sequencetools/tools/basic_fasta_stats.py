@@ -4,119 +4,94 @@ import os
 import sys
 import click
 import json
+import shutil
 import logging
+import tempfile
+import numpy as np
 from collections import OrderedDict
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 from time import sleep
 from signal import signal, SIGPIPE, SIG_DFL
-from ..helpers.sequence_helpers import get_seqio_fasta_record
-from ..helpers.file_helpers import return_filehandle, check_stdin
+from ..helpers.sequence_helpers import get_fastx_record
+from ..helpers.file_helpers import (return_filehandle, check_stdin,
+                                    return_output_handle, is_gzip_name,
+                                    get_file_names)
+from ..helpers.range_helpers import get_record_ranges, open_range
+from ..helpers.length_helpers import LengthCounter
+from ..helpers.cache_helpers import StatsCache, get_cached_stats, CACHE_SIZE
+from ..helpers.sample_helpers import (ByteSample, estimate_sum,
+                                      estimate_statistic, add_estimate,
+                                      SAMPLE_COUNT, SAMPLE_SIZE)
 
 signal(SIGPIPE, SIG_DFL) 
+logger = logging.getLogger('basic_fasta_stats')
+RANGES_PER_PROCESS = 4  # byte ranges per worker, evens out large records
+PER_RECORD_HEADER = b'id\tlength\tgc\tn_count\tgaps\tlargest_contig\n'
+LENGTH_PREFIXES = (('contigs', 'contig'), ('gaps', 'gap'),
+                   ('scaffolds', 'scaffold'), ('total', ''))  # metric keys
 
 
-def get_N50(lengths, total):
-    '''Calculates the N50 of the list lengths using a running sum and
-    
-       the provided total sum of lengths total
-    '''
-    total_length = 0  # will sum bases for all 
-    number = 0
-    for l in reversed(lengths):
-        total_length += int(l)
-        number += 1
-        if total_length >= float(total)/2:  # N50 is this length l
-            return l
-    return 0  # if empty list
-
-
-def get_N90(lengths, total):
-    '''Calculates the N50 of the list lengths using a running sum and
-    
-       the provided total sum of lengths total
+def count_bases(seq, bases):
+    '''Adds the base composition of the uint8 array seq to the bases
+
+       dictionary.  Bytes are counted with np.bincount, lower case is
+       counted as upper case and anything that is not A, C, G, T or N is
+       counted as IUPAC.  Returns the count of every byte value
     '''
-    total_length = 0  # will sum bases for all 
-    number = 0
-    for l in reversed(lengths):
-        total_length += int(l)
-        number += 1
-        if total_length >= float(total)*0.9:  # N90 is this length l
-            return l
-    return 0  # if empty list
-
-
-def get_mean(lengths):
-    '''Calculates the N50 of the list lengths using a running sum and
-    
-       the provided total sum of lengths total
+    counts = np.bincount(seq, minlength=256)
+    counted = 0
+    for base in 'ACGTN':
+        found = int(counts[ord(base)] + counts[ord(base.lower())])
+        bases[base] += found
+        counted += found
+    bases['IUPAC'] += len(seq) - counted
+    return counts
+
+
+def find_gaps(seq, min_gap):
+    '''Returns arrays of the starts and ends of the runs of N or n in the
+
+       uint8 array seq that are at least min_gap long
     '''
-    total_length = 0  # will sum bases for all 
-    number = 0
-    mean = 0
-    for l in lengths:
-        total_length += int(l)
-        number += 1
-    if number:
-        mean = total_length/number
-        return round(mean)
-    return 0  # if empty list
-
-
-def get_gc(gc, total):
-    '''Calculates the percentage gc'''
-    if not total or not gc:
-        return 0
-    pgc = float(gc)/int(total)  # get percent GC
-    return round(pgc)
-
-
-def compile_metrics(metrics, lengths, bases):
-    '''Fill the metrics dictionary with the results from lengths and bases'''
-    lengths['contigs'] = sorted(lengths['contigs'])
-    lengths['gaps'] = sorted(lengths['gaps'])
-    lengths['scaffolds'] = sorted(lengths['scaffolds'])
-    lengths['total'] = sorted(lengths['total'])
-    if lengths['contigs']:
-        metrics['maxcontig'] = lengths['contigs'][-1]
-        metrics['mincontig'] = lengths['contigs'][0]
-        if metrics['contigbases']:  # contig N50
-            metrics['contigN50'] = get_N50(lengths['contigs'], 
-                                           metrics['contigbases'])
-            metrics['contigN90'] = get_N90(lengths['contigs'], 
-                                           metrics['contigbases'])
-            metrics['meancontig'] = get_mean(lengths['contigs'])
-    if lengths['gaps']:
-        metrics['maxgap'] = lengths['gaps'][-1]
-        metrics['mingap'] = lengths['gaps'][0]
-        if metrics['gapbases']:  # gap N50
-            metrics['gapN50'] = get_N50(lengths['gaps'], metrics['gapbases'])
-            metrics['gapN90'] = get_N90(lengths['gaps'], metrics['gapbases'])
-            metrics['meangap'] = get_mean(lengths['gaps'])
-    if lengths['scaffolds']:
-        metrics['maxscaffold'] = lengths['scaffolds'][-1]
-        metrics['minscaffold'] = lengths['scaffolds'][0]
-        if metrics['scaffoldbases']:  # scaffold N50
-            metrics['scaffoldN50'] = get_N50(lengths['scaffolds'], 
-                                             metrics['scaffoldbases'])
-            metrics['scaffoldN90'] = get_N90(lengths['scaffolds'], 
-                                           metrics['scaffoldbases'])
-            metrics['meanscaffold'] = get_mean(lengths['scaffolds'])
-    metrics['allbases'] = bases['total']
-    metrics['maxlen'] = lengths['total'][-1]
-    metrics['minlen'] = lengths['total'][0]
-    metrics['N50'] = get_N50(lengths['total'], bases['total'])  # N50 of all
-    metrics['N90'] = get_N90(lengths['total'], bases['total'])
-    metrics['record_mean'] = get_mean(lengths['total'])
+    is_n = (seq == ord('N')) | (seq == ord('n'))
+    edges = np.flatnonzero(np.diff(is_n.view(np.int8), prepend=0, append=0))
+    starts = edges[0::2]  # edges alternate run start, run end
+    ends = edges[1::2]
+    keep = ends - starts >= min_gap
+    return starts[keep], ends[keep]
 
 
-def basic_fasta_stats(fasta, min_gap, classic):
-    '''Main method for stats calculation.  Creates data structures
+def compile_metrics(metrics, lengths, bases, nx=()):
+    '''Fill the metrics dictionary with the results from lengths and bases
 
-       and controls workflow
+       N50 and N90 are always filled, every percent in nx adds Nx and Lx
+       keys and an auN key for each kind of length
     '''
-    if not fasta:  # Assume STDIN
-        fasta = sys.stdin
-    else:
-        fasta = return_filehandle(fasta)
+    percents = [50, 90] + [x for x in nx if x not in (50, 90)]
+    for kind, prefix in LENGTH_PREFIXES:
+        counter = lengths[kind]  # empty counters give 0 for everything
+        found = counter.nx(percents)  # one pass for every Nx
+        metrics[prefix + 'N50'] = found[50][0]
+        metrics[prefix + 'N90'] = found[90][0]
+        if prefix:
+            metrics['max' + prefix] = counter.max()
+            metrics['min' + prefix] = counter.min()
+            metrics['mean' + prefix] = counter.mean()
+        else:  # all records
+            metrics['maxlen'] = counter.max()
+            metrics['minlen'] = counter.min()
+            metrics['record_mean'] = counter.mean()
+        for x in nx:
+            metrics['{}N{:g}'.format(prefix, x)] = found[x][0]
+            metrics['{}L{:g}'.format(prefix, x)] = found[x][1]
+        if nx:
+            metrics[prefix + 'auN'] = counter.aun()
+    metrics['allbases'] = bases['total']
+
+
+def new_stats():
+    '''Returns empty (metrics, lengths, bases) dictionaries'''
     bases = {'A' : 0, 'a' : 0, 'C' : 0, 'c' : 0,
              'T' : 0, 't' : 0, 'G' : 0, 'g' : 0,
              'N' : 0, 'n' : 0, 'IUPAC' : 0, 'total' : 0}
@@ -130,84 +105,156 @@ def basic_fasta_stats(fasta, min_gap, classic):
                'maxcontig' : 0, 'mincontig' : 0,
                'contigbases' : 0, 'scaffoldbases' : 0, 'gapbases' : 0,
                'allbases' : 0, 'pgc' : 0}
-    lengths = {'scaffolds' : [], 'gaps' : [], 'contigs' : [], 'total' : []}
-    scheck = 0
-    gcheck = 0
-    ccheck = 0
-    glen = 0
-    clen = 0
-    slen = 0
-    length = 0
-    i = 0
-    for record in get_seqio_fasta_record(fasta):  # get records from SeqIO
+    lengths = {'scaffolds' : LengthCounter(), 'gaps' : LengthCounter(),
+               'contigs' : LengthCounter(), 'total' : LengthCounter()}
+    return metrics, lengths, bases
+
+
+def write_record_stats(record_id, length, counts, starts, contigs, output):
+    '''Writes the per record row for record_id to binary output'''
+    gc = 0
+    n_count = 0
+    if length:
+        gc = sum(int(counts[ord(b)]) for b in 'GCgc') / length * 100
+        n_count = int(counts[ord('N')] + counts[ord('n')])
+    largest = int(contigs.max()) if len(contigs) else 0
+    output.write(b'\t'.join((record_id, '{}\t{:.2f}\t{}\t{}\t{}\n'.format(
+                     length, gc, n_count, len(starts), largest).encode())))
+
+
+def get_partial_stats(records, min_gap, per_record=None):
+    '''Returns the (metrics, lengths, bases) counts for records.
+
+       Partial results from parts of a file add up with merge_stats.  If
+       per_record is a binary handle a row with the PER_RECORD_HEADER
+       columns is written to it for every record as it is counted
+    '''
+    metrics, lengths, bases = new_stats()
+    no_gaps = np.zeros(0, dtype=np.int64)
+    for record in records:
         metrics['records'] += 1  # increment total
-        seq = record.seq
-        if seq:
-            seq = seq.upper()
-            length = len(seq)
+        seq = np.frombuffer(record.seq, dtype=np.uint8)
+        length = len(seq)
+        counts = None
+        starts = contigs = no_gaps
+        if length:
             bases['total'] += length
-            lengths['total'].append(length)
-            while True:
-                i = seq.find('N', i)  # split all sequences into contigs
-                if i < 0:
-                    if not scheck:  # not a scaffold yet
-                        lengths['contigs'].append(length)
-                        if length > 0:
-#                            print(">{}\t{}\t{}".format(record.id, i, i))
-                            metrics['contigs'] += 1
-                            metrics['contigbases'] += length
-                        for b in seq:
-                            if b in bases:
-                                bases[b] += 1
-                            else:
-                                bases['IUPAC'] += 1
-                    else:  # scaffold
-                        clen = length - ccheck
-                        if clen > 0:
-#                            print(">{}\t{}\t{}".format(record.id, i, i))
-                            lengths['contigs'].append(clen)
-                            metrics['contigs'] += 1
-                            metrics['contigbases'] += clen
-                        for b in seq[ccheck:]:
-                            if b in bases:
-                                bases[b] += 1
-                            else:
-                                bases['IUPAC'] += 1
-                    break
-                gcheck = i  # set position of gap start
-                while i < length and seq[i] == 'N':  # get gap lengths
-                    i += 1
-                glen = i - gcheck
-                if glen >= min_gap:  # check to see if this is a "gap"
-                    scheck = 1  # set check for scaffold
-                    clen = gcheck - ccheck
-                    if clen > 0:
-#                        print(">{}\t{}\t{}".format(record.id, i, i))
-                        lengths['contigs'].append(clen)
-                        metrics['contigs'] += 1
-                        metrics['contigbases'] += clen
-                    lengths['gaps'].append(glen)
-                    bases['N'] += glen
-                    metrics['gaps'] += 1
-                    metrics['gapbases'] += glen
-                    for b in seq[ccheck:gcheck]:
-                        if b in bases:
-                            bases[b] += 1
-                        else:
-                            bases['IUPAC'] += 1
-                    ccheck = i
-            if scheck:  # if scaffold as set by gap checks above
+            lengths['total'].add(length)
+            counts = count_bases(seq, bases)
+            starts, ends = find_gaps(seq, min_gap)  # split into contigs
+            contigs = np.append(starts, length) - np.insert(ends, 0, 0)
+            contigs = contigs[contigs > 0]
+            lengths['contigs'].extend(contigs)
+            metrics['contigs'] += len(contigs)
+            metrics['contigbases'] += int(contigs.sum())
+            if len(starts):  # gaps make this a scaffold
+                gaps = ends - starts
+                lengths['gaps'].extend(gaps)
+                metrics['gaps'] += len(gaps)
+                metrics['gapbases'] += int(gaps.sum())
                 metrics['scaffolds'] += 1
-                lengths['scaffolds'].append(length)
+                lengths['scaffolds'].add(length)
                 metrics['scaffoldbases'] += length
-        scheck = 0  # reset all for the next sequence yielded
-        gcheck = 0
-        ccheck = 0
-        glen = 0
-        clen = 0
-        i = 0
-        pos = 0
-    compile_metrics(metrics, lengths, bases)
+        if per_record is not None:
+            write_record_stats(record.id, length, counts, starts, contigs,
+                               per_record)
+    return metrics, lengths, bases
+
+
+def get_range_stats(fasta, start, end, min_gap, seqio=False,
+                    per_record=None):
+    '''Worker process target, get_partial_stats for the records in the
+
+       uncompressed bytes start to end of fasta.  Rows for per_record go
+       to the file per_record
+    '''
+    records = get_fastx_record(open_range(fasta, start, end), 'fasta', seqio)
+    if not per_record:
+        return get_partial_stats(records, min_gap)
+    with return_output_handle(per_record, False) as output:
+        return get_partial_stats(records, min_gap, output)
+
+
+def merge_stats(partials):
+    '''Adds up the (metrics, lengths, bases) in the list partials'''
+    metrics, lengths, bases = new_stats()
+    for part_metrics, part_lengths, part_bases in partials:
+        for key in metrics:
+            metrics[key] += part_metrics[key]
+        for key in lengths:
+            lengths[key].merge(part_lengths[key])
+        for key in bases:
+            bases[key] += part_bases[key]
+    return metrics, lengths, bases
+
+
+def get_ranges_stats(fasta, ranges, min_gap, seqio=False, processes=1,
+                     per_record=None):
+    '''Counts the (start, end) ranges of fasta in processes workers and
+
+       returns the merged (metrics, lengths, bases).  Per record rows are
+       written by each worker to a part file and appended to the binary
+       handle per_record in file order
+    '''
+    parts_dir = None
+    parts = [None] * len(ranges)
+    if per_record is not None:
+        parts_dir = tempfile.TemporaryDirectory(prefix='per_record_',
+                                                dir=os.getcwd())
+        parts = [os.path.join(parts_dir.name, '{}.tsv'.format(i))
+                 for i in range(len(ranges))]
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            partials = pool.map(get_range_stats, repeat(fasta),
+                                [start for start, end in ranges],
+                                [end for start, end in ranges],
+                                repeat(min_gap), repeat(seqio), parts)
+            result = merge_stats(partials)
+        if per_record is not None:
+            for part in parts:
+                with open(part, 'rb') as popen:
+                    shutil.copyfileobj(popen, per_record)
+        return result
+    finally:
+        if parts_dir is not None:
+            parts_dir.cleanup()
+
+
+def basic_fasta_stats(fasta, min_gap, classic, seqio=False, threads=1,
+                      processes=1, nx=(), per_record=None):
+    '''Main method for stats calculation.  Creates data structures
+
+       and controls workflow.  With processes > 1 a plain or BGZF fasta is
+       split into record aligned byte ranges counted in worker processes.
+       If per_record is a file name one row per record is streamed to it
+    '''
+    ranges = None
+    if fasta and processes > 1:
+        try:
+            ranges = get_record_ranges(fasta, processes * RANGES_PER_PROCESS)
+        except ValueError as e:
+            logger.warning('{}, using one process'.format(e))
+    output = None
+    if per_record:
+        output = return_output_handle(per_record, is_gzip_name(per_record))
+        output.write(PER_RECORD_HEADER)
+    try:
+        if ranges:
+            metrics, lengths, bases = get_ranges_stats(fasta, ranges, min_gap,
+                                                       seqio, processes,
+                                                       output)
+        else:
+            if not fasta:  # Assume STDIN
+                fasta = sys.stdin
+            else:
+                fasta = return_filehandle(fasta, threads)
+            records = get_fastx_record(fasta, 'fasta', seqio)  # get records
+            metrics, lengths, bases = get_partial_stats(records, min_gap,
+                                                        output)
+    finally:
+        if output is not None:
+            output.close()
+    compile_metrics(metrics, lengths, bases, nx)
     metrics['pgc'] = round((float(bases['G'] + bases['C'])/float(bases['total']))*100)
     if classic:
         metrics['scaffoldN50'] = metrics['N50']
@@ -237,23 +284,201 @@ def basic_fasta_stats(fasta, min_gap, classic):
                             ('Mean Gap', metrics['meangap']),
                             ('Gap N50', metrics['gapN50']),
                             ('Total Gap Length', metrics['gapbases'])])
+        for x in nx:
+            for name, prefix in (('Scaffold', ''), ('Contig', 'contig')):
+                for stat in ('N', 'L'):
+                    key = '{}{}{:g}'.format(prefix, stat, x)
+                    classic_metrics['{} {}{:g}'.format(name, stat, x)] = \
+                                                       metrics.get(key, 0)
+        if nx:
+            classic_metrics['Scaffold auN'] = metrics.get('auN', 0)
+            classic_metrics['Contig auN'] = metrics.get('contigauN', 0)
         return classic_metrics  # return GAEMR like output keys
     return metrics  # standard
 
 
+def get_sample_lengths(windows, percents):
+    '''Returns [Nx for x in percents] + [mean length] of the records of
+
+       the (lengths, gc) windows
+    '''
+    counter = LengthCounter()
+    for lengths, gc in windows:
+        counter.extend(lengths)
+    found = counter.nx(percents)
+    return [found[x][0] for x in percents] + [counter.mean()]
+
+
+def get_sample_gc(windows):
+    '''Returns the percent GC of the (lengths, gc) windows'''
+    bases = sum(int(lengths.sum()) for lengths, gc in windows)
+    if not bases:
+        return 0
+    return round(float(sum(gc for lengths, gc in windows)) / bases * 100)
+
+
+def approx_fasta_stats(fasta, seqio=False, nx=(), **sample):
+    '''Estimates records, bases, Nx, mean length and GC of fasta from the
+
+       records of a ByteSample built with the keywords sample, with
+       bootstrap confidence intervals
+    '''
+    sample = ByteSample(fasta, 'fasta', **sample)
+    windows = []  # (lengths, G + C count) of each window
+    for records in sample.get_window_records(seqio):
+        lengths = []
+        gc = 0
+        for record in records:
+            seq = np.frombuffer(record.seq, dtype=np.uint8)
+            counts = np.bincount(seq, minlength=256)
+            gc += sum(int(counts[ord(b)]) for b in 'GCgc')
+            lengths.append(len(seq))
+        windows.append((np.array(lengths, dtype=np.int64), gc))
+    resamples = sample.resample()
+    percents = [50, 90] + [x for x in nx if x not in (50, 90)]
+    metrics = OrderedDict([('approx', True), ('samples', len(windows)),
+                           ('sampled_records',
+                            sum(len(lengths) for lengths, gc in windows))])
+    add_estimate(metrics, 'records', estimate_sum(sample,
+                        [len(lengths) for lengths, gc in windows], resamples))
+    add_estimate(metrics, 'allbases', estimate_sum(sample,
+                   [int(lengths.sum()) for lengths, gc in windows], resamples))
+    values, (lows, highs) = estimate_statistic(windows, resamples,
+                               lambda w: get_sample_lengths(w, percents))
+    keys = ['N{:g}'.format(x) for x in percents] + ['record_mean']
+    for key, value, low, high in zip(keys, values, lows, highs):
+        add_estimate(metrics, key, (value, (low, high)))
+    add_estimate(metrics, 'pgc', estimate_statistic(windows, resamples,
+                                                    get_sample_gc))
+    return metrics
+
+
+def get_file_stats(fasta, min_gap, classic, seqio=False, threads=1,
+                   processes=1, nx=(), cache=None, per_record=None,
+                   sample=None):
+    '''basic_fasta_stats of fasta through the StatsCache cache, if any.
+
+       Results are keyed by min_gap, classic and nx.  The cache is skipped
+       when per_record rows have to be written.  With sample, a dictionary
+       of ByteSample keywords, the stats are estimated from a sample of
+       fasta where possible
+    '''
+    if sample is not None and not per_record:
+        try:
+            return approx_fasta_stats(fasta, seqio, nx, **sample)
+        except ValueError as e:
+            logger.warning('{}, computing exact stats'.format(e))
+    if per_record:
+        cache = None
+    return get_cached_stats(cache, 'basic_fasta_stats', fasta,
+                            [min_gap, classic, nx],
+                            lambda: basic_fasta_stats(fasta, min_gap, classic,
+                                                      seqio, threads,
+                                                      processes, nx,
+                                                      per_record))
+
+
+def batch_fasta_stats(fastas, min_gap, classic, seqio=False, threads=1,
+                      processes=1, nx=(), cache=None, sample=None):
+    '''Generator of (fasta, stats) for every file in the list fastas.
+
+       Files are counted processes at a time in a process pool and come
+       back in input order.  Files that fail are logged and skipped
+    '''
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(get_file_stats, fasta, min_gap, classic,
+                               seqio, threads, 1, nx, cache, None, sample)
+                   for fasta in fastas]
+        for fasta, future in zip(fastas, futures):
+            try:
+                yield fasta, future.result()
+            except Exception as e:
+                logger.error('Could not get stats for {}: {}'.format(fasta,
+                                                                     e))
+
+
+def write_stats_table(rows, out, human_readable):
+    '''Writes (fasta, stats) rows to binary out as JSON lines with a file
+
+       key, or as a TSV table with a header line if human_readable
+    '''
+    header = None
+    for fasta, stats in rows:
+        if not human_readable:
+            row = OrderedDict([('file', fasta)])
+            row.update(stats)
+            out.write('{}\n'.format(json.dumps(row)).encode())
+            continue
+        if header is None:
+            header = list(stats)
+            out.write('\t'.join(['file'] + header).encode() + b'\n')
+        fields = [fasta] + [str(stats.get(key, 0)) for key in header]
+        out.write('\t'.join(fields).encode() + b'\n')
+
+
+def parse_nx(ctx, param, value):
+    '''Click callback, returns the list of percents in the --nx string'''
+    if not value:
+        return []
+    try:
+        percents = [float(x) for x in value.split(',')]
+    except ValueError:
+        raise click.BadParameter('expected numbers such as 10,50,90')
+    for x in percents:
+        if not 0 < x <= 100:
+            raise click.BadParameter('{:g} is not in (0, 100]'.format(x))
+    return percents
+
+
 @click.command()
-@click.option('--fasta', help='''FASTA file to filter, can be compressed''')
+@click.option('--fasta', multiple=True,
+         help='''FASTA file to get stats for, can be compressed.  Repeat for
+         a table with one row per file''')
+@click.option('--fasta_list',
+         help='''File of FASTA file names, one per line, for a stats table''')
 @click.option('--classic', is_flag=True,
          help='''Outputs Stats with Older GAEMR Like Keys''')
 @click.option('--human_readable', is_flag=True,
          help='''Outputs Human Readable Stats''')
+@click.option('--output',
+         help='''File to write stats to (default:stdout)''')
 @click.option('--min_gap', default=10, help="""Minimum length of consecutive N's to consider a gap and create a scaffold (default: 10)""")
+@click.option('--seqio', is_flag=True,
+help='''Parse input with Biopython SeqIO instead of the native parser''')
+@click.option('--threads', default=1,
+help='''Threads for gzip/BGZF decompression (default:1)''')
+@click.option('--nx', callback=parse_nx,
+help='''Comma separated percents to add Nx, Lx and auN for, e.g. 10,50,90''')
+@click.option('--processes', default=1,
+help='''Worker processes over byte ranges of plain or BGZF FASTA, or over
+files for a table (default:1)''')
+@click.option('--per_record',
+help='''Also write a TSV of id, length, GC, N count, gaps and largest contig
+for every record to this file''')
+@click.option('--approx', is_flag=True,
+help='''Estimate stats with confidence intervals from random samples''')
+@click.option('--samples', default=SAMPLE_COUNT,
+help='''Byte ranges sampled with --approx (default:{})'''.format(SAMPLE_COUNT))
+@click.option('--sample_size', default=SAMPLE_SIZE,
+help='''Bytes per --approx sample (default:{})'''.format(SAMPLE_SIZE))
+@click.option('--seed', type=int,
+help='''Random seed for --approx, for repeatable estimates''')
+@click.option('--cache_dir',
+help='''Directory to cache stats in, unchanged files are not read again''')
+@click.option('--cache_size', default=CACHE_SIZE,
+help='''Megabytes kept in --cache_dir (default:{})'''.format(CACHE_SIZE))
 @click.option('--log_file', default='./basic_fasta_stats.log',
 help='''File to write log to.  (default:./basic_fasta_stats.log)''')
 @click.option('--log_level', default='INFO',
 help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
-def main(fasta, min_gap, classic, human_readable, log_file, log_level):
-    '''Basic FASTA Stats Generation.  MORE DOC COMING'''
+def main(fasta, fasta_list, min_gap, classic, human_readable, output, seqio,
+         threads, nx, processes, per_record, approx, samples, sample_size,
+         seed, cache_dir, cache_size, log_file, log_level):
+    '''Basic FASTA Stats Generation.  MORE DOC COMING
+
+       Several --fasta or a --fasta_list give one row per file, as JSON lines
+       or a TSV table with --human_readable
+    '''
     log_level = getattr(logging, log_level.upper(), logging.INFO)
     msg_format = '%(asctime)s|%(name)s|[%(levelname)s]: %(message)s'
     logging.basicConfig(format=msg_format, datefmt='%m-%d %H:%M',
@@ -263,16 +488,39 @@ def main(fasta, min_gap, classic, human_readable, log_file, log_level):
     log_handler.setFormatter(formatter)
     logger = logging.getLogger('basic_fasta_stats')
     logger.addHandler(log_handler)
-    if fasta and check_stdin(sys.stdin):
+    fastas = [os.path.abspath(f) for f in fasta]
+    if fasta_list:
+        fastas.extend(get_file_names(fasta_list))
+    if fastas and check_stdin(sys.stdin):
         logger.warning('stdin seen with FASTA, will process FASTA')
-    if fasta:
-        fasta = os.path.abspath(fasta)
-    if human_readable:
-        stats = basic_fasta_stats(fasta, min_gap, classic)
-        for s in stats:
-            print('{}\t{}'.format(s, stats[s]))
-    else:
-        print(json.dumps(basic_fasta_stats(fasta, min_gap, classic)))
+    cache = StatsCache(cache_dir, cache_size) if cache_dir else None
+    sample = None
+    if approx:
+        if not fastas:
+            logger.warning('stdin can not be sampled, computing exact stats')
+        elif per_record:
+            logger.warning('--per_record needs every record, computing exact '
+                           'stats')
+        else:
+            sample = {'count': samples, 'size': sample_size, 'seed': seed}
+    if len(fastas) > 1 or fasta_list:  # one table row per file
+        if per_record:
+            logger.error('--per_record needs a single FASTA')
+            sys.exit(1)
+        rows = batch_fasta_stats(fastas, min_gap, classic, seqio, threads,
+                                 processes, nx, cache, sample)
+        with return_output_handle(output, is_gzip_name(output)) as out:
+            write_stats_table(rows, out, human_readable)
+        return
+    fasta = fastas[0] if fastas else None
+    stats = get_file_stats(fasta, min_gap, classic, seqio, threads,
+                           processes, nx, cache, per_record, sample)
+    with return_output_handle(output, is_gzip_name(output)) as out:
+        if human_readable:
+            for s in stats:
+                out.write('{}\t{}\n'.format(s, stats[s]).encode())
+        else:
+            out.write('{}\n'.format(json.dumps(stats)).encode())
 
 
 if __name__ == '__main__':
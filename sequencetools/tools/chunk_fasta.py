@@ -7,34 +7,54 @@ import logging
 from signal import signal, SIGPIPE, SIG_DFL
 from ..helpers.file_helpers import (return_filehandle, create_directories,
                                      return_output_handle)
-from ..helpers.sequence_helpers import get_seqio_fasta_record
+from ..helpers.pipeline_helpers import (get_pipeline_record, PIPELINE_BATCH,
+                                        PIPELINE_DEPTH)
+from ..helpers.compression_helpers import BGZF_COMPRESS_LEVEL
+from ..helpers.output_helpers import (ChunkWriterPool, HandlePool,
+                                      open_pooled_file, MAX_OPEN_HANDLES)
+from ..helpers.sequence_helpers import get_fastx_record
+from ..helpers.index_helpers import has_fasta_index, read_fai
+from ..helpers.length_helpers import get_balanced_bins, get_ordered_bins
+from ..helpers.manifest_helpers import (get_fasta_records, get_chunk_ranges,
+                                        write_manifest)
 
 signal(SIGPIPE, SIG_DFL)
 
 
-def get_chunk(chunks_dir, total_files, gzip_me):
-    '''Return new chunk output handle'''
+def get_chunk(chunks_dir, total_files, gzip_me, threads=1,
+              level=BGZF_COMPRESS_LEVEL, pool=None):
+    '''Return new chunk output handle, BGZF compressed if gzip_me.
+
+       With a ChunkWriterPool pool the chunk is written by its workers
+    '''
     chunk = '{}/{:06d}.fasta'.format(chunks_dir, total_files)
     if gzip_me:
         chunk += '.gz'
-    return return_output_handle(chunk, gzip_me)
+    if pool is not None:
+        return pool.open(chunk)
+    return return_output_handle(chunk, gzip_me, threads, level)
 
 
 def write_chunk(record, chunk, gzip_me):
-    '''Formatter for comrpessed and text printing'''
-    output = record.format('fasta')
-    if gzip_me:
-        output = output.encode('utf-8')
-    chunk.write(output)
+    '''Writes record bytes to chunk, compressed or text'''
+    chunk.write(record.format('fasta'))
 
 
-def process_filehandle(fh, chunks, chunks_dir, gzip_me, byte_chunks):
+def process_filehandle(fh, chunks, chunks_dir, gzip_me, byte_chunks,
+                       seqio=False, threads=1, level=BGZF_COMPRESS_LEVEL,
+                       batch_size=PIPELINE_BATCH, depth=PIPELINE_DEPTH,
+                       max_pending=None):
     count = 0
     total_reads = 0
     total_files = 1
     create_directories(os.path.abspath(chunks_dir))  # create chunks directory
-    chunk = get_chunk(chunks_dir, total_files, gzip_me)
-    for record in get_seqio_fasta_record(fh):  # get SeqIO record
+    pool = None
+    if threads > 1:  # finished chunks are compressed and written by workers
+        pool = ChunkWriterPool(threads, gzip_me, level, max_pending)
+    chunk = get_chunk(chunks_dir, total_files, gzip_me, threads,
+                      level, pool)
+    for record in get_pipeline_record(fh, 'fasta', seqio,
+                                      batch_size, depth):  # get record
         total_reads += 1
         if byte_chunks:  # count is incremented by bytes of sequence
             count += len(record.seq)  # bytes of current sequence
@@ -44,31 +64,157 @@ def process_filehandle(fh, chunks, chunks_dir, gzip_me, byte_chunks):
             count = 1
             chunk.close()
             total_files += 1
-            chunk = get_chunk(chunks_dir, total_files, gzip_me)
+            chunk = get_chunk(chunks_dir, total_files, gzip_me, threads,
+                              level, pool)
         write_chunk(record, chunk, gzip_me)
     chunk.close()  # close last instance of chunk
+    if pool is not None:
+        pool.close()  # wait for the workers
     result_str = 'Output {} reads in {} files {} at a time'.format(total_reads,
                                                                    total_files,
                                                                    chunks)
     return result_str
 
 
-def chunk_fasta(fasta, chunks, chunks_dir, gzip_me, byte_chunks):
+def get_sequence_lengths(fasta, seqio=False, threads=1):
+    '''Returns [(id, length)] of fasta in file order, from a current .fai
+
+       (without empty sequences) or else a scan of the file
+    '''
+    if has_fasta_index(fasta):
+        entries = sorted(read_fai(fasta + '.fai').values(),
+                         key=lambda e: e.offset)
+        return [(entry.name, entry.length) for entry in entries]
+    return [(record.id, len(record)) for record in
+            get_fastx_record(return_filehandle(fasta, threads), 'fasta',
+                             seqio)]
+
+
+def get_chunk_numbers(lengths, n_chunks, balance):
+    '''Returns {id: chunk number} and the bases of each chunk for the
+
+       [(id, length)] lengths, packed by length into n_chunks if balance or
+       cut in file order.  Chunks are numbered from 1
+    '''
+    sizes = [length for name, length in lengths]
+    if balance:
+        bins = get_balanced_bins(sizes, n_chunks)
+    else:
+        bins = get_ordered_bins(sizes, n_chunks)
+    numbers = {}
+    bases = [0] * n_chunks
+    for (name, length), b in zip(lengths, bins):
+        if name not in numbers:  # duplicates follow the first
+            numbers[name] = b + 1
+            bases[b] += length
+    return numbers, [total for total in bases if total]
+
+
+def chunk_fasta_n(fasta, n_chunks, chunks_dir, gzip_me, balance=False,
+                  id_lists=False, seqio=False, threads=1,
+                  level=BGZF_COMPRESS_LEVEL, batch_size=PIPELINE_BATCH,
+                  depth=PIPELINE_DEPTH, max_open=MAX_OPEN_HANDLES):
+    '''Chunk FASTA file into n_chunks files of near equal bases.
+
+       Lengths come from a pre-scan or a current .fai.  If balance
+       sequences are bin packed longest first (LPT) so chunks come out
+       even whatever the order, otherwise the file is cut in order.  With
+       id_lists only the ids of each chunk are written, one per line, for
+       tools such as get_fasta_by_id.  Records keep file order in a chunk
+    '''
+    lengths = get_sequence_lengths(fasta, seqio, threads)
+    numbers, bases = get_chunk_numbers(lengths, n_chunks, balance)
+    create_directories(os.path.abspath(chunks_dir))  # create chunks directory
+    suffix = '.ids' if id_lists else '.fasta.gz' if gzip_me else '.fasta'
+    paths = ['{}/{:06d}{}'.format(chunks_dir, n + 1, suffix)
+             for n in range(n_chunks)]
+    if id_lists:
+        ids = [[] for n in range(n_chunks)]
+        for name in numbers:  # file order, without duplicates
+            ids[numbers[name] - 1].append(name)
+        for path, chunk_ids in zip(paths, ids):
+            if chunk_ids:
+                with open(path, 'wb') as ids_out:
+                    ids_out.write(b''.join(name + b'\n' for name in chunk_ids))
+        total_reads = len(numbers)
+    else:
+        total_reads = 0
+        number = 1
+        fh = return_filehandle(fasta, threads)
+        with HandlePool(lambda path, mode: open_pooled_file(path, mode,
+                                            gzip_me, level), max_open) as pool:
+            for record in get_pipeline_record(fh, 'fasta', seqio,
+                                              batch_size, depth):
+                total_reads += 1
+                # empty sequences are not in a .fai, keep them in place
+                number = numbers.get(record.id, number)
+                pool.get(paths[number - 1]).write(record.format('fasta'))
+    return 'Output {} reads in {} files of {} to {} bases'.format(
+                            total_reads, len(bases), min(bases or [0]),
+                            max(bases or [0]))
+
+
+def get_filled_chunks(lengths, chunks, byte_chunks):
+    '''Returns the chunk number of each of the [(id, length)] lengths as
+
+       process_filehandle fills files, chunks records or bases at a time
+    '''
+    count = 0
+    number = 1
+    numbers = []
+    for name, length in lengths:
+        count += length if byte_chunks else 1
+        if count > chunks:
+            count = 1
+            number += 1
+        numbers.append(number)
+    return numbers
+
+
+def chunk_fasta_manifest(fasta, manifest, chunks, byte_chunks, n_chunks=None,
+                         balance=False, threads=1):
+    '''Writes the byte ranges of each chunk of fasta to manifest instead
+
+       of copying the sequences.  Chunks are cut as chunk_fasta does, or
+       chunk_fasta_n with n_chunks, and read back with extract_chunk
+    '''
+    records = get_fasta_records(fasta, threads)
+    lengths = [(name, length) for name, length, start, end in records]
+    if n_chunks:
+        numbers, bases = get_chunk_numbers(lengths, n_chunks, balance)
+        numbers = [numbers[name] for name, length in lengths]
+    else:
+        numbers = get_filled_chunks(lengths, chunks, byte_chunks)
+    ranges = get_chunk_ranges([(start, end) for name, length, start, end
+                               in records], numbers)
+    write_manifest(manifest, fasta, ranges)
+    return 'Wrote {} reads in {} chunks as {} ranges to {}'.format(
+                          len(records), len(set(numbers)), len(ranges),
+                          manifest)
+
+
+def chunk_fasta(fasta, chunks, chunks_dir, gzip_me, byte_chunks, seqio=False,
+                threads=1, level=BGZF_COMPRESS_LEVEL,
+                batch_size=PIPELINE_BATCH, depth=PIPELINE_DEPTH,
+                max_pending=None):
     '''Chunk FASTA file.  Output files with chunks reads to chunks_dir
     
        if byte_chunks, chunk by bytes.  Will try to put chunks bytes in file.
 
-       Will not split sequences.
+       Will not split sequences.  With threads whole chunks are written by
+       a ChunkWriterPool, at most max_pending waiting
     '''
     seqio_in = sys.stdin
     fh = ''
     if not fasta:  # Check STDIN
         return process_filehandle(seqio_in, chunks, chunks_dir, 
-                                  gzip_me, byte_chunks)
+                                  gzip_me, byte_chunks, seqio, threads,
+                                  level, batch_size, depth, max_pending)
     else:  # Check FASTA
-        fh = return_filehandle(fasta)
+        fh = return_filehandle(fasta, threads)
         return process_filehandle(fh, chunks, chunks_dir, 
-                                  gzip_me, byte_chunks)
+                                  gzip_me, byte_chunks, seqio, threads,
+                                  level, batch_size, depth, max_pending)
 
 
 @click.command()
@@ -77,17 +223,47 @@ def chunk_fasta(fasta, chunks, chunks_dir, gzip_me, byte_chunks):
               default=1000)
 @click.option('--chunk_bytes', 
       help='''Try to write N sequence bytes to file.  Keeps sequence intact''')
+@click.option('--n_chunks', type=int,
+      help='''Write N files of near equal bases, needs --fasta.  Cuts the file
+in order unless --balance''')
+@click.option('--balance', is_flag=True,
+      help='''With --n_chunks pack sequences longest first into the chunk with
+the fewest bases''')
+@click.option('--id_lists', is_flag=True,
+      help='''With --n_chunks write the ids of each chunk instead of FASTA''')
+@click.option('--max_open', default=MAX_OPEN_HANDLES,
+      help='''Most --n_chunks files open at once (default:{})'''.format(
+                                                        MAX_OPEN_HANDLES))
+@click.option('--manifest',
+      help='''Write the byte ranges of each chunk to this file instead of
+chunk files, needs --fasta.  Read a chunk with extract_chunk''')
 @click.option('--chunk_dir', 
               help='''Directory to write chunks in (default:./chunks)''',
               default='./chunks')
 @click.option('--gzip_output', is_flag=True,
-              help='''Gzip output files''')
+              help='''Gzip output files (BGZF)''')
+@click.option('--seqio', is_flag=True,
+    help='''Parse input with Biopython SeqIO instead of the native parser''')
+@click.option('--batch_size', default=PIPELINE_BATCH,
+              help='''Records per parsed batch (default:1024)''')
+@click.option('--queue_depth', default=PIPELINE_DEPTH,
+    help='''Parsed batches read ahead, 0 parses inline (default:8)''')
+@click.option('--threads', default=1,
+              help='''Threads for decompression and for writing finished
+chunks concurrently (default:1)''')
+@click.option('--compress_level', default=BGZF_COMPRESS_LEVEL,
+          help='''Compression level 1-9 for --gzip_output (default:6)''')
+@click.option('--max_pending', type=int,
+              help='''Finished chunks held for the --threads writers
+(default:2 x threads)''')
 @click.option('--log_file', default='./chunk_fasta.log',
               help='''File to write log to.  (default:./chunk_fasta.log)''')
 @click.option('--log_level', default='INFO',
     help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
-def main(fasta, chunk_dir, chunk_size, gzip_output, 
-         chunk_bytes, log_file, log_level):
+def main(fasta, chunk_dir, chunk_size, gzip_output, n_chunks, balance,
+         id_lists, max_open, manifest, chunk_bytes, seqio, batch_size,
+         queue_depth, threads, compress_level, max_pending, log_file,
+         log_level):
     '''Chunk FASTA Files.
 
          cat input*.fasta | chunk_fasta.py
@@ -108,11 +284,38 @@ def main(fasta, chunk_dir, chunk_size, gzip_output,
     byte_chunks = False
     if fasta:
         fasta = os.path.abspath(fasta)
+    if n_chunks or balance or id_lists:
+        if not n_chunks or n_chunks < 1:
+            raise click.BadParameter('--balance and --id_lists need a '
+                                     'positive --n_chunks')
+        if not fasta:
+            raise click.BadParameter('--n_chunks needs --fasta, stdin can '
+                                     'not be scanned first')
     if chunk_bytes:
         chunk_size = int(chunk_bytes)
         byte_chunks = True
+    if manifest:
+        if not fasta:
+            raise click.BadParameter('--manifest needs --fasta, stdin can '
+                                     'not be read by range')
+        if id_lists:
+            raise click.BadParameter('--manifest and --id_lists are '
+                                     'different outputs, pick one')
+        result = chunk_fasta_manifest(fasta, manifest, chunk_size,
+                                      byte_chunks, n_chunks, balance,
+                                      threads)
+        logger.info(result)
+        return
+    if n_chunks:
+        result = chunk_fasta_n(fasta, n_chunks, chunk_dir, gzip_output,
+                               balance, id_lists, seqio, threads,
+                               compress_level, batch_size, queue_depth,
+                               max_open)
+        logger.info(result)
+        return
     result = chunk_fasta(fasta, chunk_size, chunk_dir, 
-                         gzip_output, byte_chunks)
+                         gzip_output, byte_chunks, seqio, threads,
+                         compress_level, batch_size, queue_depth, max_pending)
     logger.info(result)
 
 
@@ -7,31 +7,44 @@ import logging
 from signal import signal, SIGPIPE, SIG_DFL
 from ..helpers.file_helpers import (return_filehandle, create_directories, 
                                   return_output_handle)
-from ..helpers.sequence_helpers import get_seqio_fastq_record
+from ..helpers.pipeline_helpers import (get_pipeline_record, PIPELINE_BATCH,
+                                        PIPELINE_DEPTH)
+from ..helpers.sequence_helpers import get_raw_fastq_blocks
+from ..helpers.compression_helpers import BGZF_COMPRESS_LEVEL
+from ..helpers.output_helpers import ChunkWriterPool
+from ..helpers.manifest_helpers import get_fastq_ranges, write_manifest
 
 signal(SIGPIPE, SIG_DFL)
 
 
-def get_chunk(chunks_dir, total_files, gzip_me):
-    '''Return new chunk output handle'''
+def get_chunk(chunks_dir, total_files, gzip_me, threads=1,
+              level=BGZF_COMPRESS_LEVEL, pool=None):
+    '''Return new chunk output handle, BGZF compressed if gzip_me.
+
+       With a ChunkWriterPool pool the chunk is written by its workers
+    '''
     chunk = '{}/{:06d}.fastq'.format(chunks_dir, total_files)
     if gzip_me:
         chunk += '.gz'
-    return return_output_handle(chunk, gzip_me)
+    if pool is not None:
+        return pool.open(chunk)
+    return return_output_handle(chunk, gzip_me, threads, level)
 
 
 def write_chunk(record, chunk, gzip_me):
-    '''Formatter for comrpessed and text printing'''
-    output = record.format('fastq')
-    if gzip_me:
-        output = output.encode('utf-8')
-    chunk.write(output)
+    '''Writes record bytes to chunk, compressed or text'''
+    chunk.write(record.format('fastq'))
 
 
-def chunk_fastq(fastq, chunks, chunks_dir, gzip_me):
+def chunk_fastq(fastq, chunks, chunks_dir, gzip_me, seqio=False, threads=1,
+                level=BGZF_COMPRESS_LEVEL, batch_size=PIPELINE_BATCH,
+                depth=PIPELINE_DEPTH, raw=False, max_pending=None):
     '''Chunk FASTQ file.  Output files with chunks reads to chunks_dir
        
-       Returns a string with file number and read counts
+       If raw the input bytes are copied a block of records at a time.
+       With threads whole chunks are written by a ChunkWriterPool, at most
+       max_pending waiting.  Returns a string with file number and read
+       counts
     '''
     seqio_in = sys.stdin
     fh = ''
@@ -39,35 +52,76 @@ def chunk_fastq(fastq, chunks, chunks_dir, gzip_me):
     total_reads = 0
     total_files = 1
     create_directories(os.path.abspath(chunks_dir))  # create chunks directory
-    chunk = get_chunk(chunks_dir, total_files, gzip_me)
-    if not fastq:  # Check STDIN
-        for record in get_seqio_fastq_record(seqio_in):  # get SeqIO record
+    pool = None
+    if threads > 1:  # finished chunks are compressed and written by workers
+        pool = ChunkWriterPool(threads, gzip_me, level, max_pending)
+    chunk = get_chunk(chunks_dir, total_files, gzip_me, threads,
+                      level, pool)
+    if raw:  # copy whole records without parsing
+        fh = return_filehandle(fastq, threads) if fastq else seqio_in
+        for block, ends in get_raw_fastq_blocks(fh):
+            view = memoryview(block)
+            start = 0
+            done = 0  # records of block written
+            while done < len(ends):
+                if count == chunks:  # open new file close old file
+                    count = 0
+                    total_files += 1
+                    chunk.close()
+                    chunk = get_chunk(chunks_dir, total_files, gzip_me,
+                                      threads, level, pool)
+                take = min(chunks - count, len(ends) - done)
+                end = int(ends[done + take - 1])
+                chunk.write(view[start:end])
+                start = end
+                done += take
+                count += take
+                total_reads += take
+    elif not fastq:  # Check STDIN
+        for record in get_pipeline_record(seqio_in, 'fastq', seqio,
+                                          batch_size, depth):  # record
             total_reads += 1
             count += 1
             if count > chunks:  # open new file close old file
                 count = 1
                 total_files += 1
                 chunk.close()
-                chunk = get_chunk(chunks_dir, total_files, gzip_me)
+                chunk = get_chunk(chunks_dir, total_files, gzip_me, threads,
+                                  level, pool)
             write_chunk(record, chunk, gzip_me)
     else:  # Check FASTA
-        fh = return_filehandle(fastq)
-        for record in get_seqio_fastq_record(fh):  # Get SeqIO record
+        fh = return_filehandle(fastq, threads)
+        for record in get_pipeline_record(fh, 'fastq', seqio,
+                                          batch_size, depth):  # Get record
             total_reads += 1
             count += 1
             if count > chunks:  # open new file close old file
                 count = 1
                 total_files += 1
                 chunk.close()
-                chunk = get_chunk(chunks_dir, total_files, gzip_me)
+                chunk = get_chunk(chunks_dir, total_files, gzip_me, threads,
+                                  level, pool)
             write_chunk(record, chunk, gzip_me)
     chunk.close()  # close last instance of chunk
+    if pool is not None:
+        pool.close()  # wait for the workers
     result_str = 'Output {} reads in {} files {} at a time'.format(total_reads,
                                                                    total_files,
                                                                    chunks)
     return result_str
 
 
+def chunk_fastq_manifest(fastq, manifest, chunks, threads=1):
+    '''Writes the byte ranges of each chunks reads of fastq to manifest
+
+       instead of copying the reads, for extract_chunk
+    '''
+    ranges = get_fastq_ranges(fastq, chunks, threads)
+    write_manifest(manifest, fastq, ranges)
+    return 'Wrote {} reads in {} chunks {} at a time to {}'.format(
+                  sum(r[3] for r in ranges), len(ranges), chunks, manifest)
+
+
 @click.command()
 @click.option('--fastq', help='''FASTQ file to chunk, can be compressed''')
 @click.option('--chunk_size', help='''Write N reads to file (default:10000)''',
@@ -75,13 +129,34 @@ def chunk_fastq(fastq, chunks, chunks_dir, gzip_me):
 @click.option('--chunk_dir', 
               help='''Directory to write chunks in (default:./chunks)''', 
               default='./chunks')
+@click.option('--manifest',
+      help='''Write the byte range of each chunk to this file instead of
+chunk files, needs --fastq.  Read a chunk with extract_chunk''')
 @click.option('--gzip_output', is_flag=True,
-              help='''Gzip output files''')
+              help='''Gzip output files (BGZF)''')
+@click.option('--seqio', is_flag=True,
+    help='''Parse input with Biopython SeqIO instead of the native parser''')
+@click.option('--raw', is_flag=True,
+              help='''Copy four line records as they are without parsing''')
+@click.option('--batch_size', default=PIPELINE_BATCH,
+              help='''Records per parsed batch (default:1024)''')
+@click.option('--queue_depth', default=PIPELINE_DEPTH,
+    help='''Parsed batches read ahead, 0 parses inline (default:8)''')
+@click.option('--threads', default=1,
+              help='''Threads for decompression and for writing finished
+chunks concurrently (default:1)''')
+@click.option('--compress_level', default=BGZF_COMPRESS_LEVEL,
+          help='''Compression level 1-9 for --gzip_output (default:6)''')
+@click.option('--max_pending', type=int,
+              help='''Finished chunks held for the --threads writers
+(default:2 x threads)''')
 @click.option('--log_file', default='./chunk_fastq.log',
               help='''File to write log to.  (default:./chunk_fastq.log)''')
 @click.option('--log_level', default='INFO',
     help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
-def main(fastq, chunk_dir, gzip_output, chunk_size, log_file, log_level):
+def main(fastq, chunk_dir, manifest, gzip_output, chunk_size, seqio, raw,
+         batch_size, queue_depth, threads, compress_level, max_pending,
+         log_file, log_level):
     '''Chunk FASTQ Files.
 
         cat input*.fastq | chunk_fastq.py
@@ -101,7 +176,24 @@ def main(fastq, chunk_dir, gzip_output, chunk_size, log_file, log_level):
     logger.addHandler(log_handler)
     if fastq:
         fastq = os.path.abspath(fastq)
-    result = chunk_fastq(fastq, chunk_size, chunk_dir, gzip_output)
+    if manifest:
+        if not fastq:
+            raise click.BadParameter('--manifest needs --fastq, stdin can '
+                                     'not be read by range')
+        try:
+            result = chunk_fastq_manifest(fastq, manifest, chunk_size,
+                                          threads)
+        except ValueError as e:
+            logger.error(e)
+            sys.exit(1)
+        logger.info(result)
+        return
+    if raw and seqio:
+        logger.warning('--raw copies records without parsing, ignoring '
+                       '--seqio')
+    result = chunk_fastq(fastq, chunk_size, chunk_dir, gzip_output, seqio,
+                         threads, compress_level, batch_size, queue_depth,
+                         raw, max_pending)
     logger.info(result)
         
 
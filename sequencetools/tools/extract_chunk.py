@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import click
+import logging
+from signal import signal, SIGPIPE, SIG_DFL
+from ..helpers.file_helpers import return_output_handle, is_gzip_name
+from ..helpers.compression_helpers import BGZF_COMPRESS_LEVEL
+from ..helpers.manifest_helpers import read_manifest, get_range_data
+
+signal(SIGPIPE, SIG_DFL)
+
+
+def extract_chunk(read_me, ranges, output, gzip_me, threads=1,
+                  level=BGZF_COMPRESS_LEVEL):
+    '''Writes the [(start, end, records)] ranges of read_me to output,
+
+       stdout if not output.  Returns the number of bytes written
+    '''
+    total = 0
+    out = return_output_handle(output, gzip_me, threads, level)
+    try:
+        for data in get_range_data(read_me, [(start, end) for start, end,
+                                             records in ranges], threads):
+            out.write(data)
+            total += len(data)
+    finally:
+        out.close()
+    return total
+
+
+@click.command()
+@click.option('--manifest', required=True,
+              help='''Manifest written by chunk_fasta or chunk_fastq
+--manifest''')
+@click.option('--chunk', required=True, type=int,
+              help='''Number of the chunk to write, from 1''')
+@click.option('--input', 'read_me',
+              help='''Read this file instead of the manifest input, such as
+a copy on local disk''')
+@click.option('--output',
+              help='''File to write the chunk to (default:stdout)''')
+@click.option('--gzip_output', is_flag=True,
+              help='''BGZF compress output''')
+@click.option('--compress_level', default=BGZF_COMPRESS_LEVEL,
+              help='''Compression level 1-9 for --gzip_output (default:6)''')
+@click.option('--threads', default=1,
+              help='''Threads for gzip/BGZF (de)compression (default:1)''')
+@click.option('--log_file', default='./extract_chunk.log',
+              help='''File to write log to.  (default:./extract_chunk.log)''')
+@click.option('--log_level', default='INFO',
+    help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
+def main(manifest, chunk, read_me, output, gzip_output, compress_level,
+         threads, log_file, log_level):
+    '''Extract one chunk of a chunk manifest.  Only the byte ranges of the
+
+       chunk are read, at their offsets for plain and BGZF input
+
+        extract_chunk.py --manifest chunks.tsv --chunk 3 > 3.fastq
+    '''
+    log_level = getattr(logging, log_level.upper(), logging.INFO)
+    msg_format = '%(asctime)s|%(name)s|[%(levelname)s]: %(message)s'
+    logging.basicConfig(format=msg_format, datefmt='%m-%d %H:%M',
+                        level=log_level)
+    log_handler = logging.FileHandler(log_file, mode='w')
+    formatter = logging.Formatter(msg_format)
+    log_handler.setFormatter(formatter)
+    logger = logging.getLogger('extract_chunk')
+    logger.addHandler(log_handler)
+    try:
+        source, size, chunks = read_manifest(manifest)
+    except ValueError as e:
+        logger.error(e)
+        sys.exit(1)
+    if chunk not in chunks:
+        logger.error('No chunk {} in {}, it has chunks {} to {}'.format(
+                     chunk, manifest, min(chunks or [0]), max(chunks or [0])))
+        sys.exit(1)
+    read_me = os.path.abspath(read_me or source)
+    if size >= 0 and os.path.getsize(read_me) != size:
+        logger.warning('{} is not the size it had when the manifest was '
+                       'written, ranges may not be whole records'.format(
+                                                                   read_me))
+    gzip_output = gzip_output or is_gzip_name(output)
+    ranges = chunks[chunk]
+    total = extract_chunk(read_me, ranges, output, gzip_output, threads,
+                          compress_level)
+    logger.info('Wrote chunk {}, {} records in {} bytes from {}'.format(
+                chunk, sum(r[2] for r in ranges), total, read_me))
+
+
+if __name__ == '__main__':
+    main()
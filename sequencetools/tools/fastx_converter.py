@@ -6,44 +6,52 @@ import re
 import click
 import logging
 from signal import signal, SIGPIPE, SIG_DFL
-from ..helpers.file_helpers import return_filehandle, check_file_type
-from ..helpers.sequence_helpers import get_seqio_fastx_record
+from ..helpers.file_helpers import (return_filehandle, check_file_type,
+                                    return_output_handle, is_gzip_name)
+from ..helpers.sequence_helpers import solexa_to_sanger
+from ..helpers.pipeline_helpers import (get_pipeline_record, PIPELINE_BATCH,
+                                        PIPELINE_DEPTH)
+from ..helpers.compression_helpers import BGZF_COMPRESS_LEVEL
 
 
 signal(SIGPIPE, SIG_DFL)
 
 
-def record_to_stdout(record, output_type, quality):
-    '''Takes a record, the output_type and the quality and writes to stdout.
+def record_to_stdout(record, output_type, quality, output):
+    '''Takes a record, the output_type and the quality and writes to output.
 
        The quality is assigned for fasta to fastq.
     '''
     if output_type == 'fasta':
-        sys.stdout.write(record.format(output_type))  # can write normally
-        sys.stdout.flush()
+        output.write(record.format(output_type))  # can write normally
     elif output_type == 'fastq':
         length = len(record.seq)
-        qualities = [quality] * length
-        record.letter_annotations["solexa_quality"] = qualities
-        sys.stdout.write(record.format(output_type))  # can write normally
-        sys.stdout.flush()
+        record.qual = solexa_to_sanger(quality) * length
+        output.write(record.format(output_type))  # can write normally
 
 
-def fastx_converter(input_file, input_type, output_type, quality):
+def fastx_converter(input_file, input_type, output_type, quality, seqio=False,
+                    threads=1, gzip_me=False, level=BGZF_COMPRESS_LEVEL,
+                    output_file=None, batch_size=PIPELINE_BATCH,
+                    depth=PIPELINE_DEPTH):
     '''Convert input_file or stdin fasta to fastq or fastq to fasta 
     
        based on input_type
     '''
     seqio_in = sys.stdin
     fh = ''
-    if not input_file:  # Check STDIN
-        for record in get_seqio_fastx_record(seqio_in, input_type):  # Generatea
-            record_to_stdout(record, output_type, quality)
-    else:  # Check file
-        input_file = os.path.abspath(input_file)
-        fh = return_filehandle(input_file)
-        for record in get_seqio_fastx_record(fh, input_type):  # Generator
-            record_to_stdout(record, output_type, quality)
+    with return_output_handle(output_file, gzip_me, threads,
+                              level) as output:
+        if not input_file:  # Check STDIN
+            for record in get_pipeline_record(seqio_in, input_type, seqio,
+                                              batch_size, depth):
+                record_to_stdout(record, output_type, quality, output)
+        else:  # Check file
+            input_file = os.path.abspath(input_file)
+            fh = return_filehandle(input_file, threads)
+            for record in get_pipeline_record(fh, input_type, seqio,
+                                              batch_size, depth):
+                record_to_stdout(record, output_type, quality, output)
 
 
 @click.command()
@@ -53,11 +61,27 @@ def fastx_converter(input_file, input_type, output_type, quality):
               help='''Input file type.  fasta or fastq''')
 @click.option('--output_quality', default=40,
    help='''Quality to assign if converting from fasta to fastq (default:40)''')
+@click.option('--seqio', is_flag=True,
+    help='''Parse input with Biopython SeqIO instead of the native parser''')
+@click.option('--output',
+    help='''File to write to, .gz/.bgz is compressed (default:stdout)''')
+@click.option('--gzip_output', is_flag=True,
+             help='''BGZF compress output''')
+@click.option('--compress_level', default=BGZF_COMPRESS_LEVEL,
+             help='''Compression level 1-9 for --gzip_output (default:6)''')
+@click.option('--batch_size', default=PIPELINE_BATCH,
+             help='''Records per parsed batch (default:1024)''')
+@click.option('--queue_depth', default=PIPELINE_DEPTH,
+             help='''Parsed batches read ahead, 0 parses inline (default:8)''')
+@click.option('--threads', default=1,
+             help='''Threads for gzip/BGZF (de)compression (default:1)''')
 @click.option('--log_file', default='./fastx_converter.log',
              help='''File to write log to.  (default:./fastx_converter.log)''')
 @click.option('--log_level', default='INFO',
     help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
-def main(input_file, input_type, output_quality, log_file, log_level):
+def main(input_file, input_type, output_quality, seqio, output,
+         gzip_output, compress_level, batch_size, queue_depth, threads,
+         log_file, log_level):
     '''Convert FASTA to FASTQ or FASTQ to FASTA
 
         cat input.[fa|fq] | fastx_converter.py --input_type <fasta/fastq>
@@ -94,7 +118,10 @@ def main(input_file, input_type, output_quality, log_file, log_level):
                                                              input_type,
                                                              input_type_check))
             sys.exit(1)
-    fastx_converter(input_file, input_type, output_type, output_quality)
+    gzip_output = gzip_output or is_gzip_name(output)
+    fastx_converter(input_file, input_type, output_type, output_quality,
+                    seqio, threads, gzip_output, compress_level, output,
+                    batch_size, queue_depth)
 
 
 if __name__ == '__main__':
@@ -5,28 +5,39 @@ import sys
 import click
 import logging
 from signal import signal, SIGPIPE, SIG_DFL
-from ..helpers.file_helpers import return_filehandle
-from ..helpers.sequence_helpers import get_seqio_fasta_record, check_sequence_length
+from ..helpers.file_helpers import (return_filehandle, return_output_handle,
+                                    is_gzip_name)
+from ..helpers.sequence_helpers import check_sequence_length
+from ..helpers.pipeline_helpers import (get_pipeline_record, PIPELINE_BATCH,
+                                        PIPELINE_DEPTH)
+from ..helpers.compression_helpers import BGZF_COMPRESS_LEVEL
 
 signal(SIGPIPE, SIG_DFL)
 
 
-def filter_fasta_by_length(fasta, length, reverse):
+def filter_fasta_by_length(fasta, length, reverse, seqio=False, threads=1,
+                           gzip_me=False, level=BGZF_COMPRESS_LEVEL,
+                           output_file=None, batch_size=PIPELINE_BATCH,
+                           depth=PIPELINE_DEPTH):
     '''Filter FASTA file fasta >= length.
 
        If reverse, fasta <= length
     '''
     seqio_in = sys.stdin
     fh = ''
-    if not fasta:  # Check STDIN
-        for record in get_seqio_fasta_record(seqio_in):  # get SeqIO record
-            if check_sequence_length(record.seq, length, reverse):  #  length
-                print('>{}\n{}'.format(record.description, record.seq))
-    else:  # Check FASTA
-        fh = return_filehandle(fasta)
-        for record in get_seqio_fasta_record(fh):  # Get SeqIO record
-            if check_sequence_length(record.seq, length, reverse):  # length
-                print('>{}\n{}'.format(record.description, record.seq))
+    with return_output_handle(output_file, gzip_me, threads,
+                              level) as output:
+        if not fasta:  # Check STDIN
+            for record in get_pipeline_record(seqio_in, 'fasta', seqio,
+                                              batch_size, depth):
+                if check_sequence_length(len(record), length, reverse):
+                    output.write(record.format('fasta', 0))
+        else:  # Check FASTA
+            fh = return_filehandle(fasta, threads)
+            for record in get_pipeline_record(fh, 'fasta', seqio,
+                                              batch_size, depth):  # Get record
+                if check_sequence_length(len(record), length, reverse):
+                    output.write(record.format('fasta', 0))
 
 
 @click.command()
@@ -36,11 +47,26 @@ def filter_fasta_by_length(fasta, length, reverse):
     help='''Length Cutoff (default:1000)''', default=1000)
 @click.option('--reverse', is_flag=True,
     help='''Filter sequences "<=" instaed of ">="''')
+@click.option('--seqio', is_flag=True,
+    help='''Parse input with Biopython SeqIO instead of the native parser''')
+@click.option('--output',
+    help='''File to write to, .gz/.bgz is compressed (default:stdout)''')
+@click.option('--gzip_output', is_flag=True,
+    help='''BGZF compress output''')
+@click.option('--compress_level', default=BGZF_COMPRESS_LEVEL,
+    help='''Compression level 1-9 for --gzip_output (default:6)''')
+@click.option('--batch_size', default=PIPELINE_BATCH,
+    help='''Records per parsed batch (default:1024)''')
+@click.option('--queue_depth', default=PIPELINE_DEPTH,
+    help='''Parsed batches read ahead, 0 parses inline (default:8)''')
+@click.option('--threads', default=1,
+    help='''Threads for gzip/BGZF (de)compression (default:1)''')
 @click.option('--log_file', default='./filter_fasta_by_length.log',
     help='''File to write log to.  (default:./filter_fasta_by_length.log)''')
 @click.option('--log_level', default='INFO',
     help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
-def main(fasta, length, reverse, log_file, log_level):
+def main(fasta, length, reverse, seqio, output, gzip_output, compress_level,
+         batch_size, queue_depth, threads, log_file, log_level):
     '''Length Filter for FASTA Files
 
         cat input.fasta | filter_fasta_by_length.py
@@ -60,7 +86,10 @@ def main(fasta, length, reverse, log_file, log_level):
     logger.addHandler(log_handler)
     if fasta:  # if not stdin get full path
         fasta = os.path.abspath(fasta)
-    filter_fasta_by_length(fasta, length, reverse) 
+    gzip_output = gzip_output or is_gzip_name(output)
+    filter_fasta_by_length(fasta, length, reverse, seqio, threads,
+                           gzip_output, compress_level, output, batch_size,
+                           queue_depth)
 
 
 if __name__ == '__main__':
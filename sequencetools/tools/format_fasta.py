@@ -5,8 +5,11 @@ import sys
 import click
 import logging
 from signal import signal, SIGPIPE, SIG_DFL
-from ..helpers.file_helpers import return_filehandle
-from ..helpers.sequence_helpers import get_seqio_fasta_record, check_sequence_length
+from ..helpers.file_helpers import (return_filehandle, return_output_handle,
+                                    is_gzip_name)
+from ..helpers.pipeline_helpers import (get_pipeline_record, PIPELINE_BATCH,
+                                        PIPELINE_DEPTH)
+from ..helpers.compression_helpers import BGZF_COMPRESS_LEVEL
 
 signal(SIGPIPE, SIG_DFL)
 
@@ -28,18 +31,24 @@ def break_lines(sequence, regions, length):
     regions.append(my_region)
 
 
-def format_fasta(fasta, line_length):
+def format_fasta(fasta, line_length, seqio=False, threads=1, gzip_me=False,
+                 level=BGZF_COMPRESS_LEVEL, output_file=None,
+                 batch_size=PIPELINE_BATCH, depth=PIPELINE_DEPTH):
     '''Format FASTA file with sequence length line_length.
 
        will add reheader later
     '''
     fh = sys.stdin
     if fasta:  # Check STDIN
-        fh = return_filehandle(fasta)
-    for record in get_seqio_fasta_record(fh):  # Get SeqIO record
-        regions = []
-        break_lines(str(record.seq), regions, line_length)  # build regions for output
-        print('>{}\n{}'.format(record.description, '\n'.join(regions)))
+        fh = return_filehandle(fasta, threads)
+    with return_output_handle(output_file, gzip_me, threads,
+                              level) as output:
+        for record in get_pipeline_record(fh, 'fasta', seqio,
+                                          batch_size, depth):  # Get record
+            regions = []
+            break_lines(record.seq, regions, line_length)  # build regions
+            output.write(b''.join((b'>', record.description, b'\n',
+                                   b'\n'.join(regions), b'\n')))
 
 
 @click.command()
@@ -47,11 +56,26 @@ def format_fasta(fasta, line_length):
     help='''FASTA file to filter, can be compressed''')
 @click.option('--line_length',
     help='''Length Cutoff (default:80)''', default=80)
+@click.option('--seqio', is_flag=True,
+    help='''Parse input with Biopython SeqIO instead of the native parser''')
+@click.option('--output',
+    help='''File to write to, .gz/.bgz is compressed (default:stdout)''')
+@click.option('--gzip_output', is_flag=True,
+    help='''BGZF compress output''')
+@click.option('--compress_level', default=BGZF_COMPRESS_LEVEL,
+    help='''Compression level 1-9 for --gzip_output (default:6)''')
+@click.option('--batch_size', default=PIPELINE_BATCH,
+    help='''Records per parsed batch (default:1024)''')
+@click.option('--queue_depth', default=PIPELINE_DEPTH,
+    help='''Parsed batches read ahead, 0 parses inline (default:8)''')
+@click.option('--threads', default=1,
+    help='''Threads for gzip/BGZF (de)compression (default:1)''')
 @click.option('--log_file', default='./filter_fasta_by_length.log',
     help='''File to write log to.  (default:./filter_fasta_by_length.log)''')
 @click.option('--log_level', default='INFO',
     help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
-def main(fasta, line_length, log_file, log_level):
+def main(fasta, line_length, seqio, output, gzip_output, compress_level,
+         batch_size, queue_depth, threads, log_file, log_level):
     '''Format FASTA Files
 
         cat input.fasta | format_fasta.py
@@ -71,7 +95,9 @@ def main(fasta, line_length, log_file, log_level):
     logger.addHandler(log_handler)
     if fasta:  # if not stdin get full path
         fasta = os.path.abspath(fasta)
-    format_fasta(fasta, line_length) 
+    gzip_output = gzip_output or is_gzip_name(output)
+    format_fasta(fasta, line_length, seqio, threads, gzip_output,
+                 compress_level, output, batch_size, queue_depth)
 
 
 if __name__ == '__main__':
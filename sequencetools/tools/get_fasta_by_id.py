@@ -5,29 +5,47 @@ import sys
 import click
 import logging
 from signal import signal, SIGPIPE, SIG_DFL
-from ..helpers.file_helpers import load_targets_file, return_filehandle
-from ..helpers.sequence_helpers import get_seqio_fasta_record, check_sequence_id
+from ..helpers.file_helpers import (load_targets_file, return_filehandle,
+                                    return_output_handle, is_gzip_name)
+from ..helpers.sequence_helpers import filter_batch_by_id
+from ..helpers.pipeline_helpers import (get_pipeline_batches, PIPELINE_BATCH,
+                                        PIPELINE_DEPTH)
+from ..helpers.compression_helpers import BGZF_COMPRESS_LEVEL
+from ..helpers.index_helpers import has_fasta_index, get_indexed_fasta_record
 
 signal(SIGPIPE, SIG_DFL)
 
 
-def get_fasta_by_id(fasta, targets_file, reverse):
+def get_fasta_by_id(fasta, targets_file, reverse, seqio=False, threads=1,
+                    gzip_me=False, level=BGZF_COMPRESS_LEVEL, bloom=False,
+                    exact=False, output_file=None, batch_size=PIPELINE_BATCH,
+                    depth=PIPELINE_DEPTH):
     '''Get IDs from targets_file and return FASTA records from fasta
 
-       that match the loaded IDs
+       that match the loaded IDs.  If fasta has a .fai index and reverse
+       is not set, targets are read directly from their offsets
     '''
     seqio_in = sys.stdin
     fh = ''
-    targets = load_targets_file(targets_file)
-    if not fasta:  # Check STDIN
-        for record in get_seqio_fasta_record(seqio_in):  # get SeqIO record
-            if check_sequence_id(record.id, targets, reverse):  # check
-                print('>{}\n{}'.format(record.description, record.seq))
-    else:  # Check FASTA
-        fh = return_filehandle(fasta)
-        for record in get_seqio_fasta_record(fh):  # Get SeqIO record
-            if check_sequence_id(record.id, targets, reverse):  # check
-                print('>{}\n{}'.format(record.description, record.seq))
+    targets = load_targets_file(targets_file, bloom, exact)
+    with return_output_handle(output_file, gzip_me, threads,
+                              level) as output:
+        if fasta and not reverse and not seqio and has_fasta_index(fasta):
+            for record in get_indexed_fasta_record(fasta, targets):
+                output.write(record.format('fasta', 0))
+        elif not fasta:  # Check STDIN
+            batches = get_pipeline_batches(seqio_in, 'fasta', seqio,
+                                           batch_size, depth)
+            for batch in batches:  # ids checked a batch at a time
+                for record in filter_batch_by_id(batch, targets, reverse):
+                    output.write(record.format('fasta', 0))
+        else:  # Check FASTA
+            fh = return_filehandle(fasta, threads)
+            batches = get_pipeline_batches(fh, 'fasta', seqio,
+                                           batch_size, depth)  # Get records
+            for batch in batches:  # ids checked a batch at a time
+                for record in filter_batch_by_id(batch, targets, reverse):
+                    output.write(record.format('fasta', 0))
 
 
 @click.command()
@@ -36,11 +54,31 @@ def get_fasta_by_id(fasta, targets_file, reverse):
               help='''Targets file, one per line''')
 @click.option('--reverse', is_flag=True,
          help='''Reverses target behavior.  Ignore sequences in targets.txt''')
+@click.option('--seqio', is_flag=True,
+    help='''Parse input with Biopython SeqIO instead of the native parser''')
+@click.option('--bloom', is_flag=True,
+         help='''Check targets with a Bloom filter first, for huge lists''')
+@click.option('--exact_targets', is_flag=True,
+         help='''Keep target ids to rule out id hash collisions''')
+@click.option('--output',
+         help='''File to write to, .gz/.bgz is compressed (default:stdout)''')
+@click.option('--gzip_output', is_flag=True,
+         help='''BGZF compress output''')
+@click.option('--compress_level', default=BGZF_COMPRESS_LEVEL,
+         help='''Compression level 1-9 for --gzip_output (default:6)''')
+@click.option('--batch_size', default=PIPELINE_BATCH,
+         help='''Records per parsed batch (default:1024)''')
+@click.option('--queue_depth', default=PIPELINE_DEPTH,
+         help='''Parsed batches read ahead, 0 parses inline (default:8)''')
+@click.option('--threads', default=1,
+         help='''Threads for gzip/BGZF (de)compression (default:1)''')
 @click.option('--log_file', default='./get_fasta_by_id.log',
          help='''File to write log to.  (default:./get_fasta_by_id.log)''')
 @click.option('--log_level', default='INFO',
     help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
-def main(fasta, targets, reverse, log_file, log_level):
+def main(fasta, targets, reverse, seqio, bloom, exact_targets, output,
+         gzip_output, compress_level, batch_size, queue_depth, threads,
+         log_file, log_level):
     '''Get a subset of FASTA sequences from a file by id
 
         cat input.fasta | get_fasta_by_id.py --targets targets.txt
@@ -62,7 +100,10 @@ def main(fasta, targets, reverse, log_file, log_level):
         fasta = os.path.abspath(fasta)
     if targets:  # get full path to targets
         targets = os.path.abspath(targets)
-    get_fasta_by_id(fasta, targets, reverse)
+    gzip_output = gzip_output or is_gzip_name(output)
+    get_fasta_by_id(fasta, targets, reverse, seqio, threads, gzip_output,
+                    compress_level, bloom, exact_targets, output,
+                    batch_size, queue_depth)
 
 
 if __name__ == '__main__':
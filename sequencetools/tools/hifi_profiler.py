@@ -6,115 +6,552 @@ import re
 import click
 import json
 import logging
+import numpy as np
+from bisect import bisect_right
 from collections import OrderedDict
 from time import sleep
 from signal import signal, SIGPIPE, SIG_DFL
-from ..helpers.sequence_helpers import get_seqio_fastq_record
-from ..helpers.file_helpers import return_filehandle, check_stdin
+from ..helpers.sequence_helpers import get_fastx_record, get_fastq_length
+from ..helpers.file_helpers import (return_filehandle, check_stdin,
+                                    return_output_handle, is_gzip_name,
+                                    create_directories)
+from ..helpers.output_helpers import (HandlePool, open_pooled_file,
+                                      MAX_OPEN_HANDLES)
+from ..helpers.compression_helpers import BGZF_COMPRESS_LEVEL
+from ..helpers.length_helpers import LengthCounter, Histogram2D
+from ..helpers.cache_helpers import StatsCache, get_cached_stats, CACHE_SIZE
+from ..helpers.sample_helpers import (ByteSample, estimate_sum,
+                                      estimate_statistic, add_estimate,
+                                      SAMPLE_COUNT, SAMPLE_SIZE)
 
 signal(SIGPIPE, SIG_DFL) 
+logger = logging.getLogger('hifi_profiler')
+HISTOGRAM_BINS = 1024  # length bins of length_by_passes, longer in the last
+HISTOGRAM_PASSES = 255  # passes of length_by_passes, more in the last
+YIELD_ABOVE = '10000,20000'  # default --yield_above lengths
+BATCH_BYTES = 1024 * 1024  # quality or sequence bytes converted together
+MAX_QV = 93  # highest Sanger quality, read QVs are capped to it
+ERROR_PROBABILITY = 10 ** (-np.clip(np.arange(256) - 33, 0, MAX_QV) / 10.0)
+ERROR_PROBABILITY[0] = 0  # pads odd length qualities
+PAIR_ERROR_PROBABILITY = (ERROR_PROBABILITY[:, None] +
+                          ERROR_PROBABILITY[None, :]).ravel()  # two bytes
+MAX_RUN = 50  # homopolymer runs longer are counted as MAX_RUN+
+DUST_WINDOW = 64  # bases per low complexity window
+DUST_LEVEL = 20  # triplet score above which a window is low complexity
+RUN_BASES = 'ACGT'
+BASE_CODE = np.full(256, 4, dtype=np.uint8)  # 0-3 ACGT, 4 other, 5 between
+for code, base in enumerate(RUN_BASES.encode()):
+    BASE_CODE[base] = BASE_CODE[base + 32] = code  # either case
+BASE_CODE[ord('\n')] = 5
+GET_PASSES = re.compile(rb'(?:passes=|np:i:)(\d+)')  # pass count tag
 
 
-def get_mean(lengths):
-    '''Calculates the N50 of the list lengths using a running sum and
-    
-       the provided total sum of lengths total
+def get_column_label(column):
+    '''Returns the passes label of a passes + 1 histogram column'''
+    if not column:
+        return 'unknown'
+    if column == HISTOGRAM_PASSES + 1:
+        return '{}+'.format(HISTOGRAM_PASSES)
+    return str(column - 1)
+
+
+def get_length_by_passes(counts):
+    '''Returns [(passes, [(length bin, reads)])] of the Histogram2D counts
+
+       of length bin x passes + 1, column 0 holding reads without passes.
+       The last bin and passes are labelled n+ as they hold anything larger
+    '''
+    by_passes = []
+    for column in counts.sum(axis=0).nonzero()[0]:
+        label = get_column_label(column)
+        bins = []
+        for row in counts[:, column].nonzero()[0]:
+            row_label = str(row)
+            if row == HISTOGRAM_BINS - 1:
+                row_label += '+'
+            bins.append((row_label, int(counts[row, column])))
+        by_passes.append((label, bins))
+    return by_passes
+
+
+def compile_metrics(metrics, lengths, bases, bin_size, histograms=False,
+                    yield_above=()):
+    '''Fill the metrics dictionary with the results from lengths and bases,
+
+       the length and passes histograms only with histograms
+    '''
+    metrics['allbases'] = bases['total']
+    metrics['maxlen'] = lengths['total'].max()
+    metrics['minlen'] = lengths['total'].min()
+    metrics['mean'] = lengths['total'].mean()
+    metrics['mean_passes'] = lengths['passes'].mean()
+    metrics['N50'] = lengths['total'].nx([50])[50][0]
+    for minimum in yield_above:
+        metrics['yield_above_{}'.format(minimum)] = lengths['total'
+                                                    ].total_above(minimum)
+    if not histograms:
+        return
+    bins, counts = lengths['total'].bins(bin_size)
+    metrics['length_bins'] = [(str(i), int(c)) for i, c in zip(bins, counts)]
+    metrics['passes_bins'] = [(str(i), int(c)) for i, c in
+                              zip(lengths['passes'].values,
+                                  lengths['passes'].counts)]
+    metrics['length_by_passes'] = get_length_by_passes(
+                                        lengths['passes_by_len'].get_counts())
+
+
+def new_quality():
+    '''Returns the read quality totals filled by add_qualities'''
+    return {'reads': 0, 'qv_sum': 0.0, 'q20': 0, 'q30': 0,
+            'length_by_qv': Histogram2D(HISTOGRAM_BINS, MAX_QV + 1)}
+
+
+def add_qualities(quality, quals, bin_size):
+    '''Adds the read QVs of the non-empty quality strings in the list quals
+
+       to quality.  All strings are converted with one frombuffer, two
+       bytes per lookup of PAIR_ERROR_PROBABILITY, and the mean error
+       probability of each read is a reduceat over them
     '''
-    total_length = 0  # will sum bases for all 
-    number = 0
-    mean = 0
-    for l in lengths:
-        total_length += int(l)
-        number += 1
-    if number:
-        mean = total_length/number
-        return round(mean)
-    return 0  # if empty list
+    sizes = np.fromiter(map(len, quals), dtype=np.int64, count=len(quals))
+    parts = []
+    for qual in quals:
+        parts.append(qual)
+        if len(qual) & 1:
+            parts.append(b'\0')  # keep every read on a pair boundary
+    padded = sizes + (sizes & 1)
+    probability = PAIR_ERROR_PROBABILITY[np.frombuffer(b''.join(parts),
+                                                       dtype=np.uint16)]
+    errors = np.add.reduceat(probability,
+                             (np.cumsum(padded) - padded) // 2) / sizes
+    qvs = np.round(-10 * np.log10(errors), 6)  # exact Q20 reads stay 20
+    quality['reads'] += len(qvs)
+    quality['qv_sum'] += float(qvs.sum())
+    quality['q20'] += int((qvs >= 20).sum())
+    quality['q30'] += int((qvs >= 30).sum())
+    quality['length_by_qv'].extend(sizes // bin_size, qvs.astype(np.int64))
 
 
-def get_gc(gc, total):
-    '''Calculates the percentage gc'''
-    if not total or not gc:
+def get_percent(part, total):
+    '''Returns part as a percent of total rounded to 2 places, 0 if empty'''
+    if not total:
         return 0
-    pgc = float(gc)/int(total)  # get percent GC
-    return round(pgc)
+    return round(100.0 * part / total, 2)
 
 
-def compile_metrics(metrics, lengths, bases, bins, passes):
-    '''Fill the metrics dictionary with the results from lengths and bases'''
-    lengths['total'] = sorted(lengths['total'])
-    metrics['allbases'] = bases['total']
-    metrics['maxlen'] = lengths['total'][-1]
-    metrics['minlen'] = lengths['total'][0]
-    metrics['mean'] = get_mean(lengths['total'])  # N50 of all
-    metrics['mean_passes'] = get_mean(lengths['passes'])
-    metrics['passes_by_len'] = lengths['passes_by_len']  # redundant
-    metrics['length_bins'] = [ (i, bins[i]) for i in sorted(bins.keys(),
-                                                       key=lambda k: int(k)) ]
-    metrics['passes_bins'] = [ (i, passes[i]) for i in sorted(passes.keys(), 
-                                                        key=lambda k: int(k)) ]
-
-
-def hifi_profiler(fastq, bin_size, split_passes):
+def compile_quality(metrics, quality, histograms=False):
+    '''Fill the metrics dictionary with the read QV results from quality'''
+    reads = quality['reads']
+    metrics['mean_read_qv'] = 0
+    if reads:
+        metrics['mean_read_qv'] = round(quality['qv_sum'] / reads, 1)
+    metrics['reads_q20_percent'] = get_percent(quality['q20'], reads)
+    metrics['reads_q30_percent'] = get_percent(quality['q30'], reads)
+    if not histograms:
+        return
+    counts = quality['length_by_qv'].get_counts()
+    metrics['read_qv_bins'] = []
+    metrics['length_by_qv'] = []
+    for qv in counts.sum(axis=0).nonzero()[0]:
+        rows = counts[:, qv].nonzero()[0]
+        metrics['read_qv_bins'].append((str(qv), int(counts[:, qv].sum())))
+        metrics['length_by_qv'].append((str(qv), [(str(row),
+                                                   int(counts[row, qv]))
+                                                  for row in rows]))
+
+
+def new_runs():
+    '''Returns the homopolymer and low complexity totals filled by add_runs,
+
+       each by passes + 1 column
+    '''
+    columns = HISTOGRAM_PASSES + 2
+    return {'runs': np.zeros((columns, len(RUN_BASES), MAX_RUN + 1),
+                             dtype=np.int64),
+            'low_bases': np.zeros(columns), 'bases': np.zeros(columns),
+            'low_bins': Histogram2D(columns, 11)}
+
+
+def get_homopolymers(codes):
+    '''Returns (starts, lengths) of the runs of at least two equal codes
+
+       in the uint8 array codes
+    '''
+    same = np.concatenate(([False], codes[1:] == codes[:-1], [False]))
+    edges = np.flatnonzero(same[1:] != same[:-1])  # start, end, start ...
+    starts = edges[::2]
+    return starts, edges[1::2] - starts + 1
+
+
+def get_low_complexity(codes, read_starts, sizes):
+    '''Returns the bases of each read in DUST_WINDOW windows whose triplet
+
+       score, sum c(c - 1) / 2 / (triplets - 1) over the 64 triplets as in
+       DUST, is above DUST_LEVEL.  Only whole windows are scored
+    '''
+    windows = sizes // DUST_WINDOW
+    total = int(windows.sum())
+    if not total:
+        return np.zeros(len(sizes))
+    window_read = np.repeat(np.arange(len(sizes)), windows)
+    nth = np.arange(total) - np.repeat(np.cumsum(windows) - windows, windows)
+    window_starts = read_starts[window_read] + nth * DUST_WINDOW
+    bases = np.minimum(codes, 3)  # N scores as T
+    triplets = (bases[:-2] << 4) | (bases[1:-1] << 2) | bases[2:]
+    triplets = triplets[window_starts[:, None] + np.arange(DUST_WINDOW - 2)]
+    keys = triplets + (np.arange(total, dtype=np.int32) * 64)[:, None]
+    counts = np.bincount(keys.ravel(), minlength=total * 64).reshape(total, 64)
+    pairs = np.einsum('ij,ij->i', counts, counts) - (DUST_WINDOW - 2)
+    scores = pairs / 2.0 / (DUST_WINDOW - 3)  # sum of c * c less sum of c
+    return np.bincount(window_read, weights=scores > DUST_LEVEL,
+                       minlength=len(sizes)) * DUST_WINDOW
+
+
+def add_runs(runs, seqs, columns):
+    '''Adds the homopolymer runs and low complexity bases of the non-empty
+
+       sequences in the list seqs, with passes + 1 columns, to runs.  The
+       sequences are joined by newlines and encoded with one lookup so
+       runs never cross reads
+    '''
+    sizes = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+    columns = np.minimum(np.array(columns, dtype=np.int64),
+                         HISTOGRAM_PASSES + 1)
+    codes = BASE_CODE[np.frombuffer(b'\n'.join(seqs), dtype=np.uint8)]
+    read_starts = np.cumsum(sizes + 1) - sizes - 1
+    starts, lengths = get_homopolymers(codes)
+    run_codes = codes[starts]
+    keep = run_codes < len(RUN_BASES)
+    starts = starts[keep]
+    run_reads = np.searchsorted(read_starts, starts, side='right') - 1
+    keys = ((columns[run_reads] * len(RUN_BASES) + run_codes[keep]) *
+            (MAX_RUN + 1) + np.minimum(lengths[keep], MAX_RUN))
+    runs['runs'] += np.bincount(keys, minlength=runs['runs'].size
+                                ).reshape(runs['runs'].shape)
+    low = get_low_complexity(codes, read_starts, sizes)
+    runs['low_bases'] += np.bincount(columns, weights=low,
+                                     minlength=len(runs['low_bases']))
+    runs['bases'] += np.bincount(columns, weights=sizes,
+                                 minlength=len(runs['bases']))
+    runs['low_bins'].extend(columns, (low * 10 // sizes).astype(np.int64))
+
+
+def get_run_bins(counts):
+    '''Returns {base: [(run length, runs)]} of the (bases, run length)
+
+       counts of one passes column or of all
+    '''
+    run_bins = OrderedDict()
+    for code, base in enumerate(RUN_BASES):
+        run_bins[base] = [(str(run) if run < MAX_RUN else
+                           '{}+'.format(MAX_RUN), int(counts[code, run]))
+                          for run in counts[code].nonzero()[0]]
+    return run_bins
+
+
+def compile_runs(metrics, runs, histograms=False):
+    '''Fill the metrics dictionary with the homopolymer and low complexity
+
+       results from runs, by passes with histograms
+    '''
+    counts = runs['runs']
+    metrics['low_complexity_percent'] = get_percent(runs['low_bases'].sum(),
+                                                    runs['bases'].sum())
+    low_bins = runs['low_bins'].get_counts()
+    metrics['low_complexity_bins'] = [(str(i * 10), int(c)) for i, c in
+                                      enumerate(low_bins.sum(axis=0)) if c]
+    metrics['homopolymer_runs'] = get_run_bins(counts.sum(axis=0))
+    if not histograms:
+        return
+    metrics['low_complexity_by_passes'] = []
+    for column in runs['bases'].nonzero()[0]:
+        metrics['low_complexity_by_passes'].append((get_column_label(column),
+                                    get_percent(runs['low_bases'][column],
+                                                runs['bases'][column])))
+    metrics['homopolymer_runs_by_passes'] = []
+    for column in counts.sum(axis=(1, 2)).nonzero()[0]:
+        metrics['homopolymer_runs_by_passes'].append((get_column_label(column),
+                                                get_run_bins(counts[column])))
+
+
+def get_pass_label(passes, pass_bins):
+    '''Returns the file label of the pass count string passes, or of its
+
+       bin when pass_bins holds sorted bin starts, e.g. 3,5,10 gives 0-2,
+       3-4, 5-9 and 10+
+    '''
+    if passes is None:
+        return 'unknown'
+    if not pass_bins:
+        return passes
+    passes = int(passes)
+    i = bisect_right(pass_bins, passes)
+    if not i:
+        low, high = 0, pass_bins[0] - 1
+    elif i == len(pass_bins):
+        return '{}+'.format(pass_bins[-1])
+    else:
+        low, high = pass_bins[i - 1], pass_bins[i] - 1
+    if low == high:
+        return str(low)
+    return '{}-{}'.format(low, high)
+
+
+def hifi_profiler(fastq, bin_size, split_passes, seqio=False, threads=1,
+                  split_dir='.', pass_bins=(), gzip_me=False,
+                  level=BGZF_COMPRESS_LEVEL, max_open=MAX_OPEN_HANDLES,
+                  histograms=False, yield_above=(), quality=False,
+                  homopolymers=False):
     '''Main method for stats calculation.  Creates data structures
 
-       and controls workflow
+       and controls workflow.  Memory is bounded by the distinct lengths
+       and the HISTOGRAM_BINS x HISTOGRAM_PASSES length by passes counts.
+       With split_passes every read is also written to
+       split_dir/passes_<label>.fastq for its pass count label, at most
+       max_open files are open at once.  quality adds read QV stats and
+       homopolymers homopolymer run and low complexity stats
     '''
     if not fastq:  # Assume STDIN
         fastq = sys.stdin
     else:
-        fastq = return_filehandle(fastq)
+        fastq = return_filehandle(fastq, threads)
     bases = {'A': 0, 'a': 0, 'C': 0, 'c': 0,
              'T': 0, 't': 0, 'G': 0, 'g': 0,
              'N': 0, 'n': 0, 'IUPAC': 0, 'total': 0}
     metrics = {'maxlen': 0, 'minlen': 0, 'records': 0, 'mean_passes': 0,
                'mean': 0, 'allbases': 0}
-    lengths = {'length_bins': [], 'passes': [], 'total': [], 
-               'passes_bins': [], 'passes_by_len': {}}
+    lengths = {'passes': LengthCounter(), 'total': LengthCounter(),
+               'passes_by_len': Histogram2D(HISTOGRAM_BINS,
+                                            HISTOGRAM_PASSES + 2)}
     length = 0
-    bins = {}  # for plotting
-    passes = {}
-    get_passes = re.compile('passes=(\d+)')
-    for record in get_seqio_fastq_record(fastq):  # get records from SeqIO
+    pool = None
+    split_paths = {}  # pass count: output file
+    if split_passes:
+        create_directories(os.path.abspath(split_dir))
+        suffix = '.fastq.gz' if gzip_me else '.fastq'
+        pool = HandlePool(lambda path, mode: open_pooled_file(path, mode,
+                                                    gzip_me, level), max_open)
+    quals = None
+    seqs = None
+    batch_bytes = 0
+    if quality:
+        quality = new_quality()
+        quals = []  # qualities of the next add_qualities batch
+    if homopolymers:
+        runs = new_runs()
+        seqs = []  # sequences of the next add_runs batch
+        seq_columns = []
+    if (pool is None and not seqio and not quality and
+            not homopolymers):  # header and length are enough
+        reads = ((desc, length, None) for desc, length in
+                 get_fastq_length(fastq))
+    else:
+        reads = ((record.description, len(record), record) for record in
+                 get_fastx_record(fastq, 'fastq', seqio))
+    missing = 0  # reads without a pass count
+    for desc, length, record in reads:
         metrics['records'] += 1  # increment total
-        seq = record.seq
-        desc = record.description  # get header description to get passes
-        if not desc:
-            sys.stderr.write('NO DESCRIPTION FIELD NOT CALCULATING PASSES!\n')
+        my_passes = GET_PASSES.search(desc)  # passes from the description
+        column = 0  # passes + 1 in passes_by_len, 0 without passes
+        if my_passes is None:
+            missing += 1
         else:
-            my_passes = get_passes.search(desc)
-            my_passes = my_passes.groups(1)[0]
-            lengths['passes'].append(int(my_passes))
-            if my_passes not in passes:
-                passes[my_passes] = 0
-                lengths['passes_by_len'][my_passes] = []
-            passes[my_passes] += 1
-            lengths['passes_by_len'][my_passes].append(len(seq))
-        if seq:
-            seq = seq.upper()
-            length = len(seq)  # cast as an int
+            my_passes = my_passes.group(1).decode()
+            column = int(my_passes) + 1
+            lengths['passes'].add(column - 1)
+        lengths['passes_by_len'].add(length // bin_size, column)
+        if length:
             bases['total'] += length
-            lengths['total'].append(length)
-            bin_me = str(int(length/bin_size))  # bin number as an int
-            if bin_me not in bins:
-                bins[bin_me] = 0
-            bins[bin_me] += 1
-    compile_metrics(metrics, lengths, bases, bins, passes)
+            lengths['total'].add(length)
+            if quals is not None:
+                quals.append(record.qual)
+            if seqs is not None:
+                seqs.append(record.seq)
+                seq_columns.append(column)
+            batch_bytes += length
+            if batch_bytes >= BATCH_BYTES:
+                if quals:
+                    add_qualities(quality, quals, bin_size)
+                    quals = []
+                if seqs:
+                    add_runs(runs, seqs, seq_columns)
+                    seqs = []
+                    seq_columns = []
+                batch_bytes = 0
+        if pool is not None:
+            if my_passes not in split_paths:
+                split_paths[my_passes] = os.path.join(split_dir, 'passes_' +
+                                 get_pass_label(my_passes, pass_bins) + suffix)
+            pool.get(split_paths[my_passes]).write(record.format('fastq'))
+    if missing:
+        logger.warning('{} reads without a passes= or np:i: tag'.format(
+                                                                    missing))
+    if pool is not None:
+        pool.close()
+        logger.info('Wrote reads to {} files in {}'.format(len(pool.paths),
+                                                           split_dir))
+    compile_metrics(metrics, lengths, bases, bin_size, histograms, yield_above)
+    if quality:
+        if quals:
+            add_qualities(quality, quals, bin_size)
+        compile_quality(metrics, quality, histograms)
+    if homopolymers:
+        if seqs:
+            add_runs(runs, seqs, seq_columns)
+        compile_runs(metrics, runs, histograms)
 #    metrics['pgc'] = round((float(bases['G'] + bases['C'])/float(bases['total']))*100)
     return metrics  # standard
 
 
+def get_histogram(per_window, bins):
+    '''Returns a (windows, bins) array of counts of the integer arrays in
+
+       the list per_window, values past the last bin go to the last bin
+    '''
+    return np.array([np.bincount(np.minimum(values, bins - 1),
+                                 minlength=bins) for values in per_window])
+
+
+def get_bin_estimates(sample, per_window, resamples):
+    '''Returns ([(bin, estimate)], [(low, high)]) for the bins of the
+
+       integer arrays per_window that were seen in the sample
+    '''
+    bins = max([int(values.max()) + 1 for values in per_window
+                if len(values)] or [1])
+    counts = get_histogram(per_window, bins)
+    estimates, (lows, highs) = estimate_sum(sample, counts, resamples)
+    seen = counts.sum(axis=0).nonzero()[0]
+    return ([(str(i), estimates[i]) for i in seen],
+            [(lows[i], highs[i]) for i in seen])
+
+
+def get_sample_lengths(windows):
+    '''Returns [N50, mean length, mean passes] of the (lengths, passes)
+
+       windows
+    '''
+    counter = LengthCounter()
+    passes = LengthCounter()
+    for lengths, read_passes in windows:
+        counter.extend(lengths)
+        passes.extend(read_passes)
+    return [counter.nx([50])[50][0], counter.mean(), passes.mean()]
+
+
+def approx_hifi_profiler(fastq, bin_size, seqio=False, histograms=False,
+                         **sample):
+    '''Estimates reads, bases, N50, mean length and passes, and with
+
+       histograms the length and passes histograms, of fastq from the reads
+       of a ByteSample built with the keywords sample, with bootstrap
+       confidence intervals
+    '''
+    sample = ByteSample(fastq, 'fastq', **sample)
+    windows = []  # (lengths, passes) of each window
+    for records in sample.get_window_records(seqio):
+        lengths = []
+        read_passes = []
+        for record in records:
+            lengths.append(len(record.seq))
+            found = GET_PASSES.search(record.description)
+            if found:
+                read_passes.append(int(found.group(1)))
+        windows.append((np.array(lengths, dtype=np.int64),
+                        np.array(read_passes, dtype=np.int64)))
+    resamples = sample.resample()
+    metrics = OrderedDict([('approx', True), ('samples', len(windows)),
+                           ('sampled_records',
+                            sum(len(lengths) for lengths, p in windows))])
+    add_estimate(metrics, 'records', estimate_sum(sample,
+                          [len(lengths) for lengths, p in windows], resamples))
+    add_estimate(metrics, 'allbases', estimate_sum(sample,
+                     [int(lengths.sum()) for lengths, p in windows],
+                     resamples))
+    values, (lows, highs) = estimate_statistic(windows, resamples,
+                                               get_sample_lengths)
+    for key, value, low, high in zip(('N50', 'mean', 'mean_passes'), values,
+                                     lows, highs):
+        add_estimate(metrics, key, (value, (low, high)))
+    if not histograms:
+        return metrics
+    add_estimate(metrics, 'length_bins', get_bin_estimates(sample,
+                     [lengths // bin_size for lengths, p in windows],
+                     resamples))
+    add_estimate(metrics, 'passes_bins', get_bin_estimates(sample,
+                     [read_passes for lengths, read_passes in windows],
+                     resamples))
+    return metrics
+
+
+def parse_int_list(ctx, param, value):
+    '''Click callback, returns the sorted integers of a comma separated
+
+       option such as --pass_bins
+    '''
+    if not value:
+        return []
+    try:
+        return sorted(set(int(x) for x in value.split(',')))
+    except ValueError:
+        raise click.BadParameter('expected integers such as 3,5,10')
+
+
 @click.command()
 @click.option('--fastq', help='''FASTA file to filter, can be compressed''')
 @click.option('--human_readable', is_flag=True,
          help='''Outputs Human Readable Stats''')
+@click.option('--output',
+         help='''File to write stats to (default:stdout)''')
 @click.option('--bin_size', default=1000, help="""Histogram Bin Size (default: 1000)""")
 @click.option('--split_passes', is_flag=True, help="""Outputs reads into files based on the number of passes.""")
+@click.option('--split_dir', default='.',
+help='''Directory for --split_passes files (default:.)''')
+@click.option('--pass_bins', callback=parse_int_list,
+help='''Comma separated bin starts for --split_passes, e.g. 3,5,10 writes
+0-2, 3-4, 5-9 and 10+ (default: one file per pass count)''')
+@click.option('--gzip_output', is_flag=True,
+help='''BGZF compress --split_passes files''')
+@click.option('--compress_level', default=BGZF_COMPRESS_LEVEL,
+help='''Compression level 1-9 for --gzip_output (default:6)''')
+@click.option('--max_open', default=MAX_OPEN_HANDLES,
+help='''Most --split_passes files open at once (default:{})'''.format(
+                                                        MAX_OPEN_HANDLES))
+@click.option('--histograms', is_flag=True,
+help='''Add length, passes and length by passes histograms to the summary''')
+@click.option('--yield_above', default=YIELD_ABOVE, callback=parse_int_list,
+help='''Comma separated lengths to report the bases in reads of at least
+(default:{})'''.format(YIELD_ABOVE))
+@click.option('--quality', is_flag=True,
+help='''Add mean read QV and percent of reads of at least Q20 and Q30, with
+--histograms read QV and length by read QV histograms''')
+@click.option('--homopolymers', is_flag=True,
+help='''Add homopolymer (2+) run lengths per base and low complexity (DUST
+like) percent of bases and reads, by passes with --histograms''')
+@click.option('--seqio', is_flag=True,
+help='''Parse input with Biopython SeqIO instead of the native parser''')
+@click.option('--threads', default=1,
+help='''Threads for gzip/BGZF decompression (default:1)''')
+@click.option('--approx', is_flag=True,
+help='''Estimate stats with confidence intervals from random samples''')
+@click.option('--samples', default=SAMPLE_COUNT,
+help='''Byte ranges sampled with --approx (default:{})'''.format(SAMPLE_COUNT))
+@click.option('--sample_size', default=SAMPLE_SIZE,
+help='''Bytes per --approx sample (default:{})'''.format(SAMPLE_SIZE))
+@click.option('--seed', type=int,
+help='''Random seed for --approx, for repeatable estimates''')
+@click.option('--cache_dir',
+help='''Directory to cache stats in, unchanged files are not read again''')
+@click.option('--cache_size', default=CACHE_SIZE,
+help='''Megabytes kept in --cache_dir (default:{})'''.format(CACHE_SIZE))
 @click.option('--log_file', default='./hifi_profiler.log',
 help='''File to write log to.  (default:./hifi_profiler.log)''')
 @click.option('--log_level', default='INFO',
 help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
-def main(fastq, human_readable, bin_size, split_passes, log_file, log_level):
+def main(fastq, human_readable, output, bin_size, split_passes, split_dir,
+         pass_bins, gzip_output, compress_level, max_open, histograms,
+         yield_above, quality, homopolymers, seqio, threads, approx, samples,
+         sample_size, seed, cache_dir, cache_size, log_file, log_level):
     '''Reads HiFi data and produces metrics about passes.  MORE DOC COMING'''
     log_level = getattr(logging, log_level.upper(), logging.INFO)
     msg_format = '%(asctime)s|%(name)s|[%(levelname)s]: %(message)s'
@@ -123,18 +560,45 @@ def main(fastq, human_readable, bin_size, split_passes, log_file, log_level):
     log_handler = logging.FileHandler(log_file, mode='w')
     formatter = logging.Formatter(msg_format)
     log_handler.setFormatter(formatter)
-    logger = logging.getLogger('hifi_profiler')
     logger.addHandler(log_handler)
     if fastq and check_stdin(sys.stdin):
         logger.warning('stdin seen with FASTQ, will process FASTQ')
     if fastq:
         fastq = os.path.abspath(fastq)
-    stats = hifi_profiler(fastq, bin_size, split_passes)
-    if human_readable:
-        for s in stats:
-            print('{}\t{}'.format(s, stats[s]))
-    else:
-        print(json.dumps(stats))
+    stats = None
+    if approx and not fastq:
+        logger.warning('stdin can not be sampled, computing exact stats')
+    elif approx and split_passes:
+        logger.warning('--split_passes needs every read, computing exact '
+                       'stats')
+    elif approx:
+        try:
+            stats = approx_hifi_profiler(fastq, bin_size, seqio, histograms,
+                                         count=samples, size=sample_size,
+                                         seed=seed)
+        except ValueError as e:
+            logger.warning('{}, computing exact stats'.format(e))
+    cache = None
+    if cache_dir and not split_passes:  # split files have to be written
+        cache = StatsCache(cache_dir, cache_size)
+    if stats is None:
+        stats = get_cached_stats(cache, 'hifi_profiler', fastq,
+                                 [bin_size, histograms, yield_above,
+                                  quality, homopolymers],
+                                 lambda: hifi_profiler(fastq, bin_size,
+                                                       split_passes, seqio,
+                                                       threads, split_dir,
+                                                       pass_bins, gzip_output,
+                                                       compress_level,
+                                                       max_open, histograms,
+                                                       yield_above, quality,
+                                                       homopolymers))
+    with return_output_handle(output, is_gzip_name(output)) as out:
+        if human_readable:
+            for s in stats:
+                out.write('{}\t{}\n'.format(s, stats[s]).encode())
+        else:
+            out.write('{}\n'.format(json.dumps(stats)).encode())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+
+from signal import signal, SIGPIPE, SIG_DFL
+from ..helpers.cli_helpers import get_index_command
+from ..helpers.index_helpers import index_fasta
+
+signal(SIGPIPE, SIG_DFL)
+
+main = get_index_command('fasta', index_fasta, 'sequences',
+    '''Index FASTA Files.  Writes a samtools compatible input.fasta.fai
+
+       and input.fasta.gzi for BGZF input
+
+        index_fasta.py --fasta input.fasta
+    ''')
+
+
+if __name__ == '__main__':
+    main()
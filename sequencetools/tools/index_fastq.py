@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+
+from signal import signal, SIGPIPE, SIG_DFL
+from ..helpers.cli_helpers import get_index_command
+from ..helpers.index_helpers import index_fastq
+
+signal(SIGPIPE, SIG_DFL)
+
+main = get_index_command('fastq', index_fastq, 'reads',
+    '''Index FASTQ Files.  Writes input.fastq.fqi with the offset of
+
+       every record by id hash, used by get_fastq_by_id and subset_fastq
+
+        index_fastq.py --fastq input.fastq
+    ''')
+
+
+if __name__ == '__main__':
+    main()
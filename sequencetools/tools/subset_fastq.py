@@ -5,38 +5,53 @@ import sys
 import click
 import logging
 from signal import signal, SIGPIPE, SIG_DFL
-from ..helpers.file_helpers import return_filehandle
-from ..helpers.sequence_helpers import get_seqio_fastq_record
+from ..helpers.file_helpers import (return_filehandle, return_output_handle,
+                                    is_gzip_name)
+from ..helpers.pipeline_helpers import (get_pipeline_record, PIPELINE_BATCH,
+                                        PIPELINE_DEPTH)
+from ..helpers.compression_helpers import BGZF_COMPRESS_LEVEL
+from ..helpers.index_helpers import has_fastq_index, get_indexed_fastq_subset
 
 signal(SIGPIPE, SIG_DFL)
 
+INDEXED_SUBSET_MIN = 100  # below this streaming reads less than seeking
 
-def subset_fastq(fastq, subset):
+
+def subset_fastq(fastq, subset, seqio=False, threads=1, gzip_me=False,
+                 level=BGZF_COMPRESS_LEVEL, output_file=None,
+                 batch_size=PIPELINE_BATCH, depth=PIPELINE_DEPTH):
     '''Subset FASTQ file.  Pick 1/subset reads.
 
-       If reverse, fasta <= length
+       Sparse subsets of a fastq with a .fqi index seek to each read
     '''
     seqio_in = sys.stdin
     fh = ''
     count = 0
     total = 0
-    if not fastq:  # Check STDIN
-        for record in get_seqio_fastq_record(seqio_in):  # get SeqIO record
-            count += 1
-            if count == subset:
-                count = 0
-                total += 1
-                sys.stdout.write(record.format('fastq'))
-                sys.stdout.flush()
-    else:  # Check FASTA
-        fh = return_filehandle(fastq)
-        for record in get_seqio_fastq_record(fh):  # Get SeqIO record
-            count += 1
-            if count == subset:
-                count = 0
+    with return_output_handle(output_file, gzip_me, threads,
+                              level) as output:
+        if (fastq and subset >= INDEXED_SUBSET_MIN and not seqio and
+                has_fastq_index(fastq)):
+            for record in get_indexed_fastq_subset(fastq, subset):
                 total += 1
-                sys.stdout.write(record.format('fastq'))
-                sys.stdout.flush()
+                output.write(record.format('fastq'))
+        elif not fastq:  # Check STDIN
+            for record in get_pipeline_record(seqio_in, 'fastq', seqio,
+                                              batch_size, depth):
+                count += 1
+                if count == subset:
+                    count = 0
+                    total += 1
+                    output.write(record.format('fastq'))
+        else:  # Check FASTA
+            fh = return_filehandle(fastq, threads)
+            for record in get_pipeline_record(fh, 'fastq', seqio,
+                                              batch_size, depth):  # Get record
+                count += 1
+                if count == subset:
+                    count = 0
+                    total += 1
+                    output.write(record.format('fastq'))
     return 'Output {} reads'.format(total)
 
 
@@ -45,11 +60,26 @@ def subset_fastq(fastq, subset):
               help='''FASTQ file to subset, can be compressed''')
 @click.option('--subset', metavar = '<INT>',
               help='''Take every N reads (default:10)''', default=10)
+@click.option('--seqio', is_flag=True,
+    help='''Parse input with Biopython SeqIO instead of the native parser''')
+@click.option('--output',
+    help='''File to write to, .gz/.bgz is compressed (default:stdout)''')
+@click.option('--gzip_output', is_flag=True,
+              help='''BGZF compress output''')
+@click.option('--compress_level', default=BGZF_COMPRESS_LEVEL,
+              help='''Compression level 1-9 for --gzip_output (default:6)''')
+@click.option('--batch_size', default=PIPELINE_BATCH,
+              help='''Records per parsed batch (default:1024)''')
+@click.option('--queue_depth', default=PIPELINE_DEPTH,
+    help='''Parsed batches read ahead, 0 parses inline (default:8)''')
+@click.option('--threads', default=1,
+              help='''Threads for gzip/BGZF (de)compression (default:1)''')
 @click.option('--log_file', metavar = '<FILE>', default='./subset_fastq.log',
               help='''File to write log to.  (default:./subset_fastq.log)''')
 @click.option('--log_level', default='INFO',
     help='''Log level: DEBUG, INFO, WARNING, ERROR, CRITICAL (default:INFO)''')
-def main(fastq, subset, log_file, log_level):
+def main(fastq, subset, seqio, output, gzip_output, compress_level,
+         batch_size, queue_depth, threads, log_file, log_level):
     '''Subset FASTQ Files.
 
         cat input*.fastq | subset_fastq.py
@@ -69,7 +99,10 @@ def main(fastq, subset, log_file, log_level):
     logger.addHandler(log_handler)
     if fastq:
         fastq = os.path.abspath(fastq)
-    logger.info(subset_fastq(fastq, subset))
+    gzip_output = gzip_output or is_gzip_name(output)
+    logger.info(subset_fastq(fastq, subset, seqio, threads, gzip_output,
+                             compress_level, output, batch_size,
+                             queue_depth))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,435 @@
+import io
+import os
+import json
+import gzip
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from sequencetools.helpers.compression_helpers import BgzfWriter
+from sequencetools.helpers.cache_helpers import StatsCache
+from sequencetools.helpers.file_helpers import get_file_names
+from sequencetools.helpers.range_helpers import get_record_ranges
+from sequencetools.tools import basic_fasta_stats as basic_fasta_stats_module
+from sequencetools.tools.basic_fasta_stats import (basic_fasta_stats,
+                                                   count_bases, find_gaps,
+                                                   get_range_stats,
+                                                   merge_stats, parse_nx,
+                                                   batch_fasta_stats,
+                                                   write_stats_table,
+                                                   get_file_stats,
+                                                   get_ranges_stats,
+                                                   approx_fasta_stats, main)
+
+BASES = 'ACGTN'
+
+
+def classic_split(seq, min_gap):
+    '''Contig and gap lengths of seq by walking it a base at a time, as
+
+       basic_fasta_stats did before it was vectorized
+    '''
+    seq = seq.upper()
+    contigs = []
+    gaps = []
+    start = 0
+    i = 0
+    while i < len(seq):
+        if seq[i] != 'N':
+            i += 1
+            continue
+        gap_start = i
+        while i < len(seq) and seq[i] == 'N':
+            i += 1
+        if i - gap_start >= min_gap:
+            if gap_start > start:
+                contigs.append(gap_start - start)
+            gaps.append(i - gap_start)
+            start = i
+    if len(seq) > start:
+        contigs.append(len(seq) - start)
+    return contigs, gaps
+
+
+def split(seq, min_gap):
+    array = np.frombuffer(seq.encode(), dtype=np.uint8)
+    starts, ends = find_gaps(array, min_gap)
+    contigs = np.append(starts, len(array)) - np.insert(ends, 0, 0)
+    return contigs[contigs > 0].tolist(), (ends - starts).tolist()
+
+
+def random_seq(rng, size):
+    '''Sequence with mixed case, IUPAC codes and N runs of many lengths'''
+    parts = []
+    while sum(len(part) for part in parts) < size:
+        if rng.randint(0, 3):
+            parts.append(''.join(rng.choice(list('ACGTacgtRYKM'),
+                                            rng.randint(1, 40))))
+        else:
+            parts.append(''.join(rng.choice(list('Nn'), rng.randint(1, 25))))
+    return ''.join(parts)
+
+
+GAP_CASES = ['ACGT', 'NNNN', 'nnnn', 'NNNNACGT', 'ACGTNNNN', 'ANA', 'ANNA',
+             'ANNNA', 'NnNnA', 'AnnnNNNNNNNNNnnnnA', 'NANNANNNANNNNA', 'N',
+             'A']
+
+
+@pytest.mark.parametrize('seq', GAP_CASES)
+@pytest.mark.parametrize('min_gap', [1, 2, 3, 4, 10])
+def test_find_gaps_matches_classic_edge_cases(seq, min_gap):
+    assert split(seq, min_gap) == classic_split(seq, min_gap)
+
+
+def test_find_gaps_gap_of_exactly_min_gap():
+    starts, ends = find_gaps(np.frombuffer(b'ACNNNGT', dtype=np.uint8), 3)
+    assert starts.tolist() == [2] and ends.tolist() == [5]
+    starts, ends = find_gaps(np.frombuffer(b'ACNNNGT', dtype=np.uint8), 4)
+    assert not len(starts) and not len(ends)
+
+
+@pytest.mark.parametrize('min_gap', [1, 5, 10, 30])
+def test_find_gaps_matches_classic_random(min_gap):
+    rng = np.random.RandomState(min_gap)
+    for _ in range(50):
+        seq = random_seq(rng, 500)
+        assert split(seq, min_gap) == classic_split(seq, min_gap)
+
+
+def test_count_bases_matches_classic():
+    rng = np.random.RandomState(3)
+    seq = random_seq(rng, 5000) + 'WSBDHV-'
+    bases = dict.fromkeys(list(BASES) + ['IUPAC'], 0)
+    count_bases(np.frombuffer(seq.encode(), dtype=np.uint8), bases)
+    upper = seq.upper()
+    expected = {base: upper.count(base) for base in BASES}
+    expected['IUPAC'] = len(seq) - sum(expected.values())
+    assert bases == expected
+
+
+def write_fasta(tmp_path, seqs):
+    path = tmp_path / 'assembly.fa'
+    path.write_bytes(b''.join(b'>s%d\n%s\n' % (i, seq.encode())
+                              for i, seq in enumerate(seqs)))
+    return str(path)
+
+
+@pytest.mark.parametrize('min_gap', [1, 10])
+def test_stats_match_classic_split(tmp_path, min_gap):
+    rng = np.random.RandomState(4)
+    seqs = [random_seq(rng, rng.randint(1, 2000)) for _ in range(40)]
+    seqs.append('NNNNNNNNNNNNNNNNNNNN')  # a record that is all gap
+    stats = basic_fasta_stats(write_fasta(tmp_path, seqs), min_gap, False)
+    contigs = []
+    gaps = []
+    scaffolds = 0
+    for seq in seqs:
+        seq_contigs, seq_gaps = classic_split(seq, min_gap)
+        contigs.extend(seq_contigs)
+        gaps.extend(seq_gaps)
+        scaffolds += bool(seq_gaps)
+    assert stats['records'] == len(seqs)
+    assert stats['contigs'] == len(contigs)
+    assert stats['contigbases'] == sum(contigs)
+    assert stats['maxcontig'] == max(contigs)
+    assert stats['mincontig'] == min(contigs)
+    assert stats['gaps'] == len(gaps)
+    assert stats['gapbases'] == sum(gaps)
+    assert stats['maxgap'] == max(gaps)
+    assert stats['scaffolds'] == scaffolds
+    assert stats['allbases'] == sum(len(seq) for seq in seqs)
+
+
+def test_classic_keys_follow_the_default_metrics(tmp_path):
+    fasta = write_fasta(tmp_path, ['ACGTNNNNNNNNNNNNACGTA', 'GGCC', 'nnA'])
+    stats = basic_fasta_stats(fasta, 10, False)
+    classic = basic_fasta_stats(fasta, 10, True)
+    assert classic['Scaffolds'] == stats['records'] == 3
+    assert classic['Total Scaffold Length'] == stats['allbases'] == 28
+    assert classic['Contigs'] == stats['contigs'] == 4
+    assert classic['Captured Gaps'] == stats['gaps'] == 1
+    assert classic['Total Gap Length'] == stats['gapbases'] == 12
+    assert classic['Assembly GC'] == stats['pgc'] == round(8 / 28 * 100)
+
+
+def make_assembly(tmp_path, bgzf, count=300, seed=5):
+    '''Wrapped FASTA of count scaffolds, plain or BGZF, over 64 KB so the
+
+       BGZF file has many blocks
+    '''
+    rng = np.random.RandomState(seed)
+    records = []
+    for i in range(count):
+        seq = random_seq(rng, rng.randint(1, 3000)).encode()
+        lines = b''.join(seq[j:j + 60] + b'\n'
+                         for j in range(0, len(seq), 60))
+        records.append(b'>scaffold%d\n%s' % (i, lines))
+    data = b''.join(records)
+    path = str(tmp_path / ('assembly.fa' + ('.gz' if bgzf else '')))
+    if bgzf:
+        with BgzfWriter(path) as writer:
+            writer.write(data)
+    else:
+        with open(path, 'wb') as fopen:
+            fopen.write(data)
+    return path, data
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_record_ranges_cover_the_file_at_record_starts(tmp_path, bgzf):
+    fasta, data = make_assembly(tmp_path, bgzf)
+    ranges = get_record_ranges(fasta, 16)
+    assert len(ranges) == 16
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    assert all(end == start for (_, end), (start, _) in zip(ranges[:-1],
+                                                           ranges[1:]))
+    assert all(data[start:start + 1] == b'>' for start, _ in ranges)
+
+
+def test_more_ranges_than_records(tmp_path):
+    fasta = write_fasta(tmp_path, ['ACGT', 'NNNNNNNNNNNNGG'])
+    ranges = get_record_ranges(fasta, 8)
+    assert ranges == [(0, 9), (9, 28)]
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_merged_range_stats_match_one_pass(tmp_path, bgzf):
+    fasta, _ = make_assembly(tmp_path, bgzf)
+    expected = get_range_stats(fasta, 0, 10 ** 9, 10)
+    partials = [get_range_stats(fasta, start, end, 10)
+                for start, end in get_record_ranges(fasta, 7)]
+    metrics, lengths, bases = merge_stats(partials)
+    assert metrics == expected[0] and bases == expected[2]
+    for key, counter in lengths.items():
+        expected[1][key].compact()
+        assert counter.values.tolist() == expected[1][key].values.tolist()
+        assert counter.counts.tolist() == expected[1][key].counts.tolist()
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+@pytest.mark.parametrize('classic', [False, True])
+def test_processes_give_the_serial_stats(tmp_path, bgzf, classic):
+    fasta, _ = make_assembly(tmp_path, bgzf)
+    serial = basic_fasta_stats(fasta, 10, classic)
+    assert basic_fasta_stats(fasta, 10, classic, processes=3) == serial
+
+
+def test_plain_gzip_falls_back_to_one_process(tmp_path, caplog):
+    fasta = tmp_path / 'assembly.fa.gz'
+    fasta.write_bytes(gzip.compress(b'>a\nACGTNNNNNNNNNNAC\n>b\nGG\n'))
+    stats = basic_fasta_stats(str(fasta), 10, False, processes=2)
+    assert stats['records'] == 2 and stats['gaps'] == 1
+    assert 'using one process' in caplog.text
+
+
+def test_nx_option_adds_nx_lx_and_aun(tmp_path):
+    fasta = write_fasta(tmp_path, ['A' * 8, 'C' * 8, 'G' * 4, 'T' * 3,
+                                   'A' * 3, 'C' * 2, 'G' * 2, 'T' * 2])
+    nx = parse_nx(None, None, '50,90,12.5')
+    assert nx == [50, 90, 12.5]
+    stats = basic_fasta_stats(fasta, 10, False, nx=nx)
+    assert (stats['N50'], stats['L50']) == (8, 2)
+    assert (stats['N90'], stats['L90']) == (2, 7)
+    assert (stats['N12.5'], stats['L12.5']) == (8, 1)
+    assert stats['auN'] == round((3 * 4 + 2 * 9 + 16 + 2 * 64) / 32)
+    default = basic_fasta_stats(fasta, 10, False)
+    assert 'L50' not in default and 'auN' not in default
+    assert default['N50'] == 8
+
+
+@pytest.mark.parametrize('value', ['50,x', '0', '101', '50,-1'])
+def test_bad_nx_values_are_rejected(tmp_path, value):
+    fasta = write_fasta(tmp_path, ['ACGT'])
+    result = CliRunner().invoke(main, ['--fasta', fasta, '--nx', value])
+    assert result.exit_code == 2
+    assert '--nx' in result.output
+
+
+def test_classic_output_gets_nx_keys(tmp_path):
+    fasta = write_fasta(tmp_path, ['ACGTNNNNNNNNNNNNACGTA', 'GGCC'])
+    stats = basic_fasta_stats(fasta, 10, True, nx=[50])
+    assert stats['Scaffold N50'] == 21 and stats['Scaffold L50'] == 1
+    assert stats['Contig N50'] == 4 and stats['Contig L50'] == 2
+    assert 'Scaffold auN' in stats and 'Contig auN' in stats
+
+
+def write_assemblies(tmp_path, count=5):
+    rng = np.random.RandomState(6)
+    fastas = []
+    for i in range(count):
+        path = tmp_path / ('assembly%d.fa' % i)
+        path.write_bytes(b''.join(b'>s%d\n%s\n' % (
+                         j, random_seq(rng, 200 * (i + 1)).encode())
+                         for j in range(i + 1)))
+        fastas.append(str(path))
+    return fastas
+
+
+@pytest.mark.parametrize('processes', [1, 3])
+def test_batch_stats_in_input_order(tmp_path, processes):
+    fastas = write_assemblies(tmp_path)[::-1]
+    rows = list(batch_fasta_stats(fastas, 10, False, processes=processes,
+                                  nx=[50]))
+    assert [fasta for fasta, _ in rows] == fastas
+    for fasta, stats in rows:
+        assert stats == basic_fasta_stats(fasta, 10, False, nx=[50])
+
+
+def test_batch_skips_files_that_fail(tmp_path, caplog):
+    fastas = write_assemblies(tmp_path, 2)
+    missing = str(tmp_path / 'missing.fa')
+    rows = list(batch_fasta_stats([fastas[0], missing, fastas[1]], 10,
+                                  False, processes=2))
+    assert [fasta for fasta, _ in rows] == fastas
+    assert 'Could not get stats for {}'.format(missing) in caplog.text
+
+
+def test_stats_table_as_json_lines(tmp_path):
+    fastas = write_assemblies(tmp_path, 3)
+    rows = list(batch_fasta_stats(fastas, 10, False))
+    out = io.BytesIO()
+    write_stats_table(rows, out, False)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [line['file'] for line in lines] == fastas
+    assert list(lines[0])[0] == 'file'
+    assert [line['records'] for line in lines] == [1, 2, 3]
+
+
+def test_stats_table_as_tsv(tmp_path):
+    fastas = write_assemblies(tmp_path, 3)
+    rows = list(batch_fasta_stats(fastas, 10, True, nx=[50]))
+    out = io.BytesIO()
+    write_stats_table(rows, out, True)
+    lines = [line.split(b'\t') for line in out.getvalue().splitlines()]
+    header = [field.decode() for field in lines[0]]
+    assert header == ['file'] + list(rows[0][1])
+    assert len(lines) == 4
+    assert all(len(line) == len(header) for line in lines)
+    assert [line[0].decode() for line in lines[1:]] == fastas
+    assert [int(line[1]) for line in lines[1:]] == [1, 2, 3]  # Scaffolds
+
+
+def test_empty_kinds_still_fill_nx_keys(tmp_path):
+    stats = basic_fasta_stats(write_fasta(tmp_path, ['ACGT']), 10, False,
+                              nx=[25])
+    assert stats['gapN25'] == stats['gapL25'] == stats['gapauN'] == 0
+    assert stats['N25'] == 4 and stats['L25'] == 1
+
+
+def test_file_list_skips_blank_and_comment_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    names = tmp_path / 'fastas.txt'
+    names.write_text('# assemblies\na.fa\n\n  b.fa.gz \n')
+    assert list(get_file_names(str(names))) == [str(tmp_path / 'a.fa'),
+                                                str(tmp_path / 'b.fa.gz')]
+
+
+def test_cached_stats_are_reused_per_parameters(tmp_path, monkeypatch):
+    fasta = write_fasta(tmp_path, ['ACGTNNNNNNNNNNNNACGTA', 'GGCC'])
+    cache = StatsCache(str(tmp_path / 'cache'))
+    first = get_file_stats(fasta, 10, False, nx=[50], cache=cache)
+    assert first == basic_fasta_stats(fasta, 10, False, nx=[50])
+    monkeypatch.setattr(basic_fasta_stats_module, 'basic_fasta_stats',
+                        None)  # any miss would now fail
+    assert get_file_stats(fasta, 10, False, nx=[50], cache=cache) == first
+    with pytest.raises(TypeError):
+        get_file_stats(fasta, 5, False, nx=[50], cache=cache)
+
+
+def expected_rows(data, min_gap):
+    '''Per record rows worked out from the wrapped FASTA bytes data'''
+    rows = [b'id\tlength\tgc\tn_count\tgaps\tlargest_contig']
+    for record in data.split(b'>')[1:]:
+        header, _, seq = record.partition(b'\n')
+        seq = seq.replace(b'\n', b'').decode()
+        contigs, gaps = classic_split(seq, min_gap)
+        upper = seq.upper()
+        gc = (upper.count('G') + upper.count('C')) / len(seq) * 100
+        rows.append('{}\t{}\t{:.2f}\t{}\t{}\t{}'.format(
+                    header.decode(), len(seq), gc, upper.count('N'),
+                    len(gaps), max(contigs or [0])).encode())
+    return rows
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+@pytest.mark.parametrize('processes', [1, 3])
+def test_per_record_rows(tmp_path, bgzf, processes):
+    fasta, data = make_assembly(tmp_path, bgzf)
+    per_record = str(tmp_path / 'records.tsv')
+    stats = basic_fasta_stats(fasta, 10, False, processes=processes,
+                              per_record=per_record)
+    assert stats == basic_fasta_stats(fasta, 10, False)
+    with open(per_record, 'rb') as fopen:
+        assert fopen.read().splitlines() == expected_rows(data, 10)
+
+
+def test_per_record_gzip_and_empty_records(tmp_path):
+    fasta = tmp_path / 'assembly.fa'
+    fasta.write_bytes(b'>a\nNNNNNNNNNNNN\n>b\n>c\nGGNNNNNNNNNNNNAT\n')
+    per_record = str(tmp_path / 'records.tsv.gz')
+    basic_fasta_stats(str(fasta), 10, False, per_record=per_record)
+    with gzip.open(per_record, 'rb') as gopen:
+        assert gopen.read().splitlines()[1:] == [
+            b'a\t12\t0.00\t12\t1\t0', b'b\t0\t0.00\t0\t0\t0',
+            b'c\t16\t12.50\t12\t1\t2']
+
+
+def test_ranges_stats_merge_and_append_parts_in_order(tmp_path):
+    fasta, data = make_assembly(tmp_path, True)
+    ranges = get_record_ranges(fasta, 9)
+    out = io.BytesIO()
+    metrics, lengths, bases = get_ranges_stats(fasta, ranges, 10,
+                                               processes=3, per_record=out)
+    expected = get_range_stats(fasta, 0, len(data), 10)
+    assert metrics == expected[0] and bases == expected[2]
+    assert lengths['contigs'].nx([50]) == expected[1]['contigs'].nx([50])
+    assert out.getvalue().splitlines() == expected_rows(data, 10)[1:]
+    assert not [name for name in os.listdir(str(tmp_path))
+                if name.startswith('per_record_')]
+
+
+def test_per_record_skips_the_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fasta = write_fasta(tmp_path, ['ACGT', 'GGCC'])
+    cache = StatsCache(str(tmp_path / 'cache'))
+    get_file_stats(fasta, 10, False, cache=cache)
+    per_record = str(tmp_path / 'records.tsv')
+    get_file_stats(fasta, 10, False, cache=cache, per_record=per_record)
+    with open(per_record, 'rb') as fopen:
+        assert len(fopen.read().splitlines()) == 3
+
+
+APPROX_KEYS = ['records', 'allbases', 'N50', 'N90', 'N25', 'record_mean',
+               'pgc']
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_approx_intervals_hold_the_exact_stats(tmp_path, bgzf):
+    fasta, _ = make_assembly(tmp_path, bgzf, count=600, seed=8)
+    exact = basic_fasta_stats(fasta, 10, False, nx=[25])
+    approx = approx_fasta_stats(fasta, nx=[25], count=30, size=8000,
+                                seed=11)
+    assert approx['approx'] and approx['samples'] == 30
+    assert 0 < approx['sampled_records'] < exact['records']
+    for key in APPROX_KEYS:
+        low, high = approx[key + '_ci']
+        assert low <= approx[key] <= high, key
+        assert low <= exact[key] <= high, key
+        assert high - low < exact[key], key  # an interval, not everything
+
+
+def test_approx_with_a_seed_is_repeatable(tmp_path):
+    fasta, _ = make_assembly(tmp_path, True)
+    first = approx_fasta_stats(fasta, count=10, size=8000, seed=2)
+    assert approx_fasta_stats(fasta, count=10, size=8000, seed=2) == first
+    other = approx_fasta_stats(fasta, count=10, size=8000, seed=3)
+    assert other['records_ci'] != first['records_ci']
+
+
+def test_approx_falls_back_to_exact_stats(tmp_path, caplog):
+    fasta = write_fasta(tmp_path, ['ACGT', 'GGCC'])
+    sample = {'count': 10, 'size': 1000, 'seed': 1}
+    stats = get_file_stats(fasta, 10, False, sample=sample)
+    assert stats == basic_fasta_stats(fasta, 10, False)
+    assert 'computing exact stats' in caplog.text
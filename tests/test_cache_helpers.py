@@ -0,0 +1,135 @@
+import os
+import pickle
+
+import pytest
+
+from sequencetools.helpers.cache_helpers import (StatsCache, CACHE_SUFFIX,
+                                                 get_cached_stats)
+
+
+class Counted(object):
+    '''Stats function counting its calls'''
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+@pytest.fixture
+def fasta(tmp_path):
+    path = tmp_path / 'assembly.fa'
+    path.write_bytes(b'>a\nACGT\n')
+    return str(path)
+
+
+def cached(cache, fasta, stats, params=(10,)):
+    return get_cached_stats(cache, 'tool', fasta, list(params), stats)
+
+
+def entries(cache):
+    return sorted(name for name in os.listdir(cache.cache_dir)
+                  if name.endswith(CACHE_SUFFIX))
+
+
+def test_second_call_is_a_hit(tmp_path, fasta):
+    cache = StatsCache(str(tmp_path / 'cache'))
+    stats = Counted({'N50': 4})
+    assert cached(cache, fasta, stats) == {'N50': 4}
+    assert cached(cache, fasta, stats) == {'N50': 4}
+    assert stats.calls == 1
+    assert len(entries(cache)) == 1
+
+
+def test_parameters_and_tools_have_their_own_entries(tmp_path, fasta):
+    cache = StatsCache(str(tmp_path / 'cache'))
+    stats = Counted({'N50': 4})
+    cached(cache, fasta, stats, (10,))
+    cached(cache, fasta, stats, (20,))
+    get_cached_stats(cache, 'other', fasta, [10], stats)
+    assert stats.calls == 3
+    cached(cache, fasta, stats, (20,))
+    assert stats.calls == 3
+
+
+def test_new_mtime_is_a_miss(tmp_path, fasta):
+    cache = StatsCache(str(tmp_path / 'cache'))
+    stats = Counted({'N50': 4})
+    cached(cache, fasta, stats)
+    info = os.stat(fasta)
+    os.utime(fasta, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+    cached(cache, fasta, stats)
+    assert stats.calls == 2
+
+
+def test_new_size_is_a_miss(tmp_path, fasta):
+    cache = StatsCache(str(tmp_path / 'cache'))
+    stats = Counted({'N50': 4})
+    cached(cache, fasta, stats)
+    info = os.stat(fasta)
+    with open(fasta, 'ab') as fopen:
+        fopen.write(b'>b\nGG\n')
+    os.utime(fasta, ns=(info.st_atime_ns, info.st_mtime_ns))  # same mtime
+    cached(cache, fasta, stats)
+    assert stats.calls == 2
+
+
+def test_same_size_and_mtime_new_content_is_a_miss(tmp_path, fasta):
+    cache = StatsCache(str(tmp_path / 'cache'))
+    stats = Counted({'N50': 4})
+    cached(cache, fasta, stats)
+    info = os.stat(fasta)
+    with open(fasta, 'wb') as fopen:
+        fopen.write(b'>a\nGGGG\n')
+    os.utime(fasta, ns=(info.st_atime_ns, info.st_mtime_ns))
+    cached(cache, fasta, stats)
+    assert stats.calls == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, fasta):
+    cache = StatsCache(str(tmp_path / 'cache'))
+    big = 'x' * 4000
+    for i in range(3):
+        cached(cache, fasta, Counted(big), (i,))
+    paths = [cache._path(cache.identity('tool', fasta, [i]))
+             for i in range(3)]
+    for age, path in zip((300, 200, 100), paths):  # entry 0 is the oldest
+        os.utime(path, (1000 - age, 1000 - age))
+    stats = Counted(big)
+    cached(cache, fasta, stats, (0,))  # a hit makes entry 0 the newest
+    assert stats.calls == 0
+    cache.max_size = 2 * os.path.getsize(paths[0])
+    cache.evict()
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
+
+
+def test_put_evicts_down_to_max_size(tmp_path, fasta):
+    cache = StatsCache(str(tmp_path / 'cache'), max_size=0.01)  # ~10 KB
+    for i in range(10):
+        cached(cache, fasta, Counted('x' * 4000), (i,))
+    assert 1 <= len(entries(cache)) <= 2
+    size = sum(os.path.getsize(os.path.join(cache.cache_dir, name))
+               for name in entries(cache))
+    assert size <= cache.max_size
+
+
+def test_unreadable_entry_is_a_miss(tmp_path, fasta):
+    cache = StatsCache(str(tmp_path / 'cache'))
+    cached(cache, fasta, Counted({'N50': 4}))
+    path = cache._path(cache.identity('tool', fasta, [10]))
+    with open(path, 'wb') as fopen:
+        fopen.write(b'not a pickle')
+    stats = Counted({'N50': 5})
+    assert cached(cache, fasta, stats) == {'N50': 5}
+    with open(path, 'rb') as fopen:
+        assert pickle.load(fopen)[1] == {'N50': 5}
+
+
+def test_no_cache_or_stdin_always_calls(tmp_path, fasta):
+    stats = Counted({'N50': 4})
+    cached(None, fasta, stats)
+    cached(StatsCache(str(tmp_path / 'cache')), None, stats)
+    assert stats.calls == 2
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pytest
+
+from sequencetools.helpers.index_helpers import index_fasta
+from sequencetools.tools.chunk_fasta import chunk_fasta, chunk_fasta_n
+
+
+def write_fasta(tmp_path, count=500, seed=2):
+    rng = np.random.RandomState(seed)
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    data = b''.join(b'>s%d\n%s\n' % (i, bytes(bases[rng.randint(0, 4,
+                                           rng.randint(1, 300))]))
+                    for i in range(count))
+    path = tmp_path / 'in.fa'
+    path.write_bytes(data)
+    return str(path)
+
+
+def read_records(data):
+    '''Returns [(id, sequence)] of the FASTA bytes data, unwrapped'''
+    records = []
+    for record in data.split(b'>')[1:]:
+        header, seq = record.split(b'\n', 1)
+        records.append((header.split()[0], seq.replace(b'\n', b'')))
+    return records
+
+
+def read_dir(chunks_dir):
+    files = {}
+    for name in os.listdir(chunks_dir):
+        with open(os.path.join(chunks_dir, name), 'rb') as fopen:
+            files[name] = fopen.read()
+    return files
+
+
+@pytest.mark.parametrize('byte_chunks', [False, True])
+@pytest.mark.parametrize('gzip_me', [False, True])
+def test_threaded_chunks_equal_serial_chunks(tmp_path, byte_chunks,
+                                             gzip_me):
+    fasta = write_fasta(tmp_path)
+    chunks = 3000 if byte_chunks else 17
+    serial = chunk_fasta(fasta, chunks, str(tmp_path / 'serial'), gzip_me,
+                         byte_chunks)
+    threaded = chunk_fasta(fasta, chunks, str(tmp_path / 'threaded'),
+                           gzip_me, byte_chunks, threads=4, max_pending=1)
+    assert threaded == serial
+    files = read_dir(str(tmp_path / 'threaded'))
+    assert len(files) > 10
+    assert files == read_dir(str(tmp_path / 'serial'))
+
+
+@pytest.mark.parametrize('indexed', [False, True])
+@pytest.mark.parametrize('balance', [False, True])
+def test_n_chunks_keep_every_record_in_file_order(tmp_path, indexed,
+                                                  balance):
+    fasta = write_fasta(tmp_path)
+    if indexed:
+        index_fasta(fasta)
+    chunks_dir = str(tmp_path / 'chunks')
+    result = chunk_fasta_n(fasta, 7, chunks_dir, False, balance)
+    files = read_dir(chunks_dir)
+    assert sorted(files) == ['{:06d}.fasta'.format(n) for n in range(1, 8)]
+    with open(fasta, 'rb') as fopen:
+        records = read_records(fopen.read())
+    order = {name: i for i, (name, record) in enumerate(records)}
+    chunked = []
+    for name in sorted(files):
+        chunk = read_records(files[name])
+        assert [order[seq_id] for seq_id, record in chunk] == sorted(
+                                    order[seq_id] for seq_id, record in chunk)
+        chunked.extend(chunk)
+    assert sorted(chunked) == sorted(records)
+    bases = [sum(len(seq) for seq_id, seq in read_records(data))
+             for data in files.values()]
+    assert result == 'Output 500 reads in 7 files of {} to {} bases'.format(
+                                                       min(bases), max(bases))
+    if balance:
+        assert max(bases) - min(bases) <= 300  # the longest sequence
+
+
+@pytest.mark.parametrize('balance', [False, True])
+def test_more_chunks_than_records(tmp_path, balance):
+    path = tmp_path / 'in.fa'
+    path.write_bytes(b''.join(b'>s%d\nACGTACGTAC\n' % i for i in range(5)))
+    chunks_dir = str(tmp_path / 'chunks')
+    result = chunk_fasta_n(str(path), 8, chunks_dir, False, balance)
+    assert result == 'Output 5 reads in 5 files of 10 to 10 bases'
+    files = read_dir(chunks_dir)
+    assert len(files) == 5  # no empty chunks are written
+    assert b''.join(files[name] for name in sorted(files)) == (
+                                                          path.read_bytes())
+
+
+def test_id_lists_match_the_chunks(tmp_path):
+    fasta = write_fasta(tmp_path)
+    fasta_dir = str(tmp_path / 'fasta')
+    ids_dir = str(tmp_path / 'ids')
+    chunk_fasta_n(fasta, 5, fasta_dir, False, balance=True)
+    result = chunk_fasta_n(fasta, 5, ids_dir, False, balance=True,
+                           id_lists=True)
+    assert result.startswith('Output 500 reads in 5 files')
+    fasta_files = read_dir(fasta_dir)
+    id_files = read_dir(ids_dir)
+    assert sorted(id_files) == ['{:06d}.ids'.format(n) for n in range(1, 6)]
+    for name in sorted(fasta_files):
+        ids = [seq_id for seq_id, record in read_records(fasta_files[name])]
+        assert id_files[name.replace('.fasta', '.ids')] == b''.join(
+                                          seq_id + b'\n' for seq_id in ids)
@@ -0,0 +1,105 @@
+import os
+import gzip
+
+import numpy as np
+import pytest
+
+from sequencetools.helpers.compression_helpers import BgzfWriter
+from sequencetools.helpers.sequence_helpers import READ_SIZE
+from sequencetools.tools.chunk_fastq import chunk_fastq
+
+
+def make_fastq(size, seed=1):
+    '''FASTQ of at least size bytes, so the raw copy crosses read blocks'''
+    rng = np.random.RandomState(seed)
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    records = []
+    total = 0
+    while total < size:
+        seq = bytes(bases[rng.randint(0, 4, rng.randint(1, 400))])
+        qual = bytes(rng.randint(33, 75, len(seq)).astype(np.uint8))
+        records.append(b'@r%d x=%d\n%s\n+\n%s\n' % (len(records),
+                                                    len(records) % 3, seq,
+                                                    qual))
+        total += len(records[-1])
+    return b''.join(records), len(records)
+
+
+def write_input(tmp_path, data, bgzf):
+    path = str(tmp_path / ('reads.fq' + ('.gz' if bgzf else '')))
+    if bgzf:
+        with BgzfWriter(path) as writer:
+            writer.write(data)
+    else:
+        with open(path, 'wb') as fopen:
+            fopen.write(data)
+    return path
+
+
+def read_chunks(chunks_dir, gzip_me=False):
+    '''Returns the bytes of every chunk file, in chunk order'''
+    chunks = []
+    for name in sorted(os.listdir(chunks_dir)):
+        opener = gzip.open if gzip_me else open
+        with opener(os.path.join(chunks_dir, name), 'rb') as fopen:
+            chunks.append(fopen.read())
+    return chunks
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_raw_chunks_equal_parsed_chunks(tmp_path, bgzf):
+    data, count = make_fastq(READ_SIZE + READ_SIZE // 2)
+    fastq = write_input(tmp_path, data, bgzf)
+    parsed_dir = str(tmp_path / 'parsed')
+    raw_dir = str(tmp_path / 'raw')
+    parsed = chunk_fastq(fastq, 7777, parsed_dir, False)
+    raw = chunk_fastq(fastq, 7777, raw_dir, False, raw=True)
+    assert raw == parsed
+    assert 'Output {} reads in {} files'.format(count,
+                                                -(-count // 7777)) in raw
+    raw_chunks = read_chunks(raw_dir)
+    assert raw_chunks == read_chunks(parsed_dir)
+    assert b''.join(raw_chunks) == data
+    assert all(chunk.count(b'\n') == 4 * 7777 for chunk in raw_chunks[:-1])
+
+
+def test_raw_gzip_chunks_concatenate_to_the_input(tmp_path):
+    data, count = make_fastq(200000)
+    fastq = write_input(tmp_path, data, False)
+    chunks_dir = str(tmp_path / 'chunks')
+    chunk_fastq(fastq, 100, chunks_dir, True, raw=True)
+    chunks = read_chunks(chunks_dir, True)
+    assert len(chunks) == -(-count // 100)
+    assert b''.join(chunks) == data
+
+
+def test_raw_chunks_of_an_exact_multiple(tmp_path):
+    records = [b'@r%d\nAC\n+\nII\n' % i for i in range(20)]
+    data = b''.join(records)
+    fastq = write_input(tmp_path, data, False)
+    chunks_dir = str(tmp_path / 'chunks')
+    assert chunk_fastq(fastq, 10, chunks_dir, False, raw=True) == (
+           'Output 20 reads in 2 files 10 at a time')
+    assert read_chunks(chunks_dir) == [b''.join(records[:10]),
+                                       b''.join(records[10:])]
+
+
+@pytest.mark.parametrize('raw', [False, True])
+@pytest.mark.parametrize('gzip_me', [False, True])
+def test_threaded_chunks_equal_serial_chunks(tmp_path, raw, gzip_me):
+    data, count = make_fastq(300000, seed=3)
+    fastq = write_input(tmp_path, data, False)
+    serial_dir = str(tmp_path / 'serial')
+    threaded_dir = str(tmp_path / 'threaded')
+    serial = chunk_fastq(fastq, 50, serial_dir, gzip_me, raw=raw)
+    threaded = chunk_fastq(fastq, 50, threaded_dir, gzip_me, threads=3,
+                           raw=raw, max_pending=2)
+    assert threaded == serial
+    assert os.listdir(threaded_dir) and (sorted(os.listdir(threaded_dir)) ==
+                                         sorted(os.listdir(serial_dir)))
+    for name in os.listdir(serial_dir):
+        with open(os.path.join(serial_dir, name), 'rb') as fopen:
+            expected = fopen.read()
+        with open(os.path.join(threaded_dir, name), 'rb') as fopen:
+            assert fopen.read() == expected
+    assert b''.join(read_chunks(threaded_dir, gzip_me)) == data
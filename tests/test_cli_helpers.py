@@ -0,0 +1,32 @@
+import gzip
+
+from click.testing import CliRunner
+
+from sequencetools.tools import index_fasta, index_fastq
+
+
+def test_index_tools_write_their_index(tmp_path):
+    fasta = tmp_path / 'seqs.fa'
+    fasta.write_bytes(b'>a\nACGT\nAC\n>b\nGG\n')
+    fastq = tmp_path / 'reads.fq'
+    fastq.write_bytes(b'@r1\nACGT\n+\nIIII\n')
+    runner = CliRunner()
+    result = runner.invoke(index_fasta.main, ['--fasta', str(fasta),
+                           '--log_file', str(tmp_path / 'fa.log')])
+    assert result.exit_code == 0
+    assert (tmp_path / 'seqs.fa.fai').read_bytes() == (b'a\t6\t3\t4\t5\n'
+                                                       b'b\t2\t14\t2\t3\n')
+    result = runner.invoke(index_fastq.main, ['--fastq', str(fastq),
+                           '--log_file', str(tmp_path / 'fq.log')])
+    assert result.exit_code == 0
+    assert (tmp_path / 'reads.fq.fqi').exists()
+
+
+def test_index_tool_reports_plain_gzip(tmp_path):
+    fasta = tmp_path / 'seqs.fa.gz'
+    with gzip.open(str(fasta), 'wb') as gopen:
+        gopen.write(b'>a\nACGT\n')
+    result = CliRunner().invoke(index_fasta.main, ['--fasta', str(fasta),
+                                '--log_file', str(tmp_path / 'fa.log')])
+    assert result.exit_code == 1
+    assert 'bgzip' in (tmp_path / 'fa.log').read_text()
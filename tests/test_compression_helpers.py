@@ -0,0 +1,196 @@
+import gzip
+import zlib
+import struct
+
+import numpy as np
+import pytest
+
+from sequencetools.helpers.compression_helpers import (
+    BgzfReader, BgzfWriter, GzipReadAhead, is_bgzf, read_bgzf_block,
+    inflate_bgzf_block, get_bgzf_block_offsets, write_gzi, read_gzi,
+    read_bgzf_range, BGZF_BLOCK_DATA, BGZF_EOF)
+from sequencetools.helpers.file_helpers import (return_filehandle,
+                                                return_output_handle)
+
+RECORDS = 6000
+
+
+def make_data(seed=3):
+    '''Returns FASTQ bytes spanning a few dozen BGZF blocks'''
+    rng = np.random.RandomState(seed)
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    records = []
+    for i in range(RECORDS):
+        seq = bytes(bases[rng.randint(0, 4, rng.randint(50, 400))])
+        records.append(b'@r%d\n%s\n+\n%s\n' % (i, seq, b'I' * len(seq)))
+    return b''.join(records)
+
+
+DATA = make_data()
+
+
+def bgzf_block(data):
+    '''Returns data as one BGZF block, as bgzip writes them'''
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    return b''.join((b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC'
+                     b'\x02\x00', struct.pack('<H', len(deflated) + 25),
+                     deflated, struct.pack('<II', zlib.crc32(data),
+                                           len(data))))
+
+
+def write_bgzf(path, data, block_size=65280):
+    with open(str(path), 'wb') as wopen:
+        for i in range(0, len(data), block_size):
+            wopen.write(bgzf_block(data[i:i + block_size]))
+        wopen.write(bgzf_block(b''))  # EOF marker block
+    return str(path)
+
+
+def read_all(reader):
+    try:
+        return reader.read()
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize('threads', [1, 2, 4])
+def test_bgzf_reader_round_trip(tmp_path, threads):
+    bgzf = write_bgzf(tmp_path / 'reads.fq.gz', DATA)
+    assert is_bgzf(bgzf)
+    with open(bgzf, 'rb') as fopen:
+        assert gzip.decompress(fopen.read()) == DATA  # any gzip reader
+    assert read_all(BgzfReader(bgzf, threads)) == DATA
+
+
+def test_htslib_bgzf_is_read(tmp_path):
+    pysam = pytest.importorskip('pysam')
+    plain = tmp_path / 'reads.fq'
+    plain.write_bytes(DATA)
+    bgzf = str(tmp_path / 'reads.fq.gz')
+    pysam.tabix_compress(str(plain), bgzf, force=True)
+    assert is_bgzf(bgzf)
+    assert read_all(BgzfReader(bgzf, 2)) == DATA
+
+
+def test_plain_gzip_members_are_read_ahead(tmp_path):
+    path = tmp_path / 'reads.fq.gz'
+    half = len(DATA) // 2
+    path.write_bytes(gzip.compress(DATA[:half]) + gzip.compress(DATA[half:]) +
+                     b'\x00' * 16)  # padding some tools leave
+    assert not is_bgzf(str(path))
+    assert read_all(GzipReadAhead(str(path))) == DATA
+
+
+def test_truncated_gzip_raises(tmp_path):
+    path = tmp_path / 'reads.fq.gz'
+    compressed = gzip.compress(DATA)
+    path.write_bytes(compressed[:len(compressed) // 2])
+    reader = GzipReadAhead(str(path))
+    try:
+        with pytest.raises((EOFError, zlib.error)):
+            reader.read()
+    finally:
+        reader.close()
+
+
+def test_closing_early_stops_the_read_ahead_thread(tmp_path):
+    path = tmp_path / 'reads.fq.gz'
+    path.write_bytes(gzip.compress(DATA * 20, compresslevel=1))
+    reader = GzipReadAhead(str(path))
+    assert reader.read(10) == DATA[:10]
+    reader.close()
+    assert not reader._thread.is_alive()
+
+
+@pytest.mark.parametrize('compression', ['bgzf', 'gzip'])
+def test_threaded_filehandle_matches_gzip_open(tmp_path, compression):
+    if compression == 'bgzf':
+        path = write_bgzf(tmp_path / 'reads.fq.gz', DATA)
+    else:
+        path = str(tmp_path / 'reads.fq.gz')
+        with gzip.open(path, 'wb', compresslevel=1) as gopen:
+            gopen.write(DATA)
+    with return_filehandle(path, 4) as fopen:
+        assert fopen.read() == DATA.decode()
+
+
+def write_with_writer(path, data, threads=1, writes=None):
+    '''Writes data to path with a BgzfWriter in pieces of writes bytes'''
+    writes = writes or len(data)
+    with BgzfWriter(str(path), threads) as writer:
+        for i in range(0, len(data), writes):
+            writer.write(data[i:i + writes])
+    return str(path)
+
+
+@pytest.mark.parametrize('threads,writes', [(1, None), (1, 1000),
+                                            (4, 70000), (4, None)])
+def test_bgzf_writer_round_trip(tmp_path, threads, writes):
+    bgzf = write_with_writer(tmp_path / 'reads.fq.gz', DATA, threads, writes)
+    assert is_bgzf(bgzf)
+    with open(bgzf, 'rb') as fopen:
+        compressed = fopen.read()
+    assert compressed.endswith(BGZF_EOF)
+    assert gzip.decompress(compressed) == DATA
+    assert read_all(BgzfReader(bgzf, threads)) == DATA
+
+
+def test_bgzf_writer_blocks_are_full(tmp_path):
+    bgzf = write_with_writer(tmp_path / 'reads.fq.gz', DATA, writes=777)
+    sizes = []
+    with open(bgzf, 'rb') as fopen:
+        block = read_bgzf_block(fopen)
+        while block:
+            sizes.append(len(inflate_bgzf_block(block)))
+            block = read_bgzf_block(fopen)
+    assert set(sizes[:-2]) == {BGZF_BLOCK_DATA}
+    assert sizes[-1] == 0  # EOF marker
+    assert sum(sizes) == len(DATA)
+
+
+def test_htslib_reads_bgzf_writer_output(tmp_path):
+    libcbgzf = pytest.importorskip('pysam.libcbgzf')
+    bgzf = write_with_writer(tmp_path / 'reads.fq.gz', DATA, 2)
+    reader = libcbgzf.BGZFile(bgzf, 'rb')
+    try:
+        assert reader.read() == DATA
+    finally:
+        reader.close()
+
+
+def test_output_handle_writes_bgzf(tmp_path):
+    path = str(tmp_path / 'out.fq.gz')
+    with return_output_handle(path, True, 2, 1) as output:
+        output.write(DATA)
+    assert is_bgzf(path)
+    with gzip.open(path, 'rb') as gopen:
+        assert gopen.read() == DATA
+
+
+def test_gzi_has_every_block(tmp_path):
+    bgzf = write_with_writer(tmp_path / 'reads.fq.gz', DATA, writes=777)
+    offsets = list(get_bgzf_block_offsets(bgzf))
+    with open(bgzf, 'rb') as fopen:
+        for coffset, uoffset in offsets:
+            fopen.seek(coffset)
+            data = inflate_bgzf_block(read_bgzf_block(fopen))
+            assert data == DATA[uoffset:uoffset + len(data)]
+    write_gzi(bgzf + '.gzi', offsets)
+    assert list(zip(*read_gzi(bgzf + '.gzi'))) == offsets
+
+
+@pytest.mark.parametrize('cache', [None, {}])
+@pytest.mark.parametrize('largest', [100, 3 * BGZF_BLOCK_DATA])
+def test_bgzf_range_reads(tmp_path, cache, largest):
+    bgzf = write_with_writer(tmp_path / 'reads.fq.gz', DATA)
+    write_gzi(bgzf + '.gzi', get_bgzf_block_offsets(bgzf))
+    gzi = read_gzi(bgzf + '.gzi')
+    rng = np.random.RandomState(4)
+    starts = rng.randint(0, len(DATA), 50).tolist()
+    starts += [BGZF_BLOCK_DATA - 10] * 3 + [len(DATA) - 5] * 2
+    with open(bgzf, 'rb') as fopen:
+        for start in sorted(starts) + starts:
+            size = int(rng.randint(1, largest))
+            assert (read_bgzf_range(fopen, gzi, start, size, cache) ==
+                    DATA[start:start + size])
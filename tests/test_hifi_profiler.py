@@ -0,0 +1,417 @@
+import os
+import gzip
+import math
+from itertools import groupby
+
+import numpy as np
+import pytest
+
+from sequencetools.helpers import length_helpers
+from sequencetools.helpers.length_helpers import Histogram2D, LengthCounter
+from sequencetools.tools.hifi_profiler import (get_pass_label, hifi_profiler,
+                                               parse_int_list, GET_PASSES,
+                                               add_qualities, new_quality,
+                                               add_runs, new_runs,
+                                               get_homopolymers,
+                                               get_low_complexity, BASE_CODE,
+                                               DUST_WINDOW, DUST_LEVEL,
+                                               MAX_RUN,
+                                               HISTOGRAM_BINS,
+                                               HISTOGRAM_PASSES, MAX_QV,
+                                               PAIR_ERROR_PROBABILITY)
+
+
+def make_reads(count=500, seed=1):
+    '''Returns [(id, passes, seq)] and the FASTQ bytes of count HiFi reads'''
+    rng = np.random.RandomState(seed)
+    reads = []
+    records = []
+    for i in range(count):
+        passes = int(rng.randint(0, 30))
+        seq = bytes(np.frombuffer(b'ACGT', dtype=np.uint8)[
+                    rng.randint(0, 4, rng.randint(1, 3000))])
+        reads.append((b'm1/%d/ccs' % i, passes, seq))
+        records.append(b'@m1/%d/ccs passes=%d\n%s\n+\n%s\n' % (
+                       i, passes, seq, b'~' * len(seq)))
+    return reads, b''.join(records)
+
+
+def write_reads(tmp_path, data, name='reads.fq'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize('passes, label', [
+    ('0', '0-2'), ('2', '0-2'), ('3', '3-4'), ('4', '3-4'), ('5', '5-9'),
+    ('9', '5-9'), ('10', '10+'), ('250', '10+'), (None, 'unknown')])
+def test_pass_label_bins(passes, label):
+    assert get_pass_label(passes, [3, 5, 10]) == label
+
+
+def test_pass_label_without_bins_and_single_value_bins():
+    assert get_pass_label('7', []) == '7'
+    assert get_pass_label('1', [1, 2, 4]) == '1'
+    assert get_pass_label('0', [1, 2, 4]) == '0'
+    assert get_pass_label('3', [1, 2, 4]) == '2-3'
+
+
+def test_pass_bins_option_is_sorted_and_unique():
+    assert parse_int_list(None, None, '10,3,5,3') == [3, 5, 10]
+    assert parse_int_list(None, None, None) == []
+
+
+def read_split_dir(split_dir, opener=open):
+    '''Returns {file name: [record ids]} of the FASTQ files in split_dir'''
+    found = {}
+    for name in sorted(os.listdir(split_dir)):
+        with opener(os.path.join(split_dir, name), 'rb') as fopen:
+            lines = fopen.read().splitlines()
+        assert all(line.startswith(b'@') for line in lines[::4])
+        found[name] = [line[1:].split()[0] for line in lines[::4]]
+    return found
+
+
+def expected_split(reads, pass_bins, suffix='.fastq'):
+    expected = {}
+    for seq_id, passes, seq in reads:
+        name = 'passes_' + get_pass_label(str(passes), pass_bins) + suffix
+        expected.setdefault(name, []).append(seq_id)
+    return expected
+
+
+@pytest.mark.parametrize('pass_bins', [[], [3, 5, 10]])
+@pytest.mark.parametrize('max_open', [1, 3, 64])
+def test_split_files_hold_every_read_in_order(tmp_path, pass_bins, max_open):
+    reads, data = make_reads()
+    split_dir = str(tmp_path / 'split')
+    stats = hifi_profiler(write_reads(tmp_path, data), 1000, True,
+                          split_dir=split_dir, pass_bins=pass_bins,
+                          max_open=max_open)
+    assert stats['records'] == len(reads)
+    assert read_split_dir(split_dir) == expected_split(reads, pass_bins)
+
+
+def test_split_files_gzip_output_and_old_files_replaced(tmp_path):
+    reads, data = make_reads(200)
+    split_dir = tmp_path / 'split'
+    split_dir.mkdir()
+    (split_dir / 'passes_0-2.fastq.gz').write_bytes(gzip.compress(b'old\n'))
+    hifi_profiler(write_reads(tmp_path, data), 1000, True,
+                  split_dir=str(split_dir), pass_bins=[3, 5, 10],
+                  gzip_me=True, max_open=2)
+    assert read_split_dir(str(split_dir), gzip.open) == expected_split(
+                                      reads, [3, 5, 10], '.fastq.gz')
+
+
+def test_split_records_are_copied_whole(tmp_path):
+    data = (b'@a passes=3\nACGT\n+\nIIII\n@b passes=12\nGG\n+\n#!\n'
+            b'@c passes=3\nT\n+\nI\n')
+    split_dir = tmp_path / 'split'
+    hifi_profiler(write_reads(tmp_path, data), 1000, True,
+                  split_dir=str(split_dir))
+    assert (split_dir / 'passes_3.fastq').read_bytes() == (
+            b'@a passes=3\nACGT\n+\nIIII\n@c passes=3\nT\n+\nI\n')
+    assert (split_dir / 'passes_12.fastq').read_bytes() == (
+            b'@b passes=12\nGG\n+\n#!\n')
+
+
+def test_histogram_grows_to_fit_and_clips_to_the_last_bins():
+    histogram = Histogram2D(4, 3)
+    for row, column in [(0, 0), (1, 2), (1, 2), (3, 1), (9, 0), (2, 7),
+                        (100, 100)]:
+        histogram.add(row, column)
+    assert histogram.get_counts().tolist() == [[1, 0, 0],
+                                               [0, 0, 2],
+                                               [0, 0, 1],
+                                               [1, 1, 1]]
+    histogram = Histogram2D(100, 100)
+    histogram.add(1, 2)
+    assert histogram.get_counts().shape == (2, 3)  # only what was seen
+
+
+def test_histogram_folds_the_buffer_in_steps(monkeypatch):
+    monkeypatch.setattr(length_helpers, 'LENGTH_BUFFER', 10)
+    rng = np.random.RandomState(2)
+    pairs = rng.randint(0, 40, (1000, 2))
+    histogram = Histogram2D(30, 20)
+    for row, column in pairs:
+        histogram.add(int(row), int(column))
+        assert len(histogram._buffer) < 10
+    expected = np.zeros((30, 20), dtype=np.int64)
+    np.add.at(expected, (np.minimum(pairs[:, 0], 29),
+                         np.minimum(pairs[:, 1], 19)), 1)
+    assert (histogram.get_counts() == expected).all()
+
+
+def test_length_bins_and_yield_above():
+    counter = LengthCounter()
+    counter.extend(np.array([5, 999, 1000, 1500, 3999, 4000, 12000]))
+    bins, counts = counter.bins(1000)
+    assert bins.tolist() == [0, 1, 3, 4, 12]
+    assert counts.tolist() == [2, 2, 1, 1, 1]
+    assert counter.total_above(4000) == 16000
+    assert counter.total_above(1) == counter.total()
+    assert counter.total_above(20000) == 0
+
+
+SUMMARY_KEYS = ['records', 'allbases', 'maxlen', 'minlen', 'mean',
+                'mean_passes', 'N50', 'yield_above_1000',
+                'yield_above_2000']
+
+
+def test_summary_only_by_default(tmp_path):
+    reads, data = make_reads()
+    fastq = write_reads(tmp_path, data)
+    summary = hifi_profiler(fastq, 1000, False, yield_above=[1000, 2000])
+    full = hifi_profiler(fastq, 1000, False, histograms=True,
+                         yield_above=[1000, 2000])
+    assert sorted(summary) == sorted(SUMMARY_KEYS)
+    assert sorted(full) == sorted(SUMMARY_KEYS + [
+                          'length_bins', 'passes_bins', 'length_by_passes'])
+    assert {key: full[key] for key in summary} == summary
+    lengths = [len(seq) for _, _, seq in reads]
+    assert summary['allbases'] == sum(lengths)
+    assert summary['yield_above_2000'] == sum(l for l in lengths
+                                              if l >= 2000)
+
+
+def test_histograms_match_the_reads(tmp_path):
+    reads, data = make_reads()
+    stats = hifi_profiler(write_reads(tmp_path, data), 500, False,
+                          histograms=True)
+    length_bins = {}
+    passes_bins = {}
+    by_passes = {}
+    for _, passes, seq in reads:
+        length_bin = str(len(seq) // 500)
+        length_bins[length_bin] = length_bins.get(length_bin, 0) + 1
+        passes_bins[str(passes)] = passes_bins.get(str(passes), 0) + 1
+        counts = by_passes.setdefault(str(passes), {})
+        counts[length_bin] = counts.get(length_bin, 0) + 1
+    assert dict(stats['length_bins']) == length_bins
+    assert dict(stats['passes_bins']) == passes_bins
+    assert {passes: dict(bins) for passes, bins in
+            stats['length_by_passes']} == by_passes
+
+
+def test_length_by_passes_labels_the_open_ended_bins(tmp_path):
+    long_seq = b'A' * (HISTOGRAM_BINS + 5)
+    data = (b'@a passes=%d\n%s\n+\n%s\n' % (HISTOGRAM_PASSES + 40, long_seq,
+                                            b'I' * len(long_seq)) +
+            b'@c passes=0\nAC\n+\nII\n')
+    stats = hifi_profiler(write_reads(tmp_path, data), 1, False,
+                          histograms=True)
+    assert stats['length_by_passes'] == [
+        ('0', [('2', 1)]),
+        ('{}+'.format(HISTOGRAM_PASSES),
+         [('{}+'.format(HISTOGRAM_BINS - 1), 1)])]
+
+
+@pytest.mark.parametrize('description, passes', [
+    (b'm1/1/ccs passes=12', b'12'), (b'm1/1/ccs np:i:7 rq:f:0.99', b'7'),
+    (b'm1/1/ccs\tnp:i:0', b'0'), (b'read passes=3 np:i:5', b'3'),
+    (b'm1/1/ccs rq:f:0.99', None), (b'passes=x', None)])
+def test_pass_count_tags(description, passes):
+    found = GET_PASSES.search(description)
+    assert (found.group(1) if found else None) == passes
+
+
+def test_reads_without_passes_are_counted_as_unknown(tmp_path, caplog):
+    data = (b'@a np:i:4\nACGT\n+\nIIII\n@b\nACG\n+\nIII\n'
+            b'@c passes=4\nAC\n+\nII\n@d rq:f:0.9\nA\n+\nI\n')
+    fastq = write_reads(tmp_path, data)
+    stats = hifi_profiler(fastq, 1, False, histograms=True)
+    assert stats['records'] == 4 and stats['mean_passes'] == 4
+    assert stats['passes_bins'] == [('4', 2)]
+    assert stats['length_by_passes'] == [('unknown', [('1', 1), ('3', 1)]),
+                                         ('4', [('2', 1), ('4', 1)])]
+    assert '2 reads without a passes= or np:i: tag' in caplog.text
+    split_dir = tmp_path / 'split'
+    hifi_profiler(fastq, 1, True, split_dir=str(split_dir))
+    assert sorted(os.listdir(str(split_dir))) == ['passes_4.fastq',
+                                                  'passes_unknown.fastq']
+
+
+def test_length_only_parsing_gives_the_record_stats(tmp_path):
+    reads, data = make_reads()
+    data = data.replace(b' passes=', b' np:i:', 250)
+    fastq = write_reads(tmp_path, data)
+    lengths_only = hifi_profiler(fastq, 1000, False, histograms=True)
+    records = hifi_profiler(fastq, 1000, True, split_dir=str(tmp_path),
+                            histograms=True)  # parses whole records
+    assert lengths_only == records
+    assert lengths_only['records'] == len(reads)
+
+
+def error_probability(symbol):
+    return 10 ** (-min(symbol - 33, MAX_QV) / 10.0)
+
+
+def direct_qv(qual):
+    '''Read QV from the mean error probability, one base at a time'''
+    errors = sum(error_probability(symbol) for symbol in qual) / len(qual)
+    return -10 * math.log10(errors)
+
+
+def test_pair_error_probability_lookup():
+    for first in (33, 43, 53, 63, 126, 255):
+        for second in (33, 34, 73, 126):
+            pair = np.frombuffer(bytes([first, second]), dtype=np.uint16)[0]
+            assert PAIR_ERROR_PROBABILITY[pair] == pytest.approx(
+                error_probability(first) + error_probability(second))
+    pad = np.frombuffer(b'I\0', dtype=np.uint16)[0]
+    assert PAIR_ERROR_PROBABILITY[pad] == pytest.approx(error_probability(73))
+
+
+def make_quals(count=2000, seed=3):
+    rng = np.random.RandomState(seed)
+    return [bytes(rng.randint(33, 127, rng.randint(1, 200)).astype(np.uint8))
+            for _ in range(count)]
+
+
+def test_read_qvs_match_a_direct_computation():
+    quals = make_quals() + [b'5', b'?' * 10, b'+5']  # Q20, Q30 and odd sizes
+    quality = new_quality()
+    for i in range(0, len(quals), 333):  # batches split anywhere
+        add_qualities(quality, quals[i:i + 333], 50)
+    qvs = [direct_qv(qual) for qual in quals]
+    assert quality['reads'] == len(quals)
+    assert quality['qv_sum'] == pytest.approx(sum(qvs))
+    assert quality['q20'] == sum(round(qv, 6) >= 20 for qv in qvs)
+    assert quality['q30'] == sum(round(qv, 6) >= 30 for qv in qvs)
+    expected = np.zeros((HISTOGRAM_BINS, MAX_QV + 1), dtype=np.int64)
+    for qual, qv in zip(quals, qvs):
+        expected[len(qual) // 50, int(round(qv, 6))] += 1
+    counts = quality['length_by_qv'].get_counts()
+    assert (counts == expected[:counts.shape[0], :counts.shape[1]]).all()
+    assert counts.sum() == len(quals)
+
+
+def test_exact_q20_and_q30_reads_are_counted():
+    quality = new_quality()
+    add_qualities(quality, [b'5' * 7, b'?' * 8, b'4' * 3, b'>' * 2], 100)
+    assert quality['q20'] == 3 and quality['q30'] == 1
+
+
+def test_quality_stats_in_the_summary(tmp_path):
+    data = (b'@a passes=3\nACGTA\n+\n?????\n@b passes=4\nAC\n+\n55\n'
+            b'@c passes=5\nACG\n+\n+++\n@d passes=1\n\n+\n\n')
+    fastq = write_reads(tmp_path, data)
+    stats = hifi_profiler(fastq, 2, False, quality=True, histograms=True)
+    assert stats['mean_read_qv'] == round((30 + 20 + 10) / 3.0, 1)
+    assert stats['reads_q20_percent'] == round(200 / 3.0, 2)
+    assert stats['reads_q30_percent'] == round(100 / 3.0, 2)
+    assert stats['read_qv_bins'] == [('10', 1), ('20', 1), ('30', 1)]
+    assert stats['length_by_qv'] == [('10', [('1', 1)]), ('20', [('1', 1)]),
+                                     ('30', [('2', 1)])]
+    assert 'mean_read_qv' not in hifi_profiler(fastq, 2, False)
+
+
+def encode(seqs):
+    return BASE_CODE[np.frombuffer(b'\n'.join(seqs), dtype=np.uint8)]
+
+
+def direct_runs(seq):
+    '''[(base, run length)] of the ACGT runs of 2 or more in seq'''
+    return [(base, min(len(list(run)), MAX_RUN))
+            for base, run in groupby(seq.upper().decode())
+            if base in 'ACGT' for run in [list(run)] if len(run) > 1]
+
+
+def dust_score(window):
+    '''DUST triplet score of the bases of one window, N as T'''
+    window = window.upper().replace(b'N', b'T')
+    counts = {}
+    for i in range(len(window) - 2):
+        counts[window[i:i + 3]] = counts.get(window[i:i + 3], 0) + 1
+    return sum(c * (c - 1) / 2.0 for c in counts.values()) / (
+                                                        len(window) - 3)
+
+
+def direct_low_bases(seq):
+    windows = [seq[i:i + DUST_WINDOW] for i in
+               range(0, len(seq) - DUST_WINDOW + 1, DUST_WINDOW)]
+    return DUST_WINDOW * sum(dust_score(w) > DUST_LEVEL for w in windows)
+
+
+def test_homopolymer_runs_of_known_sequences():
+    codes = encode([b'AACGTTTa', b'aCCCCGN'])
+    starts, lengths = get_homopolymers(codes)
+    assert list(zip(starts.tolist(), lengths.tolist())) == [
+        (0, 2), (4, 3), (10, 4)]  # the a ending and starting reads do not join
+    codes = encode([b'AA', b'AA'])
+    assert get_homopolymers(codes)[1].tolist() == [2, 2]
+
+
+def test_run_counts_match_a_direct_count():
+    rng = np.random.RandomState(4)
+    seqs = []
+    for _ in range(300):
+        runs = [bytes([rng.choice(list(b'ACGTacgtN'))]) * rng.randint(1, 8)
+                for _ in range(rng.randint(1, 60))]
+        seqs.append(b''.join(runs) + b'G' * rng.choice([0, 0, 70]))
+    columns = rng.randint(0, 5, len(seqs)).tolist()
+    runs = new_runs()
+    add_runs(runs, seqs[:150], columns[:150])
+    add_runs(runs, seqs[150:], columns[150:])
+    expected = np.zeros_like(runs['runs'])
+    for seq, column in zip(seqs, columns):
+        for base, length in direct_runs(seq):
+            expected[column, 'ACGT'.index(base), length] += 1
+    assert (runs['runs'] == expected).all()
+    assert runs['bases'][:5].tolist() == [
+        sum(len(s) for s, c in zip(seqs, columns) if c == i)
+        for i in range(5)]
+
+
+def test_dust_scores_of_known_sequences():
+    rng = np.random.RandomState(5)
+    random = bytes(np.frombuffer(b'ACGT', dtype=np.uint8)[
+                   rng.randint(0, 4, DUST_WINDOW)])
+    seqs = [b'A' * DUST_WINDOW,  # one triplet, 62 * 61 / 2 / 61 = 31
+            b'AC' * (DUST_WINDOW // 2),  # two triplets, 2 * 31 * 30 / 2 / 61
+            b'ACG' * 22,  # three triplets, last two bases not scored
+            random,
+            b'n' * (DUST_WINDOW * 2) + b'A' * 10,  # N as T, partial window
+            b'A' * (DUST_WINDOW - 1)]  # no whole window
+    assert dust_score(seqs[0]) == 31
+    assert dust_score(seqs[1]) == pytest.approx(31 * 30 / 61.0)
+    codes = encode(seqs)
+    sizes = np.array([len(seq) for seq in seqs])
+    read_starts = np.cumsum(sizes + 1) - sizes - 1
+    low = get_low_complexity(codes, read_starts, sizes)
+    assert low.tolist() == [direct_low_bases(seq) for seq in seqs]
+    assert low.tolist() == [64, 0, 0, 0, 128, 0]
+
+
+def test_low_complexity_matches_direct_scores():
+    rng = np.random.RandomState(6)
+    seqs = []
+    for _ in range(100):
+        unit = bytes(np.frombuffer(b'ACGT', dtype=np.uint8)[
+                     rng.randint(0, 4, rng.randint(1, 12))])
+        seq = (unit * 200)[:rng.randint(1, 600)]
+        seqs.append(seq)
+    sizes = np.array([len(seq) for seq in seqs])
+    read_starts = np.cumsum(sizes + 1) - sizes - 1
+    low = get_low_complexity(encode(seqs), read_starts, sizes)
+    assert low.tolist() == [direct_low_bases(seq) for seq in seqs]
+    assert 0 < low.sum() < sizes.sum()
+
+
+def test_homopolymer_stats_in_the_summary(tmp_path):
+    data = (b'@a passes=3\n%s\n+\n%s\n@b passes=4\nAACCCgg\n+\nIIIIIII\n'
+            % (b'A' * 128, b'I' * 128))
+    fastq = write_reads(tmp_path, data)
+    stats = hifi_profiler(fastq, 1000, False, homopolymers=True,
+                          histograms=True)
+    assert stats['low_complexity_percent'] == round(100 * 128 / 135.0, 2)
+    assert stats['low_complexity_bins'] == [('0', 1), ('100', 1)]
+    assert stats['homopolymer_runs'] == {
+        'A': [('2', 1), ('{}+'.format(MAX_RUN), 1)], 'C': [('3', 1)],
+        'G': [('2', 1)], 'T': []}
+    assert [label for label, _ in stats['homopolymer_runs_by_passes']] == [
+                                                                  '3', '4']
+    assert stats['low_complexity_by_passes'] == [('3', 100.0), ('4', 0.0)]
+    assert 'homopolymer_runs' not in hifi_profiler(fastq, 1000, False)
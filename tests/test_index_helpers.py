@@ -0,0 +1,294 @@
+import io
+import os
+import gzip
+
+import numpy as np
+import pytest
+
+from sequencetools.helpers import index_helpers, target_helpers
+from sequencetools.helpers.compression_helpers import (BgzfWriter,
+                                                       read_bgzf_block,
+                                                       inflate_bgzf_block)
+from sequencetools.helpers.index_helpers import (
+    index_fasta, index_fastq, has_fasta_index, has_fastq_index,
+    get_indexed_fasta_record, get_indexed_fastq_record,
+    get_indexed_fastq_subset, get_fastq_offsets, to_virtual_offsets)
+from sequencetools.helpers.sequence_helpers import get_fastx_record
+from sequencetools.helpers.target_helpers import TargetSet
+from sequencetools.tools.chunk_fasta import chunk_fasta_n
+from sequencetools.tools.get_fasta_by_id import get_fasta_by_id
+from sequencetools.tools.get_fastq_by_id import get_fastq_by_id
+
+# FASTA layouts with the .fai samtools faidx writes for them
+FAI_CASES = {
+    'wrapped': (b'>a desc\nACGTACGT\nACGTACGT\nACG\n>b\nGG\n'
+                b'>c x y\nACGTACGT\nACGTACGT\n',
+                b'a\t19\t8\t8\t9\nb\t2\t33\t2\t3\nc\t16\t43\t8\t9\n'),
+    'crlf': (b'>a\r\nACGT\r\nAC\r\n>b\r\nGGGG\r\n',
+             b'a\t6\t4\t4\t6\nb\t4\t18\t4\t6\n'),
+    'empty': (b'>a\n>b\nACGT\n>c\n\n>d\nAC\n',
+              b'b\t4\t6\t4\t5\nd\t2\t18\t2\t3\n'),
+    'duplicate': (b'>a\nAC\n>a\nGGGG\n>b\nT\n',
+                  b'a\t2\t3\t2\t3\nb\t1\t17\t1\t2\n'),
+    'empty_duplicate': (b'>a\n>a\nACGT\n>b\nT\n>b\nGG\n',
+                        b'a\t4\t6\t4\t5\nb\t1\t14\t1\t2\n'),
+    'no_newline': (b'>a\nACGT\nAC', b'a\t6\t3\t4\t5\n'),
+    'leading_blank': (b'\n>a\nACGT\n', b'a\t4\t4\t4\t5\n'),
+}
+
+
+def write_file(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def read_file(path):
+    with open(path, 'rb') as fopen:
+        return fopen.read()
+
+
+@pytest.mark.parametrize('case', sorted(FAI_CASES))
+def test_fai_matches_samtools(tmp_path, case):
+    data, expected = FAI_CASES[case]
+    fasta = write_file(tmp_path / 'seqs.fa', data)
+    index_fasta(fasta)
+    assert read_file(fasta + '.fai') == expected
+
+
+@pytest.mark.parametrize('case', sorted(FAI_CASES))
+def test_fai_matches_htslib(tmp_path, case):
+    pysam = pytest.importorskip('pysam')
+    data = FAI_CASES[case][0]
+    reference = write_file(tmp_path / 'reference.fa', data)
+    pysam.faidx(reference)
+    fasta = write_file(tmp_path / 'seqs.fa', data)
+    index_fasta(fasta)
+    assert read_file(fasta + '.fai') == read_file(reference + '.fai')
+
+
+def test_fai_rejects_ragged_lines(tmp_path):
+    fasta = write_file(tmp_path / 'seqs.fa', b'>a\nACGT\nAC\nACGT\n')
+    with pytest.raises(ValueError):
+        index_fasta(fasta)
+
+
+def test_plain_gzip_is_not_indexed(tmp_path):
+    fasta = write_file(tmp_path / 'seqs.fa.gz', gzip.compress(b'>a\nAC\n'))
+    with pytest.raises(ValueError):
+        index_fasta(fasta)
+
+
+def make_records(file_type, count, seed):
+    '''Returns FASTA (wrapped at 70) or FASTQ bytes of count records'''
+    rng = np.random.RandomState(seed)
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    records = []
+    for i in range(count):
+        seq = bytes(bases[rng.randint(0, 4, rng.randint(1, 500))])
+        if file_type == 'fasta':
+            lines = b''.join(seq[j:j + 70] + b'\n'
+                             for j in range(0, len(seq), 70))
+            records.append(b'>id%d x=%d\n%s' % (i, i % 5, lines))
+        else:
+            records.append(b'@id%d x=%d\n%s\n+\n%s\n' % (
+                           i, i % 5, seq, b'I' * len(seq)))
+    return b''.join(records)
+
+
+def write_indexed(tmp_path, file_type, data, bgzf):
+    path = str(tmp_path / ('seqs.' + file_type))
+    if bgzf:
+        path += '.gz'
+        with BgzfWriter(path) as writer:
+            writer.write(data)
+    else:
+        write_file(tmp_path / ('seqs.' + file_type), data)
+    if file_type == 'fasta':
+        index_fasta(path)
+    else:
+        index_fastq(path)
+    return path
+
+
+def stream_records(data, file_type):
+    handle = io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)))
+    return list(get_fastx_record(handle, file_type))
+
+
+def as_tuples(records):
+    return [(r.id, r.description, r.seq, r.qual) for r in records]
+
+
+def pick_ids(count, size, seed):
+    rng = np.random.RandomState(seed)
+    return [b'id%d' % i for i in rng.choice(count, size, replace=False)]
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_indexed_fasta_lookup_matches_stream(tmp_path, bgzf):
+    data = make_records('fasta', 3000, 7)
+    fasta = write_indexed(tmp_path, 'fasta', data, bgzf)
+    assert has_fasta_index(fasta)
+    targets = TargetSet(pick_ids(3000, 400, 8) + [b'missing'], exact=True)
+    expected = [r for r in stream_records(data, 'fasta') if r.id in targets]
+    found = get_indexed_fasta_record(fasta, targets)
+    assert as_tuples(found) == as_tuples(expected)
+
+
+def test_get_fasta_by_id_same_with_index(tmp_path, capfdbinary):
+    data = make_records('fasta', 500, 9)
+    fasta = write_file(tmp_path / 'seqs.fa', data)
+    targets = write_file(tmp_path / 'targets.txt',
+                         b'\n'.join(pick_ids(500, 50, 10)) + b'\n')
+    get_fasta_by_id(fasta, targets, False)
+    streamed = capfdbinary.readouterr().out
+    index_fasta(fasta)
+    get_fasta_by_id(fasta, targets, False)
+    assert capfdbinary.readouterr().out == streamed
+    assert streamed.count(b'>') == 50
+
+
+def make_skipped_records(seed):
+    '''Returns FASTA bytes where a .fai leaves out empty sequences and
+
+       repeated names, at the start, between records and at the end
+    '''
+    data = make_records('fasta', 400, seed)
+    records = [b'>' + record for record in data.split(b'>')[1:]]
+    rng = np.random.RandomState(seed)
+    for i in sorted(rng.choice(len(records), 60, replace=False))[::-1]:
+        name = b'id%d' % rng.randint(400)
+        extra = rng.choice([b'>%s\n' % name,  # empty, maybe a repeat
+                            b'>empty%d\n\n' % i,
+                            b'>%s again\nACGT\nAC\n' % name])
+        records.insert(i, extra)
+    return b'>lead\n' + b''.join(records) + b'>id7\nGG\n>last\n'
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_indexed_fasta_keeps_records_left_out_of_fai(tmp_path, bgzf):
+    data = make_skipped_records(11)
+    fasta = write_indexed(tmp_path, 'fasta', data, bgzf)
+    streamed = stream_records(data, 'fasta')
+    assert index_fasta(fasta) < len(streamed)
+    ids = sorted(set(r.id for r in streamed))
+    rng = np.random.RandomState(12)
+    for picked in (ids, list(rng.choice(ids, 80, replace=False)),
+                   [b'lead', b'last', b'id7']):
+        targets = TargetSet(picked, exact=True)
+        expected = [r for r in streamed if r.id in targets]
+        found = get_indexed_fasta_record(fasta, targets)
+        assert as_tuples(found) == as_tuples(expected)
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_get_fasta_by_id_same_with_index_and_skipped_records(tmp_path,
+                                                             capfdbinary,
+                                                             bgzf):
+    data = make_skipped_records(13)
+    fasta = write_indexed(tmp_path, 'fasta', data, bgzf)
+    names = set(r.id for r in stream_records(data, 'fasta'))
+    targets = write_file(tmp_path / 'targets.txt',
+                         b''.join(name + b'\n' for name in sorted(names)
+                                  if not name.endswith(b'3')))
+    get_fasta_by_id(fasta, targets, False)
+    indexed = capfdbinary.readouterr().out
+    os.remove(fasta + '.fai')
+    get_fasta_by_id(fasta, targets, False)
+    assert indexed == capfdbinary.readouterr().out
+    assert indexed.count(b'>empty') and indexed.count(b' again\n')
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_indexed_fastq_lookup_matches_stream(tmp_path, bgzf):
+    data = make_records('fastq', 3000, 11)
+    fastq = write_indexed(tmp_path, 'fastq', data, bgzf)
+    assert has_fastq_index(fastq)
+    targets = TargetSet(pick_ids(3000, 400, 12) + [b'missing'],
+                        exact=True)
+    expected = [r for r in stream_records(data, 'fastq') if r.id in targets]
+    found = get_indexed_fastq_record(fastq, targets)
+    assert as_tuples(found) == as_tuples(expected)
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_indexed_fastq_subset_matches_stream(tmp_path, bgzf):
+    data = make_records('fastq', 3000, 13)
+    fastq = write_indexed(tmp_path, 'fastq', data, bgzf)
+    expected = stream_records(data, 'fastq')[6::7]
+    assert as_tuples(get_indexed_fastq_subset(fastq, 7)) == as_tuples(
+                                                                   expected)
+
+
+def test_stale_fastq_index_is_ignored(tmp_path):
+    fastq = write_indexed(tmp_path, 'fastq', make_records('fastq', 10, 14),
+                          False)
+    index = fastq + '.fqi'
+    mtime = os.path.getmtime(fastq)
+    os.utime(index, (mtime - 10, mtime - 10))
+    assert not has_fastq_index(fastq)
+
+
+def get_starts(fastq):
+    return np.array([offset for seq_id, offset in get_fastq_offsets(fastq)],
+                    dtype=np.uint64)
+
+
+def test_virtual_offsets_point_at_records(tmp_path):
+    fastq = write_indexed(tmp_path, 'fastq', make_records('fastq', 3000, 15),
+                          True)
+    virtual = to_virtual_offsets(fastq, get_starts(fastq))
+    assert len(virtual) == 3000
+    with open(fastq, 'rb') as fopen:
+        for i in range(0, 3000, 97):
+            fopen.seek(int(virtual[i]) >> 16)
+            data = inflate_bgzf_block(read_bgzf_block(fopen))
+            assert data[int(virtual[i]) & 0xffff:].startswith(b'@id%d ' % i)
+
+
+def test_virtual_offsets_match_htslib(tmp_path):
+    libcbgzf = pytest.importorskip('pysam.libcbgzf')
+    fastq = write_indexed(tmp_path, 'fastq', make_records('fastq', 3000, 16),
+                          True)
+    expected = []
+    reader = libcbgzf.BGZFile(fastq, 'rb')
+    try:
+        while True:
+            offset = reader.tell()
+            line = reader.readline()
+            if not line:
+                break
+            expected.append(offset)
+            for _ in range(3):
+                reader.readline()
+    finally:
+        reader.close()
+    assert to_virtual_offsets(fastq, get_starts(fastq)).tolist() == expected
+
+
+def test_indexed_fastq_by_id_drops_hash_collisions(tmp_path, monkeypatch,
+                                                   capfdbinary):
+    def length_hash(seq_id):  # r1 and r2 collide
+        return len(seq_id)
+    monkeypatch.setattr(target_helpers, 'hash_id', length_hash)
+    monkeypatch.setattr(index_helpers, 'hash_id', length_hash)
+    fastq = write_file(tmp_path / 'reads.fq', b'@r1 first\nACGT\n+\nIIII\n'
+                       b'@r2\nGGCC\n+\n####\n@read3\nTTTTT\n+\nIIIII\n')
+    targets = write_file(tmp_path / 'targets.txt', b'r1\n')
+    assert index_fastq(fastq) == 3
+    get_fastq_by_id(fastq, targets, False)
+    assert capfdbinary.readouterr().out == b'@r1 first\nACGT\n+\nIIII\n'
+
+
+def test_chunk_fasta_keeps_sequences_left_out_of_fai(tmp_path):
+    fasta = write_file(tmp_path / 'seqs.fa', FAI_CASES['empty'][0])
+    chunked = []
+    for name in ('scanned', 'indexed'):
+        if name == 'indexed':
+            index_fasta(fasta)
+        chunks_dir = str(tmp_path / name)
+        chunk_fasta_n(fasta, 2, chunks_dir, False, depth=0)
+        chunked.append(b''.join(read_file(os.path.join(chunks_dir, chunk))
+                                for chunk in sorted(os.listdir(chunks_dir))))
+    assert chunked[0] == chunked[1]
+    assert chunked[1].count(b'>') == 4
@@ -0,0 +1,147 @@
+import math
+
+import numpy as np
+import pytest
+
+from sequencetools.helpers import length_helpers
+from sequencetools.helpers.length_helpers import (LengthCounter,
+                                                  get_balanced_bins,
+                                                  get_ordered_bins)
+
+
+def sorted_nx(lengths, x):
+    '''Nx and Lx by walking the lengths from longest to shortest'''
+    lengths = sorted(lengths, reverse=True)
+    need = math.ceil(sum(lengths) * x / 100.0)
+    running = 0
+    for number, length in enumerate(lengths, 1):
+        running += length
+        if running >= need:
+            return length, number
+    return 0, 0
+
+
+def make_lengths(seed, size=5000):
+    rng = np.random.RandomState(seed)
+    return rng.randint(1, 20000, size).tolist() + [100] * 50
+
+
+def counter_of(lengths):
+    counter = LengthCounter()
+    counter.extend(np.array(lengths))
+    return counter
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_nx_and_lx_match_a_sorted_walk(seed):
+    lengths = make_lengths(seed)
+    percents = [0.5, 10, 25, 50, 66.6, 90, 99, 100]
+    found = counter_of(lengths).nx(percents)
+    assert found == {x: sorted_nx(lengths, x) for x in percents}
+
+
+def test_nx_of_known_lengths():
+    counter = counter_of([2, 2, 2, 3, 3, 4, 8, 8])  # total 32
+    assert counter.nx([50, 90, 100]) == {50: (8, 2), 90: (2, 7),
+                                         100: (2, 8)}
+    assert counter.aun() == round((3 * 4 + 2 * 9 + 16 + 2 * 64) / 32)
+
+
+def test_one_length_repeated():
+    counter = counter_of([10] * 10)
+    assert counter.nx([10, 50, 100]) == {10: (10, 1), 50: (10, 5),
+                                         100: (10, 10)}
+    assert counter.aun() == 10
+
+
+def test_aun_matches_direct_sum():
+    lengths = make_lengths(4)
+    total = sum(lengths)
+    assert counter_of(lengths).aun() == round(
+                                 sum(l * l for l in lengths) / float(total))
+
+
+def test_summary_values():
+    lengths = make_lengths(5)
+    counter = LengthCounter()
+    for length in lengths:
+        counter.add(length)
+    assert len(counter) == len(lengths)
+    assert counter.total() == sum(lengths)
+    assert counter.min() == min(lengths) and counter.max() == max(lengths)
+    assert counter.mean() == round(sum(lengths) / len(lengths))
+
+
+def test_empty_counter():
+    counter = LengthCounter()
+    assert len(counter) == 0 and counter.total() == 0
+    assert counter.min() == counter.max() == counter.mean() == 0
+    assert counter.nx([50]) == {50: (0, 0)}
+    assert counter.aun() == 0
+
+
+def test_buffer_folds_into_counts(monkeypatch):
+    monkeypatch.setattr(length_helpers, 'LENGTH_BUFFER', 64)
+    lengths = make_lengths(6)
+    counter = LengthCounter()
+    for i in range(0, len(lengths), 50):
+        counter.extend(np.array(lengths[i:i + 50]))
+        assert len(counter._buffer) < 64 + 50
+    assert len(counter.values) == len(set(lengths))
+    assert counter.nx([50]) == {50: sorted_nx(lengths, 50)}
+
+
+def test_merged_counters_equal_one_counter():
+    lengths = make_lengths(7)
+    merged = LengthCounter()
+    for i in range(0, len(lengths), 700):
+        merged.merge(counter_of(lengths[i:i + 700]))
+    whole = counter_of(lengths)
+    assert merged.nx([10, 50, 90]) == whole.nx([10, 50, 90])
+    assert merged.aun() == whole.aun() and len(merged) == len(whole)
+
+
+def bin_totals(lengths, assigned, bins):
+    totals = [0] * bins
+    for length, b in zip(lengths, assigned):
+        totals[b] += length
+    return totals
+
+
+def test_balanced_bins_pack_longest_first():
+    lengths = [3, 7, 2, 5, 3, 4]
+    assigned = get_balanced_bins(lengths, 3)
+    assert assigned == [2, 0, 0, 1, 1, 2]  # 7, 5, 4, 3, 3, 2 in turn
+    assert bin_totals(lengths, assigned, 3) == [9, 8, 7]
+
+
+def test_balanced_bins_beat_the_ordered_cut():
+    lengths = [100] + [1] * 100 + [100]  # huge sequences at both ends
+    balanced = bin_totals(lengths, get_balanced_bins(lengths, 4), 4)
+    ordered = bin_totals(lengths, get_ordered_bins(lengths, 4), 4)
+    assert sorted(balanced) == [50, 50, 100, 100]
+    assert max(ordered) > max(balanced) == max(lengths)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('bins', [1, 3, 16])
+def test_balanced_bins_are_within_one_length_of_even(seed, bins):
+    lengths = np.random.RandomState(seed).randint(1, 10 ** 6, 500).tolist()
+    totals = bin_totals(lengths, get_balanced_bins(lengths, bins), bins)
+    assert sum(totals) == sum(lengths)
+    assert max(totals) <= sum(lengths) / bins + max(lengths)
+    assert max(totals) - min(totals) <= max(lengths)
+
+
+def test_more_bins_than_lengths():
+    assert get_balanced_bins([5, 9, 1], 8) == [1, 0, 2]
+    assert get_balanced_bins([], 4) == []
+    assert get_ordered_bins([10] * 5, 8) == [0, 1, 3, 4, 6]
+
+
+def test_ordered_bins_keep_order_and_cut_evenly():
+    lengths = [10] * 100
+    assigned = get_ordered_bins(lengths, 4)
+    assert assigned == sorted(assigned)
+    assert bin_totals(lengths, assigned, 4) == [250] * 4
+    assert get_ordered_bins([0, 0], 3) == [0, 0]
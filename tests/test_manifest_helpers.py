@@ -0,0 +1,180 @@
+import io
+import gzip
+import os
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from sequencetools.helpers.compression_helpers import BgzfWriter
+from sequencetools.helpers.index_helpers import (index_fasta,
+                                                 get_fasta_offsets)
+from sequencetools.helpers.manifest_helpers import (read_manifest,
+                                                    get_range_data,
+                                                    get_fasta_records)
+from sequencetools.helpers.range_helpers import RANGE_READ_SIZE
+from sequencetools.helpers.sequence_helpers import get_fastx_record
+from sequencetools.tools import extract_chunk as extract_chunk_tool
+from sequencetools.tools.chunk_fasta import chunk_fasta_manifest
+from sequencetools.tools.chunk_fastq import chunk_fastq_manifest
+from sequencetools.tools.extract_chunk import extract_chunk
+
+
+def random_seqs(rng, count, low, high):
+    '''Returns count random ACGT sequences of low to high bases'''
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    sizes = rng.randint(low, high, count)
+    letters = bytes(bases[rng.randint(0, 4, int(sizes.sum()))])
+    ends = np.cumsum(sizes)
+    return [letters[int(end - size):int(end)]
+            for size, end in zip(sizes, ends)]
+
+
+def make_fastq(count=12000, seed=5):
+    rng = np.random.RandomState(seed)
+    return b''.join(b'@r%d\n%s\n+\n%s\n' % (i, seq, b'I' * len(seq))
+                    for i, seq in enumerate(random_seqs(rng, count, 20,
+                                                        200)))
+
+
+def make_fasta(count=300, seed=6):
+    rng = np.random.RandomState(seed)
+    records = []
+    for i, seq in enumerate(random_seqs(rng, count, 10, 20000)):
+        lines = b''.join(seq[j:j + 60] + b'\n'
+                         for j in range(0, len(seq), 60))
+        records.append(b'>s%d length=%d\n%s' % (i, len(seq), lines))
+    return b''.join(records)
+
+
+FASTQ = make_fastq()
+FASTA = make_fasta()
+
+
+def write_input(tmp_path, data, name, compression):
+    '''Writes data to tmp_path/name plain, 'bgzf' or 'gzip' compressed'''
+    path = str(tmp_path / name)
+    if compression == 'bgzf':
+        path += '.gz'
+        with BgzfWriter(path) as writer:
+            writer.write(data)
+    elif compression == 'gzip':
+        path += '.gz'
+        with gzip.open(path, 'wb', compresslevel=1) as gopen:
+            gopen.write(data)
+    else:
+        with open(path, 'wb') as wopen:
+            wopen.write(data)
+    return path
+
+
+def extract_all(tmp_path, manifest):
+    '''Returns the bytes of each chunk of manifest by chunk number'''
+    source, size, chunks = read_manifest(manifest)
+    extracted = {}
+    for chunk, ranges in chunks.items():
+        output = str(tmp_path / 'chunk{}'.format(chunk))
+        total = extract_chunk(source, ranges, output, False)
+        with open(output, 'rb') as fopen:
+            extracted[chunk] = fopen.read()
+        assert total == len(extracted[chunk])
+    return extracted
+
+
+def get_records(data):
+    '''Returns the sorted (id, seq) of the FASTA records in data'''
+    handle = io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)))
+    return sorted((r.id, r.seq) for r in get_fastx_record(handle, 'fasta'))
+
+
+@pytest.mark.parametrize('compression', ['plain', 'bgzf', 'gzip'])
+def test_fastq_manifest_chunks_concatenate_to_input(tmp_path, compression):
+    fastq = write_input(tmp_path, FASTQ, 'reads.fq', compression)
+    manifest = str(tmp_path / 'chunks.tsv')
+    chunk_fastq_manifest(fastq, manifest, 1000)
+    source, size, chunks = read_manifest(manifest)
+    assert source == os.path.abspath(fastq)
+    assert size == os.path.getsize(fastq)
+    assert sorted(chunks) == list(range(1, 13))
+    assert all(ranges[0][2] == 1000 for ranges in chunks.values())
+    extracted = extract_all(tmp_path, manifest)
+    assert b''.join(extracted[c] for c in sorted(extracted)) == FASTQ
+    assert extracted[3].startswith(b'@r2000\n')
+
+
+@pytest.mark.parametrize('compression', ['plain', 'bgzf', 'gzip'])
+@pytest.mark.parametrize('byte_chunks', [False, True])
+def test_fasta_manifest_chunks_concatenate_to_input(tmp_path, compression,
+                                                    byte_chunks):
+    fasta = write_input(tmp_path, FASTA, 'seqs.fa', compression)
+    manifest = str(tmp_path / 'chunks.tsv')
+    chunk_fasta_manifest(fasta, manifest, 300000 if byte_chunks else 40,
+                         byte_chunks)
+    extracted = extract_all(tmp_path, manifest)
+    assert len(extracted) > 2
+    assert b''.join(extracted[c] for c in sorted(extracted)) == FASTA
+
+
+def test_fasta_manifest_from_fai(tmp_path):
+    fasta = write_input(tmp_path, FASTA, 'seqs.fa', 'bgzf')
+    scanned = str(tmp_path / 'scanned.tsv')
+    chunk_fasta_manifest(fasta, scanned, 40, False)
+    index_fasta(fasta)
+    indexed = str(tmp_path / 'indexed.tsv')
+    chunk_fasta_manifest(fasta, indexed, 40, False)
+    assert read_manifest(indexed) == read_manifest(scanned)
+
+
+def test_duplicate_names_skipped_by_the_fai_are_scanned(tmp_path):
+    data = b'>a\nACGT\n>b x\nAC\nG\n>a\nTT\n>c\n\n>d\nA\n'
+    fasta = write_input(tmp_path, data, 'dups.fa', 'plain')
+    scanned = get_fasta_records(fasta)
+    assert scanned == [(b'a', 4, 0, 8), (b'b', 3, 8, 18), (b'a', 2, 18, 24),
+                       (b'c', 0, 24, 28), (b'd', 1, 28, 33)]
+    assert [(i, s, e, n) for i, n, s, e in scanned] == list(
+                                                  get_fasta_offsets(fasta))
+    index_fasta(fasta)
+    assert get_fasta_records(fasta) == scanned
+
+
+@pytest.mark.parametrize('balance', [False, True])
+def test_fasta_manifest_n_chunks_cover_input(tmp_path, balance):
+    fasta = write_input(tmp_path, FASTA, 'seqs.fa', 'plain')
+    manifest = str(tmp_path / 'chunks.tsv')
+    chunk_fasta_manifest(fasta, manifest, None, False, 7, balance)
+    source, size, chunks = read_manifest(manifest)
+    assert sorted(chunks) == list(range(1, 8))
+    ranges = sorted(r for chunk in chunks.values() for r in chunk)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(FASTA)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert sum(r[2] for r in ranges) == 300
+    extracted = extract_all(tmp_path, manifest)
+    assert get_records(b''.join(extracted.values())) == get_records(FASTA)
+    if not balance:
+        assert b''.join(extracted[c] for c in sorted(extracted)) == FASTA
+
+
+def test_range_data_spans_read_steps(tmp_path):
+    fastq = write_input(tmp_path, FASTQ, 'reads.fq', 'bgzf')
+    start = RANGE_READ_SIZE - 100
+    ranges = [(10, 20), (start, start + RANGE_READ_SIZE + 200)]
+    expected = b''.join(FASTQ[a:b] for a, b in ranges)
+    assert b''.join(get_range_data(fastq, ranges)) == expected
+
+
+def test_extract_chunk_command(tmp_path):
+    fastq = write_input(tmp_path, FASTQ, 'reads.fq', 'bgzf')
+    manifest = str(tmp_path / 'chunks.tsv')
+    chunk_fastq_manifest(fastq, manifest, 5000)
+    output = str(tmp_path / 'chunk2.fq.gz')
+    result = CliRunner().invoke(extract_chunk_tool.main, [
+                '--manifest', manifest, '--chunk', '2', '--output', output,
+                '--log_file', str(tmp_path / 'extract_chunk.log')])
+    assert result.exit_code == 0, result.output
+    with gzip.open(output, 'rb') as gopen:  # BGZF from the .gz name
+        assert gopen.read() == FASTQ[FASTQ.index(b'@r5000\n'):
+                                     FASTQ.index(b'@r10000\n')]
+    result = CliRunner().invoke(extract_chunk_tool.main, [
+                '--manifest', manifest, '--chunk', '9',
+                '--log_file', str(tmp_path / 'extract_chunk.log')])
+    assert result.exit_code == 1
@@ -0,0 +1,219 @@
+import io
+import os
+import sys
+import gzip
+import threading
+
+import pytest
+
+from sequencetools.helpers import output_helpers
+from sequencetools.helpers.file_helpers import return_output_handle
+from sequencetools.helpers.output_helpers import (BackgroundWriter,
+                                                  ChunkWriterPool,
+                                                  HandlePool, PooledChunk)
+
+
+class RecordingHandle(io.RawIOBase):
+    '''Binary handle keeping every write, optionally failing on one'''
+
+    def __init__(self, fail_at=None):
+        self.writes = []
+        self.fail_at = fail_at
+        self.flushes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if len(self.writes) == self.fail_at:
+            raise OSError('disk full')
+        self.writes.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def pieces(count=2000):
+    '''Writes of varied sizes, some smaller and some larger than a buffer'''
+    return [bytes([65 + i % 26]) * ((i * 37) % 150) for i in range(count)]
+
+
+@pytest.mark.parametrize('buffer_size', [64, 100, 4096])
+def test_bytes_keep_their_order(buffer_size):
+    handle = RecordingHandle()
+    writer = BackgroundWriter(handle, buffer_size, depth=2)
+    data = pieces()
+    for piece in data:
+        assert writer.write(piece) == len(piece)
+    writer.close()
+    assert b''.join(handle.writes) == b''.join(data)
+    assert handle.closed
+
+
+def test_large_writes_skip_the_buffer():
+    handle = RecordingHandle()
+    writer = BackgroundWriter(handle, 64)
+    writer.write(b'a' * 10)
+    writer.write(b'b' * 200)  # larger than the buffer, queued as is
+    writer.write(b'c' * 10)
+    writer.close()
+    assert handle.writes == [b'a' * 10, b'b' * 200, b'c' * 10]
+
+
+def test_large_write_copies_the_caller_buffer():
+    handle = RecordingHandle()
+    writer = BackgroundWriter(handle, 64)
+    data = bytearray(b'x' * 200)
+    writer.write(data)
+    data[:] = b'y' * 200  # reused by the caller before the thread ran
+    writer.close()
+    assert handle.writes == [b'x' * 200]
+
+
+def test_writer_thread_errors_reach_the_caller():
+    handle = RecordingHandle(fail_at=1)
+    writer = BackgroundWriter(handle, 64)
+    with pytest.raises(OSError):
+        for piece in pieces():
+            writer.write(piece)
+        writer.flush()
+    with pytest.raises(OSError):  # no writes after a gap
+        writer.write(b'a')
+    writer.close()  # already reported
+    assert writer.closed and handle.closed
+    assert len(handle.writes) == 1
+
+
+def test_error_is_raised_by_close():
+    writer = BackgroundWriter(RecordingHandle(fail_at=0), 64)
+    writer.write(b'a' * 10)
+    with pytest.raises(OSError):
+        writer.close()
+    assert writer.closed
+
+
+def test_flush_reaches_the_handle():
+    handle = RecordingHandle()
+    writer = BackgroundWriter(handle, 1024)
+    writer.write(b'abc')
+    writer.flush()
+    assert handle.writes == [b'abc'] and handle.flushes == 1
+    writer.close()
+
+
+def test_stdout_stays_open(capfdbinary):
+    for _ in range(2):
+        with return_output_handle(None, False) as output:
+            output.write(b'>a\nACGT\n')
+    assert capfdbinary.readouterr().out == b'>a\nACGT\n' * 2
+    os.fstat(sys.stdout.fileno())  # not closed by the writer
+
+
+def test_gzip_output_through_the_writer(tmp_path):
+    path = str(tmp_path / 'out.fa.gz')
+    data = b''.join(pieces())
+    with return_output_handle(path, True, 2) as output:
+        for i in range(0, len(data), 1000):
+            output.write(data[i:i + 1000])
+    with gzip.open(path, 'rb') as gopen:
+        assert gopen.read() == data
+
+
+def test_handle_pool_reopens_evicted_files_for_append(tmp_path):
+    paths = [str(tmp_path / '{}.txt'.format(i)) for i in range(5)]
+    opened = []
+
+    def opener(path, mode):
+        opened.append(mode)
+        return open(path, mode)
+    with HandlePool(opener, 2) as pool:
+        for round_number in range(3):
+            for path in paths:
+                pool.get(path).write(b'%d' % round_number)
+    assert pool.paths == paths
+    assert opened.count('wb') == len(paths)
+    for path in paths:
+        with open(path, 'rb') as fopen:
+            assert fopen.read() == b'012'
+
+
+def test_handle_pool_replaces_files_from_an_earlier_run(tmp_path):
+    path = tmp_path / 'old.txt'
+    path.write_bytes(b'old data')
+    with HandlePool(open) as pool:
+        pool.get(str(path)).write(b'new')
+    assert path.read_bytes() == b'new'
+
+
+@pytest.mark.parametrize('gzip_me', [False, True])
+@pytest.mark.parametrize('threads', [1, 4])
+def test_pooled_chunks_keep_their_bytes_in_order(tmp_path, gzip_me,
+                                                 threads):
+    data = pieces(300)
+    paths = [str(tmp_path / '{:06d}.txt'.format(i)) for i in range(40)]
+    with ChunkWriterPool(threads, gzip_me, max_pending=3) as pool:
+        for i, path in enumerate(paths):
+            chunk = pool.open(path)
+            assert isinstance(chunk, PooledChunk)
+            for piece in data[i:]:
+                chunk.write(piece)
+            chunk.close()
+            with pytest.raises(ValueError):
+                chunk.write(b'a')
+    opener = gzip.open if gzip_me else open
+    for i, path in enumerate(paths):
+        with opener(path, 'rb') as fopen:
+            assert fopen.read() == b''.join(data[i:])
+
+
+def test_pool_holds_at_most_max_pending_chunks(tmp_path, monkeypatch):
+    release = threading.Event()
+    started = []
+
+    def write_file(write_me, data, gzip_me, level):
+        started.append(write_me)
+        release.wait(5)
+    monkeypatch.setattr(output_helpers, 'write_file', write_file)
+    pool = ChunkWriterPool(1, False, max_pending=2)
+    pool.submit('a', b'')
+    pool.submit('b', b'')
+    done = threading.Event()
+
+    def submit_third():
+        pool.submit('c', b'')
+        done.set()
+    thread = threading.Thread(target=submit_third)
+    thread.start()
+    assert not done.wait(0.2)  # waits for the oldest chunk
+    release.set()
+    thread.join(5)
+    assert done.is_set()
+    pool.close()
+    assert started == ['a', 'b', 'c']
+
+
+def test_pool_worker_errors_reach_the_caller(tmp_path, monkeypatch):
+    def write_file(write_me, data, gzip_me, level):
+        if write_me.endswith('3.txt'):
+            raise OSError('disk full')
+        with open(write_me, 'wb') as fopen:
+            fopen.write(data)
+    monkeypatch.setattr(output_helpers, 'write_file', write_file)
+    with pytest.raises(OSError, match='disk full'):
+        with ChunkWriterPool(2, False, max_pending=2) as pool:
+            for i in range(10):
+                with pool.open(str(tmp_path / '{}.txt'.format(i))) as chunk:
+                    chunk.write(b'%d' % i)
+    assert (tmp_path / '0.txt').read_bytes() == b'0'
+    assert not (tmp_path / '3.txt').exists()
+
+
+def test_pool_close_raises_a_late_worker_error(tmp_path, monkeypatch):
+    def write_file(write_me, data, gzip_me, level):
+        raise OSError('disk full')
+    monkeypatch.setattr(output_helpers, 'write_file', write_file)
+    pool = ChunkWriterPool(2, False)
+    pool.submit(str(tmp_path / 'a.txt'), b'a')
+    with pytest.raises(OSError, match='disk full'):
+        pool.close()
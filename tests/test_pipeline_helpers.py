@@ -0,0 +1,211 @@
+import io
+import gzip
+import queue
+import threading
+
+import pytest
+
+from sequencetools.helpers.pipeline_helpers import (BlockReader,
+                                                    RecordProducer,
+                                                    get_record_batches,
+                                                    get_pipeline_record,
+                                                    read_ahead)
+
+FASTQ = b''.join(b'@r%d\nACGT\n+\nIIII\n' % i for i in range(5000))
+
+
+class Records(object):
+    '''Iterator over range(count) that can fail at one item and records
+
+       whether it was closed and from which thread
+    '''
+
+    def __init__(self, count, fail_at=None):
+        self.items = iter(range(count))
+        self.fail_at = fail_at
+        self.closed_by = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self.items)
+        if item == self.fail_at:
+            raise ValueError('bad record %d' % item)
+        return item
+
+    def close(self):
+        self.closed_by = threading.current_thread()
+
+
+class Source(io.RawIOBase):
+    '''Binary source of count size byte reads that can fail at one read
+
+       and records how many reads were made and whether it was closed
+    '''
+
+    def __init__(self, count, size, fail_at=None):
+        self.count = count
+        self.size = size
+        self.fail_at = fail_at
+        self.reads = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if self.reads == self.fail_at:
+            raise OSError('read failed')
+        if self.reads == self.count:
+            return b''
+        self.reads += 1
+        return bytes([self.reads % 256]) * self.size
+
+
+def expected_blocks(count, size):
+    return b''.join(bytes([i % 256]) * size for i in range(1, count + 1))
+
+
+def write_gzip(path, data):
+    with gzip.open(str(path), 'wb') as gopen:
+        gopen.write(data)
+    return str(path)
+
+
+def open_stream(data):
+    return io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)))
+
+
+@pytest.mark.parametrize('depth', [0, 1, 8])
+def test_batches_keep_record_order(depth):
+    batches = list(get_record_batches(iter(range(1000)), 64, depth))
+    assert [len(batch) for batch in batches] == [64] * 15 + [40]
+    assert [i for batch in batches for i in batch] == list(range(1000))
+
+
+def test_pipeline_record_matches_the_parser():
+    records = list(get_pipeline_record(open_stream(FASTQ), 'fastq',
+                                       batch_size=100, depth=2))
+    assert len(records) == 5000
+    assert b''.join(r.format('fastq') for r in records) == FASTQ
+
+
+def test_producer_ends_with_none_and_closes_the_records():
+    records = Records(10)
+    producer = RecordProducer(records, queue.Queue(), 4)
+    producer.run()
+    items = [producer.batches.get() for _ in range(4)]
+    assert items == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9], None]
+    assert records.closed_by is threading.current_thread()
+
+
+def test_producer_errors_reach_the_consumer():
+    records = Records(1000, fail_at=500)
+    batches = get_record_batches(records, 64, 2)
+    seen = []
+    with pytest.raises(ValueError, match='bad record 500'):
+        for batch in batches:
+            seen.extend(batch)
+    assert seen == list(range(448))  # the batches before the failing one
+    assert records.closed_by is not None
+    assert records.closed_by is not threading.current_thread()
+
+
+def test_stopping_early_ends_the_producer():
+    records = Records(10 ** 6)
+    batches = get_record_batches(records, 16, 1)
+    assert next(batches) == list(range(16))
+    producer = [thread for thread in threading.enumerate()
+                if isinstance(thread, RecordProducer)]
+    assert len(producer) == 1
+    batches.close()
+    producer[0].join(5)
+    assert not producer[0].is_alive()
+    assert records.closed_by is producer[0]
+    assert next(records.items) < 100  # blocked on the queue, not draining
+
+
+def test_stop_releases_a_blocked_put():
+    producer = RecordProducer(Records(100), queue.Queue(maxsize=1), 10)
+    producer.start()
+    assert producer.batches.get(timeout=5) == list(range(10))
+    producer.stop.set()  # the producer is waiting on a full queue
+    producer.join(5)
+    assert not producer.is_alive()
+
+
+def test_gzip_records_through_reader_thread(tmp_path):
+    fastq = write_gzip(tmp_path / 'reads.fq.gz', FASTQ)
+    records = list(get_pipeline_record(gzip.open(fastq, 'rt'), 'fastq'))
+    assert len(records) == 5000
+    assert b''.join(r.format('fastq') for r in records) == FASTQ
+    inline = list(get_pipeline_record(gzip.open(fastq, 'rt'), 'fastq',
+                                      depth=0))
+    assert [r.id for r in inline] == [r.id for r in records]
+
+
+def test_plain_files_are_not_read_ahead(tmp_path):
+    fastq = tmp_path / 'reads.fq'
+    fastq.write_bytes(FASTQ)
+    handle = open(str(fastq))
+    assert read_ahead(handle) is handle  # memory mapped by the parser
+    handle.close()
+
+
+def test_read_errors_reach_the_caller(tmp_path):
+    fastq = write_gzip(tmp_path / 'reads.fq.gz', FASTQ)
+    with open(fastq, 'rb') as fopen:
+        data = fopen.read()
+    cut = tmp_path / 'cut.fq.gz'
+    cut.write_bytes(data[:len(data) // 2])
+    with pytest.raises(EOFError):
+        list(get_pipeline_record(gzip.open(str(cut), 'rt'), 'fastq'))
+
+
+def test_stopping_early_ends_the_threads(tmp_path):
+    fastq = write_gzip(tmp_path / 'reads.fq.gz', FASTQ * 20)
+    before = threading.active_count()
+    records = get_pipeline_record(gzip.open(fastq, 'rt'), 'fastq',
+                                  batch_size=16, depth=1)
+    assert next(records).id == b'r0'
+    records.close()
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and thread.daemon:
+            thread.join(5)
+    assert threading.active_count() <= before
+
+
+@pytest.mark.parametrize('depth', [1, 4])
+def test_block_reader_reads_every_block_in_order(depth):
+    source = Source(50, 1000)
+    reader = BlockReader(source, 1000, depth)
+    assert io.BufferedReader(reader).read() == expected_blocks(50, 1000)
+    assert reader.read(10) == b''
+    reader.close()
+    assert source.closed and not reader._thread.is_alive()
+
+
+def test_block_reader_errors_reach_the_caller():
+    source = Source(50, 1000, fail_at=20)
+    reader = BlockReader(source, 1000, 2)
+    data = bytearray()
+    with pytest.raises(OSError, match='read failed'):
+        while True:
+            chunk = reader.read(300)
+            if not chunk:
+                break
+            data += chunk
+    assert data == expected_blocks(20, 1000)  # the blocks before the error
+    assert reader.read(10) == b''
+    reader.close()
+    assert source.closed
+
+
+def test_closing_early_stops_the_block_reader():
+    source = Source(10 ** 6, 1000)
+    reader = BlockReader(source, 1000, 2)
+    assert reader.read(10) == b'\x01' * 10
+    reader.close()  # the thread is waiting on a full queue
+    assert not reader._thread.is_alive()
+    assert source.closed
+    assert source.reads < 10  # stopped, not drained
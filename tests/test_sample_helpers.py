@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from sequencetools.helpers.compression_helpers import BgzfWriter
+from sequencetools.helpers.range_helpers import RangeSource
+from sequencetools.helpers.sample_helpers import (ByteSample, estimate_sum,
+                                                  get_interval)
+
+
+def make_fastq(count=3000, seed=1):
+    '''FASTQ whose qualities start with @ and contain +, so a line
+
+       starting with @ is not always a header
+    '''
+    rng = np.random.RandomState(seed)
+    records = []
+    for i in range(count):
+        size = rng.randint(20, 200)
+        seq = bytes(np.frombuffer(b'ACGT', dtype=np.uint8)[
+                    rng.randint(0, 4, size)])
+        qual = b'@+' + bytes(rng.randint(35, 74, size - 2).astype(np.uint8))
+        records.append(b'@read%d\n%s\n+\n%s\n' % (i, seq, qual))
+    return b''.join(records)
+
+
+def write_data(tmp_path, name, data, bgzf):
+    path = str(tmp_path / (name + ('.gz' if bgzf else '')))
+    if bgzf:
+        with BgzfWriter(path) as writer:
+            writer.write(data)
+    else:
+        with open(path, 'wb') as fopen:
+            fopen.write(data)
+    return path
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_fastq_record_starts_skip_quality_lines(tmp_path, bgzf):
+    data = make_fastq()
+    lines = data.splitlines(True)
+    starts = np.cumsum([0] + [len(line) for line in lines])[:-1:4].tolist()
+    source = RangeSource(write_data(tmp_path, 'reads.fq', data, bgzf))
+    try:
+        for start in range(1, len(data), 997):
+            found = source.find_record(start, 'fastq')
+            following = [s for s in starts if s >= start]
+            assert found == min(following + [len(data)])
+    finally:
+        source.close()
+
+
+@pytest.mark.parametrize('bgzf', [False, True])
+def test_windows_are_record_aligned_and_repeatable(tmp_path, bgzf):
+    data = make_fastq()
+    fastq = write_data(tmp_path, 'reads.fq', data, bgzf)
+    sample = ByteSample(fastq, 'fastq', count=10, size=2000, seed=3)
+    again = ByteSample(fastq, 'fastq', count=10, size=2000, seed=3)
+    assert sample.windows == again.windows
+    assert sample.scale == len(data) / 20000.0
+    for ranges in sample.windows:
+        for start, end in ranges:
+            assert data[start:start + 5] == b'@read'
+            assert end == len(data) or data[end:end + 5] == b'@read'
+    for records in sample.get_window_records():
+        for record in records:
+            assert len(record.seq) == len(record.qual)
+            assert record.id.startswith(b'read')
+
+
+def test_sample_as_large_as_the_file_is_refused(tmp_path):
+    fastq = write_data(tmp_path, 'reads.fq', make_fastq(100), False)
+    with pytest.raises(ValueError):
+        ByteSample(fastq, 'fastq', count=100, size=10 ** 6)
+
+
+def test_interval_and_sum_of_known_windows(tmp_path):
+    fastq = write_data(tmp_path, 'reads.fq', make_fastq(), False)
+    sample = ByteSample(fastq, 'fastq', count=4, size=1000, seed=1)
+    resamples = np.array([[0, 0, 0, 0], [1, 1, 1, 1], [0, 1, 2, 3]])
+    estimate, (low, high) = estimate_sum(sample, [1, 2, 3, 4], resamples)
+    assert estimate == round(10 * sample.scale)
+    assert low == round(np.percentile([4, 8, 10], 2.5) * sample.scale)
+    assert high == round(np.percentile([4, 8, 10], 97.5) * sample.scale)
+    assert get_interval(list(range(101))) == (2, 98)
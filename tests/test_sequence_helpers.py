@@ -0,0 +1,280 @@
+import io
+import gzip
+import mmap
+from functools import lru_cache
+
+import numpy as np
+import pytest
+
+from sequencetools.helpers import sequence_helpers
+from sequencetools.helpers.sequence_helpers import (get_mapped_fasta_record,
+                                                    get_fasta_record,
+                                                    get_fastx_record,
+                                                    get_fastq_length,
+                                                    get_raw_fastq_blocks,
+                                                    check_sequence_length,
+                                                    scan_fastq,
+                                                    READ_SIZE)
+from sequencetools.tools.fastx_converter import fastx_converter
+from sequencetools.tools.filter_fasta_by_length import filter_fasta_by_length
+
+WRAPPED_FASTA = (b'>one first\nACGTACGTAC\nGTACGT\n'
+                 b'>two\nAAAA\r\nCCCC\r\nGG\r\n'
+                 b'>three\n\n')
+
+
+def write_file(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_mapped_fasta_len_skips_line_breaks(tmp_path):
+    fasta = write_file(tmp_path / 'wrapped.fa', WRAPPED_FASTA)
+    with open(fasta, 'rb') as fopen:
+        mapped = mmap.mmap(fopen.fileno(), 0, access=mmap.ACCESS_READ)
+    records = list(get_mapped_fasta_record(mapped))
+    assert [len(record) for record in records] == [16, 10, 0]
+    assert [record.seq for record in records] == [b'ACGTACGTACGTACGT',
+                                                  b'AAAACCCCGG', b'']
+
+
+def test_mapped_fasta_seq_after_qual_is_set(tmp_path):
+    fasta = write_file(tmp_path / 'wrapped.fa', WRAPPED_FASTA)
+    with open(fasta, 'rb') as fopen:
+        mapped = mmap.mmap(fopen.fileno(), 0, access=mmap.ACCESS_READ)
+    record = next(get_mapped_fasta_record(mapped))
+    record.qual = b'I' * len(record)
+    assert record.seq == b'ACGTACGTACGTACGT'
+    assert record.format('fastq') == (b'@one first\nACGTACGTACGTACGT\n+\n'
+                                      b'IIIIIIIIIIIIIIII\n')
+
+
+def test_fastx_converter_wrapped_fasta_to_fastq(tmp_path, capfdbinary):
+    fasta = write_file(tmp_path / 'wrapped.fa', WRAPPED_FASTA)
+    fastx_converter(fasta, 'fasta', 'fastq', 40)
+    with open(fasta) as fopen:  # the streamed parser as a reference
+        expected = b''.join(record.format('fastq') for record in
+                            _with_qual(get_fasta_record(fopen)))
+    assert capfdbinary.readouterr().out == expected
+    assert expected.startswith(b'@one first\nACGTACGTACGTACGT\n+\n')
+
+
+@pytest.mark.parametrize('reverse, kept', [(False, [b'one', b'two']),
+                                          (True, [b'two', b'three'])])
+def test_check_sequence_length(reverse, kept):
+    lengths = {b'one': 16, b'two': 10, b'three': 0}
+    assert [name for name, seq_length in lengths.items()
+            if check_sequence_length(seq_length, 10, reverse)] == kept
+
+
+def test_length_filter_copies_only_kept_sequences(tmp_path, monkeypatch):
+    fasta = write_file(tmp_path / 'wrapped.fa', WRAPPED_FASTA * 100)
+    copies = []
+    seq = sequence_helpers.MappedFastxRecord.seq
+
+    def counted(record):
+        copies.append(record.id)
+        return seq.fget(record)
+    monkeypatch.setattr(sequence_helpers.MappedFastxRecord, 'seq',
+                        property(counted))
+    output = str(tmp_path / 'long.fa')
+    filter_fasta_by_length(fasta, 12, False, output_file=output)
+    with open(output, 'rb') as fopen:
+        assert fopen.read() == b'>one first\nACGTACGTACGTACGT\n' * 100
+    assert copies == [b'one'] * 100  # formatted, the rest only counted
+
+
+def _with_qual(records):
+    for record in records:
+        record.qual = b'I' * len(record.seq)  # Q40 as solexa_to_sanger(40)
+        yield record
+
+
+def random_bases(rng, size):
+    return bytes(np.frombuffer(b'ACGT', dtype=np.uint8)[rng.randint(0, 4,
+                                                                    size)])
+
+
+@lru_cache()
+def make_fasta(wrap, count=400, seed=1):
+    '''Returns (fasta bytes, [(id, description, seq)]), long enough for
+
+       the block parser to cross READ_SIZE boundaries
+    '''
+    rng = np.random.RandomState(seed)
+    lines = []
+    expected = []
+    size = READ_SIZE * 2 // count + 1
+    for i in range(count):
+        seq = random_bases(rng, rng.randint(1, size * 2))
+        seq_id = b'seq%d' % i
+        description = seq_id + (b' sample=%d' % i if i % 2 else b'')
+        expected.append((seq_id, description, seq))
+        lines.append(b'>' + description + b'\n')
+        if wrap:
+            lines.extend(seq[j:j + wrap] + b'\n'
+                         for j in range(0, len(seq), wrap))
+        else:
+            lines.append(seq + b'\n')
+    return b''.join(lines), expected
+
+
+@lru_cache()
+def make_fastq(count=30000, seed=2):
+    rng = np.random.RandomState(seed)
+    records = []
+    for i in range(count):
+        seq = random_bases(rng, rng.randint(1, 300))
+        qual = bytes(rng.randint(33, 75, len(seq)).astype(np.uint8))
+        records.append(b'@read%d pass=%d\n%s\n+\n%s\n' % (i, i % 7, seq,
+                                                          qual))
+    return b''.join(records)
+
+
+def open_stream(data):
+    '''Text handle over data that is not a file, as with stdin'''
+    return io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)))
+
+
+def open_mapped(tmp_path, data, name):
+    '''Handle on a plain file, which the parsers memory map'''
+    path = tmp_path / name
+    path.write_bytes(data)
+    return open(str(path))
+
+
+def open_gzip(tmp_path, data, name):
+    path = tmp_path / (name + '.gz')
+    with gzip.open(str(path), 'wb', compresslevel=1) as gopen:
+        gopen.write(data)
+    return gzip.open(str(path), 'rt')
+
+
+OPENERS = {'stream': lambda tmp_path, data, name: open_stream(data),
+           'mapped': open_mapped, 'gzip': open_gzip}
+
+
+@pytest.mark.parametrize('wrap', [0, 60, 77])
+@pytest.mark.parametrize('opener', sorted(OPENERS))
+def test_fasta_round_trip(tmp_path, wrap, opener):
+    data, expected = make_fasta(wrap)
+    handle = OPENERS[opener](tmp_path, data, 'seqs.fa')
+    records = list(get_fastx_record(handle, 'fasta'))
+    assert [(r.id, r.description, r.seq) for r in records] == expected
+    assert [len(r) for r in records] == [len(e[2]) for e in expected]
+    assert b''.join(r.format('fasta', wrap) for r in records) == data
+
+
+@pytest.mark.parametrize('opener', sorted(OPENERS))
+def test_fastq_round_trip(tmp_path, opener):
+    data = make_fastq()
+    handle = OPENERS[opener](tmp_path, data, 'reads.fq')
+    records = list(get_fastx_record(handle, 'fastq'))
+    assert len(records) == 30000
+    assert b''.join(r.format('fastq') for r in records) == data
+
+
+@pytest.mark.parametrize('opener', sorted(OPENERS))
+def test_fastq_crlf_and_blank_lines(tmp_path, opener):
+    data = (b'@a x\r\nACGT\r\n+\r\nIIII\r\n\n'
+            b'@b\nGG\n+\n#!\n\n\n@c\nT\n+\nI')
+    handle = OPENERS[opener](tmp_path, data, 'reads.fq')
+    records = [(r.id, r.description, r.seq, r.qual)
+               for r in get_fastx_record(handle, 'fastq')]
+    assert records == [(b'a', b'a x', b'ACGT', b'IIII'),
+                       (b'b', b'b', b'GG', b'#!'),
+                       (b'c', b'c', b'T', b'I')]
+
+
+@pytest.mark.parametrize('opener', sorted(OPENERS))
+def test_fasta_text_before_first_header_is_skipped(tmp_path, opener):
+    data = b';comment\n\n>a\nAC\nGT\n>b empty\n>c\nN\n'
+    handle = OPENERS[opener](tmp_path, data, 'seqs.fa')
+    assert [(r.id, r.seq) for r in get_fastx_record(handle, 'fasta')] == [
+                              (b'a', b'ACGT'), (b'b', b''), (b'c', b'N')]
+
+
+def test_malformed_fastq_raises():
+    with pytest.raises(ValueError):
+        list(get_fastx_record(open_stream(b'@a\nAC\nGT\n+\nIIII\n'),
+                              'fastq'))
+
+
+@pytest.mark.parametrize('opener', sorted(OPENERS))
+def test_fastq_lengths_match_records(tmp_path, opener):
+    data = make_fastq(5000)
+    expected = [(r.description, len(r.seq)) for r in
+                get_fastx_record(open_stream(data), 'fastq')]
+    handle = OPENERS[opener](tmp_path, data, 'reads.fq')
+    assert list(get_fastq_length(handle)) == expected
+
+
+@pytest.mark.parametrize('opener', sorted(OPENERS))
+def test_fastq_lengths_of_crlf_and_unterminated_records(tmp_path, opener):
+    data = b'@a x\r\nACGT\r\n+\r\nIIII\r\n\n@b\nGG\n+\n#!\n\n@c\nT\n+\nI'
+    handle = OPENERS[opener](tmp_path, data, 'reads.fq')
+    assert list(get_fastq_length(handle)) == [(b'a x', 4), (b'b', 2),
+                                              (b'c', 1)]
+
+
+@pytest.mark.parametrize('opener', sorted(OPENERS))
+def test_fastq_lengths_reject_multi_line_records(tmp_path, opener):
+    handle = OPENERS[opener](tmp_path, b'@a\nAC\nGT\n+\nIIII\n', 'reads.fq')
+    with pytest.raises(ValueError):
+        list(get_fastq_length(handle))
+
+
+@pytest.mark.parametrize('opener', sorted(OPENERS))
+def test_fastq_crlf_blank_lines_are_skipped(tmp_path, opener):
+    data = (b'\r\n@a x\r\nACGT\r\n+\r\nIIII\r\n\r\n\r\n'
+            b'@b\r\nGG\r\n+\r\n#!\r\n\r\n')
+    handle = OPENERS[opener](tmp_path, data, 'reads.fq')
+    assert [(r.description, r.seq, r.qual) for r in
+            get_fastx_record(handle, 'fastq')] == [(b'a x', b'ACGT', b'IIII'),
+                                                   (b'b', b'GG', b'#!')]
+    handle = OPENERS[opener](tmp_path, data, 'reads.fq')
+    assert list(get_fastq_length(handle)) == [(b'a x', 4), (b'b', 2)]
+
+
+@pytest.mark.parametrize('opener', sorted(OPENERS))
+def test_truncated_fastq_raises(tmp_path, opener):
+    data = b'@a\nAC\n+\nII\n@b\nGG\n'
+    for parse in (lambda h: get_fastx_record(h, 'fastq'), get_fastq_length):
+        handle = OPENERS[opener](tmp_path, data, 'reads.fq')
+        with pytest.raises(ValueError, match='Truncated'):
+            list(parse(handle))
+
+
+def test_fastq_scanner_offsets():
+    data = b'\n@a x\r\nACG\r\n+\r\nIII\r\n@b\nT\n+\nI'
+    offsets = list(scan_fastq(data))
+    assert offsets == [(1, 6, 10, 14, 18, 20), (20, 22, 24, 26, 28, 29)]
+    assert [(data[e1 + 1:s2], data[e3 + 1:s4]) for _, e1, s2, e3, s4, _ in
+            offsets] == [(b'ACG', b'III'), (b'T', b'I')]
+    assert list(scan_fastq(data, final=False)) == offsets[:1]
+
+
+@pytest.mark.parametrize('size', [1000, 65536, READ_SIZE])
+def test_raw_fastq_blocks_cover_the_input(size):
+    data = make_fastq(5000)
+    blocks = []
+    records = 0
+    for block, ends in get_raw_fastq_blocks(open_stream(data), size):
+        blocks.append(block[:int(ends[-1])])
+        records += len(ends)
+    assert b''.join(blocks) == data
+    assert records == 5000
+
+
+def test_raw_fastq_blocks_add_a_missing_final_newline():
+    blocks = list(get_raw_fastq_blocks(open_stream(b'@a\nAC\n+\nII')))
+    assert [(block, ends.tolist()) for block, ends in blocks] == [
+                                          (b'@a\nAC\n+\nII\n', [11])]
+
+
+@pytest.mark.parametrize('data', [b'@a\nAC\nGT\n+\nIIII\n',
+                                  b'@a\nAC\n+\nII\n\n@b\nA\n+\nI\n',
+                                  b'@a\nAC\n+\nII\n@b\nA\n+\n'])
+def test_raw_fastq_blocks_reject_what_they_can_not_copy(data):
+    with pytest.raises(ValueError):
+        list(get_raw_fastq_blocks(open_stream(data)))
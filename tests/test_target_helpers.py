@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from sequencetools.helpers import target_helpers
+from sequencetools.helpers.file_helpers import load_targets_file
+from sequencetools.helpers.sequence_helpers import (FastxRecord,
+                                                    filter_by_id)
+from sequencetools.helpers.target_helpers import (BloomFilter, TargetSet,
+                                                  hash_ids)
+
+IDS = [b'read%d' % i for i in range(20000)]
+OTHERS = [b'other%d' % i for i in range(20000)]
+
+
+@pytest.fixture
+def length_hash(monkeypatch):
+    '''Makes every id of the same length share a hash'''
+    def hash_id(seq_id):
+        return len(seq_id)
+    monkeypatch.setattr(target_helpers, 'hash_id', hash_id)
+
+
+@pytest.mark.parametrize('bloom', [False, True])
+@pytest.mark.parametrize('exact', [False, True])
+def test_targets_found_and_misses_rejected(bloom, exact):
+    targets = TargetSet(IDS[::2], bloom, exact)
+    assert len(targets) == 10000
+    assert all(seq_id in targets for seq_id in IDS[::2][:500])
+    assert not any(seq_id in targets for seq_id in IDS[1::2][:500])
+    found = targets.contains_many(IDS)
+    assert found[::2].all() and not found[1::2].any()
+
+
+def test_repeated_ids_are_stored_once():
+    targets = TargetSet([b'a', b'b', b'a', b'a'], exact=True)
+    assert len(targets) == 2
+    assert targets.contains_many([b'a', b'b', b'c']).tolist() == [True, True,
+                                                                  False]
+
+
+def test_hash_only_matches_collisions(length_hash):
+    targets = TargetSet([b'r1'])
+    assert b'r2' in targets  # shares the hash of r1
+    assert targets.contains_many([b'r1', b'r2', b'r10']).tolist() == [
+                                                         True, True, False]
+
+
+def test_exact_drops_collisions(length_hash):
+    targets = TargetSet([b'r1', b'x9', b'r1'], exact=True)
+    assert len(targets) == 2  # both ids kept though the hashes are equal
+    assert b'r1' in targets and b'x9' in targets
+    assert b'r2' not in targets
+    assert targets.contains_many([b'r2', b'x9', b'r1', b'zz']).tolist() == [
+                                                   False, True, True, False]
+
+
+def test_bloom_filter_has_no_false_negatives():
+    hashes = hash_ids(IDS)
+    bloom = BloomFilter(len(hashes))
+    bloom.add(hashes)
+    assert bloom.contains(hashes).all()
+    false_positives = bloom.contains(hash_ids(OTHERS)).mean()
+    assert false_positives < 0.02  # sized for 1%
+
+
+def test_empty_target_set():
+    targets = TargetSet([], bloom=True)
+    assert len(targets) == 0
+    assert b'a' not in targets
+    assert not targets.contains_many([b'a', b'b']).any()
+
+
+def test_targets_file_skips_blank_and_comment_lines(tmp_path):
+    path = tmp_path / 'targets.txt'
+    path.write_bytes(b'# ids\nr1\n\nr3  \n')
+    targets = load_targets_file(str(path), exact=True)
+    assert targets.contains_many([b'r1', b'r2', b'r3']).tolist() == [
+                                                         True, False, True]
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_filter_by_id_across_batches(reverse):
+    records = [FastxRecord(seq_id, seq_id, b'A') for seq_id in IDS[:1000]]
+    targets = TargetSet(IDS[:1000:3])
+    kept = [r.id for r in filter_by_id(records, targets, reverse, batch=64)]
+    expected = [r.id for r in records if (r.id in targets) != reverse]
+    assert kept == expected
+    assert len(kept) == (666 if reverse else 334)
+
+
+def test_hash_ids_is_uint64():
+    hashes = hash_ids(IDS[:10])
+    assert hashes.dtype == np.uint64
+    assert len(set(hashes.tolist())) == 10